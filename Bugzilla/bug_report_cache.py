@@ -0,0 +1,169 @@
+# Local copy of the Bugzilla report (`report.csv`), fetched with conditional requests and kept typed
+
+import json
+import os
+import shutil
+from email.utils import formatdate
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+
+try:
+    import pyarrow
+except ImportError:     # Falls back to pickle if pyarrow is not available
+    pyarrow = None
+
+
+class BugReportCache:
+    '''
+    Local copy of a CSV report that is downloaded in full (such as the `report.csv` of
+    Bugzilla), along with a typed copy of its dataframe, so that a report that did not
+    change is neither downloaded nor parsed again:
+
+    cache = BugReportCache(uri, folder, column_names, dtypes=None)
+    df = cache.load()
+
+    The report is requested with `If-None-Match` and `If-Modified-Since` (from the `ETag`
+    and `Last-Modified` of the last download). If the server answers `304`, the typed copy
+    (Parquet if pyarrow is available, pickle otherwise) is read instead. Otherwise, the new
+    report replaces the former one, and it is parsed and stored again.
+
+    - uri: URL of the report (or path of a local file, which is compared by size and modification time).
+    - folder: folder of the cache (it keeps the raw report, its typed copy and `state.json`).
+    - column_names: names of the columns of the report (it has no header).
+    - dtypes: types of the columns, as in `df.astype`. The rest of the columns are strings.
+    '''
+
+    state_file_name = 'state.json'
+    report_file_name = 'report.csv'
+    frame_file_name = 'report'
+
+    def __init__(self, uri, folder, column_names, dtypes=None, timeout=60):
+        self.uri = uri
+        self.folder = folder
+        self.column_names = list(column_names)
+        self.dtypes = dict(dtypes or {})
+        self.timeout = timeout
+        os.makedirs(folder, exist_ok=True)
+
+        state_path = self._path(self.state_file_name)
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                self._state = json.load(f)
+        else:
+            self._state = {}
+
+        # Validators of another report are useless, and so is a typed copy parsed with other options
+        if self._state.get('uri') != uri:
+            self._state = {'uri': uri}
+        if self._state.get('parse_options') != self._parse_options():
+            self._state.pop('frame', None)
+
+    def _path(self, file_name):
+        return os.path.join(self.folder, file_name)
+
+    def _parse_options(self):
+        return {
+            'column_names': self.column_names,
+            'dtypes': {column: str(dtype) for column, dtype in self.dtypes.items()},
+        }
+
+    def _save_state(self):
+        state_path = self._path(self.state_file_name)
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(state_path + '.tmp', state_path)
+
+    @property
+    def last_status(self):
+        '''
+        Outcome of the last fetch: `'downloaded'`, `'not-modified'` or `None` (not fetched yet).
+        '''
+        return self._state.get('last_status')
+
+    def load(self):
+        '''
+        Pandas dataframe with the typed rows of the report, fetched (and parsed) again
+        only if it changed since the last load.
+        '''
+        modified = self._fetch()
+        if modified or not self._state.get('frame') or not os.path.exists(self._path(self._state['frame'])):
+            df = self._parse()
+            self._state['frame'] = self._write_frame(df)
+            self._state['parse_options'] = self._parse_options()
+            self._save_state()
+            return df
+        return self._read_frame(self._state['frame'])
+
+    # Fetch of the report
+
+    def _fetch(self):
+        # Whether the report was downloaded again (i.e., it is not the same as the local copy)
+        has_report = os.path.exists(self._path(self.report_file_name))
+        if urlsplit(self.uri).scheme in ['http', 'https']:
+            modified = self._fetch_from_http(has_report)
+        else:
+            modified = self._fetch_from_file(has_report)
+
+        self._state['last_status'] = 'downloaded' if modified else 'not-modified'
+        self._save_state()
+        return modified
+
+    def _fetch_from_file(self, has_report):
+        stat = os.stat(self.uri)
+        validator = f'{stat.st_size}-{stat.st_mtime_ns}'
+        if has_report and self._state.get('etag') == validator:
+            return False
+
+        shutil.copyfile(self.uri, self._path(self.report_file_name + '.tmp'))
+        os.replace(self._path(self.report_file_name + '.tmp'), self._path(self.report_file_name))
+        self._state.update({'etag': validator, 'last_modified': formatdate(stat.st_mtime, usegmt=True)})
+        return True
+
+    def _fetch_from_http(self, has_report):
+        headers = {}
+        if has_report:
+            if self._state.get('etag'):
+                headers['If-None-Match'] = self._state['etag']
+            if self._state.get('last_modified'):
+                headers['If-Modified-Since'] = self._state['last_modified']
+
+        with requests.get(self.uri, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and has_report:
+                return False
+            response.raise_for_status()
+
+            # The former report is kept until the new one is complete
+            with open(self._path(self.report_file_name + '.tmp'), 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            os.replace(self._path(self.report_file_name + '.tmp'), self._path(self.report_file_name))
+            self._state.update({'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')})
+        return True
+
+    # Typed copy of the report
+
+    def _parse(self):
+        return (
+            pd.read_csv(self._path(self.report_file_name), encoding='utf-8', header=None, names=self.column_names)
+            .astype(self.dtypes)
+        )
+
+    def _write_frame(self, df):
+        file_name = self.frame_file_name + ('.parquet' if pyarrow else '.pkl')
+        path = self._path(file_name)
+        if pyarrow:
+            df.to_parquet(path + '.tmp')
+        else:
+            df.to_pickle(path + '.tmp', compression=None)
+        os.replace(path + '.tmp', path)
+        return file_name
+
+    def _read_frame(self, file_name):
+        path = self._path(file_name)
+        if file_name.endswith('.parquet'):
+            if pyarrow is None:
+                raise RuntimeError(f'pyarrow is needed to read "{path}"')
+            return pd.read_parquet(path)
+        return pd.read_pickle(path, compression=None)
@@ -0,0 +1,173 @@
+# Persisted monthly snapshots of the state of each bug, updated incrementally
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:     # Falls back to pickle if pyarrow is not available
+    pyarrow = None
+
+
+class MonthlyBugSnapshots:
+    '''
+    On-disk store of the monthly samples of the state of each bug (e.g., the rows of
+    `get_monthly_time_samples_per_bug`), so that only the samples of the bugs with new (or
+    modified) events, and those of the new months, are computed again:
+
+    snapshots = MonthlyBugSnapshots(folder)
+    df_samples = snapshots.update(df_events, compute, cutoff, carried_columns=[])
+
+    - df_events: events of the bugs, in chronological order, with (at least) the columns
+    `BUG_ID` and `MONTH`.
+    - compute: function `compute(df_events, all_months)` that returns the samples (rows with the
+    columns `BUG_ID` and `MONTH`) of some events on the grid of months `all_months`. The samples of
+    a bug in a month may only depend on its own events up to that month.
+    - cutoff: only the samples of months before it (i.e., complete months) are stored.
+    - carried_columns: columns whose last known value is carried over to the later months by
+    `compute` (e.g., with `ffill`), so that the samples of a bug can be extended from a single month.
+
+    Bugs are compared with a fingerprint of their events in the stored months, so any change in
+    them recomputes all their samples, while new events only compute the samples of the later months.
+    The samples are returned in the same order as `compute(df_events, all_months)`, with a new index.
+    '''
+
+    state_file_name = 'state.json'
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+        state_path = self._path(self.state_file_name)
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                self._state = json.load(f)
+        else:
+            self._state = None
+
+    def _path(self, file_name):
+        return os.path.join(self.folder, file_name)
+
+    def _write_frame(self, df, name):
+        file_name = name + ('.parquet' if pyarrow else '.pkl')
+        path = self._path(file_name)
+        if pyarrow:
+            df.to_parquet(path + '.tmp')
+        else:
+            df.to_pickle(path + '.tmp', compression=None)
+        os.replace(path + '.tmp', path)
+        return file_name
+
+    def _read_frame(self, file_name):
+        path = self._path(file_name)
+        if file_name.endswith('.parquet'):
+            if pyarrow is None:
+                raise RuntimeError(f'pyarrow is needed to read "{path}"')
+            return pd.read_parquet(path)
+        return pd.read_pickle(path, compression=None)
+
+    @staticmethod
+    def _fingerprints(df_events):
+        # Hash of all the events of each bug (and of their order)
+        row_hashes = pd.util.hash_pandas_object(df_events, index=False).to_numpy()
+        positions = df_events.groupby('BUG_ID', sort=False).cumcount().to_numpy(dtype='uint64')
+        hashes = pd.util.hash_array(row_hashes ^ (positions * np.uint64(0x9E3779B97F4A7C15)))
+        return pd.Series(hashes, index=df_events.BUG_ID.to_numpy()).groupby(level=0).sum()
+
+    def _load(self, all_months):
+        # Stored samples and fingerprints, as long as the stored months are still the same
+        if self._state is None:
+            return None
+        stored_months = pd.to_datetime(self._state['months'])
+        last_month = pd.Timestamp(self._state['last_month']) if self._state['last_month'] else None
+        months = pd.DatetimeIndex(all_months)
+        if last_month is None or not months[months <= last_month].sort_values().equals(stored_months.sort_values()):
+            return None
+
+        df_stored = self._read_frame(self._state['samples'])
+        fingerprints = self._read_frame(self._state['fingerprints']).set_index('BUG_ID').FINGERPRINT
+        return df_stored, fingerprints, last_month
+
+    def update(self, df_events, compute, cutoff, carried_columns=()):
+        '''
+        Returns the samples of all the events, computing again only those of the new or
+        modified bugs and of the months after the stored ones, and stores the samples of
+        the complete months (i.e., before `cutoff`).
+        '''
+        all_months = df_events['MONTH'].unique()
+        stored = self._load(all_months)
+
+        if stored is None:
+            df_samples = compute(df_events, all_months).reset_index(drop=True)
+            self._save(df_samples, df_events, all_months, cutoff)
+            return df_samples
+
+        # Bugs whose events in the stored months did not change only need their samples of the later months
+        df_stored, stored_fingerprints, last_month = stored
+        fingerprints = self._fingerprints(df_events.loc[df_events.MONTH <= last_month])
+        fingerprints, stored_fingerprints = fingerprints.align(stored_fingerprints)
+        touched = fingerprints.index[fingerprints.ne(stored_fingerprints)]
+        is_touched = df_events.BUG_ID.isin(touched)
+
+        frames = []
+        if is_touched.any():
+            frames.append(compute(df_events.loc[is_touched], all_months))
+
+        # Samples of the later months follow from the last known state of each bug (i.e., its last
+        # event, with the last known values of the carried columns), as if it were an event of the
+        # last stored month
+        df_former = df_events.loc[~is_touched & (df_events.MONTH <= last_month)]
+        df_seeds = df_former.groupby('BUG_ID', sort=False).tail(1).assign(MONTH=last_month)
+        last_values = df_former.groupby('BUG_ID', sort=False)[list(carried_columns)].last()
+        for column in carried_columns:
+            df_seeds[column] = last_values[column].reindex(df_seeds.BUG_ID).set_axis(df_seeds.index)
+
+        df_later = pd.concat([df_seeds, df_events.loc[~is_touched & (df_events.MONTH > last_month)]])
+        if len(df_later):
+            df_later_samples = compute(df_later, [month for month in all_months if month >= last_month])
+            frames.append(df_later_samples.loc[df_later_samples.MONTH > last_month])
+
+        # Categories of the stored samples may be outdated
+        df_stored = df_stored.loc[~df_stored.BUG_ID.isin(touched)]
+        for column in df_stored.columns:
+            dtypes = [df[column].dtype for df in frames if column in df.columns]
+            if dtypes and isinstance(dtypes[0], pd.CategoricalDtype) and dtypes[0] != df_stored[column].dtype:
+                df_stored = df_stored.assign(**{column: df_stored[column].astype(dtypes[0])})
+
+        # Samples are sorted as `compute` does: by the first appearance of each bug, and by month
+        df_samples = pd.concat([df_stored] + frames, ignore_index=True)
+        bug_order = pd.Index(df_events.BUG_ID.unique()).get_indexer(df_samples.BUG_ID)
+        df_samples = df_samples.take(np.lexsort((df_samples.MONTH.to_numpy(), bug_order))).reset_index(drop=True)
+
+        # The store only changes with new complete months, or with changes in the stored ones
+        if len(touched) or pd.Timestamp(max(month for month in all_months if month < cutoff)) != last_month:
+            self._save(df_samples, df_events, all_months, cutoff)
+        return df_samples
+
+    def _save(self, df_samples, df_events, all_months, cutoff):
+        months = pd.DatetimeIndex(all_months)
+        complete_months = months[months < cutoff].sort_values()
+        last_month = complete_months[-1] if len(complete_months) else None
+        fingerprints = self._fingerprints(df_events.loc[df_events.MONTH < cutoff])
+
+        # Files are never overwritten, so the former ones are valid until the new state is saved
+        former_state = self._state or {}
+        generation = former_state.get('generation', 0) + 1
+        self._state = {
+            'generation': generation,
+            'months': [month.isoformat() for month in complete_months],
+            'last_month': last_month.isoformat() if last_month is not None else None,
+            'samples': self._write_frame(df_samples.loc[df_samples.MONTH < cutoff].reset_index(drop=True), f'samples-{generation}'),
+            'fingerprints': self._write_frame(fingerprints.rename('FINGERPRINT').rename_axis('BUG_ID').reset_index(), f'fingerprints-{generation}'),
+        }
+        state_path = self._path(self.state_file_name)
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(state_path + '.tmp', state_path)
+
+        for key in ['samples', 'fingerprints']:
+            if former_state.get(key) and os.path.exists(self._path(former_state[key])):
+                os.remove(self._path(former_state[key]))
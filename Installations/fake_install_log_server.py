@@ -0,0 +1,110 @@
+# Local stand-in of the HTTP server of the installation log, with support of ranges and conditional requests
+
+import hashlib
+import os
+import re
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeInstallLogServer:
+    '''
+    Minimal HTTP server that serves a local file (e.g., a copy of `install-log.csv`) as
+    a static web server would: with `Last-Modified` and `ETag` headers, answering `304`
+    to conditional requests (`If-Modified-Since`, `If-None-Match`) and `206` (or `416`)
+    to requests with a single byte `Range`. It runs in a background thread:
+
+    with FakeInstallLogServer(path) as fake_server:
+        mirror = InstallLogMirror(fake_server.url, folder, column_names)
+
+    - path: file that is served. It may be modified (e.g., appending lines) while the server is running.
+    - support_ranges: if unset, ranges are ignored (i.e., the full file is always returned), as some servers do.
+    '''
+
+    def __init__(self, path, support_ranges=True, host='127.0.0.1', port=0):
+        self.path = path
+        self.support_ranges = support_ranges
+        self.requests = []
+        self.sent_bytes = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/{os.path.basename(self.path)}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, body=b'', headers=None):
+                self.send_response(code)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                with fake_server._lock:
+                    fake_server.sent_bytes += len(body)
+
+            def _not_modified(self, last_modified, etag):
+                if self.headers.get('If-None-Match'):
+                    return self.headers['If-None-Match'] == etag
+                if self.headers.get('If-Modified-Since'):
+                    try:
+                        return int(parsedate_to_datetime(self.headers['If-Modified-Since']).timestamp()) >= int(last_modified)
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def do_GET(self):
+                with fake_server._lock:
+                    fake_server.requests.append({'range': self.headers.get('Range'), 'if_modified_since': self.headers.get('If-Modified-Since')})
+
+                if self.path.split('?')[0] != '/' + os.path.basename(fake_server.path):
+                    return self._send(404)
+                with open(fake_server.path, 'rb') as f:
+                    content = f.read()
+                last_modified = os.path.getmtime(fake_server.path)
+                etag = '"{}"'.format(hashlib.sha1(content).hexdigest()[:16])
+                headers = {'Last-Modified': formatdate(last_modified, usegmt=True), 'ETag': etag, 'Accept-Ranges': 'bytes'}
+
+                if self._not_modified(last_modified, etag):
+                    return self._send(304, headers=headers)
+
+                byte_range = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+                if not (byte_range and fake_server.support_ranges):
+                    return self._send(200, content, headers=headers)
+
+                start = int(byte_range[1])
+                end = min(int(byte_range[2]), len(content) - 1) if byte_range[2] else len(content) - 1
+                if start >= len(content):
+                    return self._send(416, headers={**headers, 'Content-Range': f'bytes */{len(content)}'})
+                return self._send(206, content[start:end + 1], headers={**headers, 'Content-Range': f'bytes {start}-{end}/{len(content)}'})
+
+        return Handler
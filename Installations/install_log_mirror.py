@@ -0,0 +1,315 @@
+# Local mirror of an append-only CSV log (e.g., the log of OSM installations), updated incrementally
+
+import io
+import json
+import os
+import shutil
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+
+try:
+    import pyarrow
+except ImportError:     # Falls back to pickle if pyarrow is not available
+    pyarrow = None
+
+
+class InstallLogMirror:
+    '''
+    Local mirror of a remote CSV log that only grows by appending lines (such as
+    `install-log.csv`), so that each update only downloads and parses the new bytes:
+
+    mirror = InstallLogMirror(uri, folder, column_names, skip_lines=0, sep=';', on_bad_lines='skip')
+    mirror.update()
+    df = mirror.load()
+
+    The new bytes are requested with a `Range` header (along with `If-Modified-Since`, so
+    that nothing is downloaded if the log did not change). The last bytes already mirrored
+    are requested again and compared, so that a log that was rotated or rewritten is
+    detected and mirrored again from scratch. Only complete lines are parsed, in chunks of
+    `chunk_bytes`, and each chunk is appended to the store as a typed part (Parquet if
+    pyarrow is available, pickle otherwise).
+
+    - uri: URL of the log (or path of a local file).
+    - folder: folder of the mirror (it keeps the raw log, the parsed parts and `state.json`).
+    - column_names: names of the columns of the log.
+    - skip_lines: number of lines at the beginning of the log that are not parsed (e.g., the header).
+    - sep, on_bad_lines: as in `pd.read_csv`. All the columns are parsed as strings.
+    '''
+
+    state_file_name = 'state.json'
+    log_file_name = 'log.csv'
+    parts_folder_name = 'parts'
+
+    # Bytes already mirrored that are downloaded again to check that the log was only appended
+    overlap_bytes = 4096
+
+    def __init__(self, uri, folder, column_names, skip_lines=0, sep=';', on_bad_lines='skip',
+                 chunk_bytes=16 * 1024 * 1024, max_parts=64, timeout=60):
+        self.uri = uri
+        self.folder = folder
+        self.column_names = list(column_names)
+        self.skip_lines = skip_lines
+        self.sep = sep
+        self.on_bad_lines = on_bad_lines
+        self.chunk_bytes = chunk_bytes
+        self.max_parts = max_parts
+        self.timeout = timeout
+        os.makedirs(self._path(self.parts_folder_name), exist_ok=True)
+
+        state_path = self._path(self.state_file_name)
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                self._state = json.load(f)
+        else:
+            self._state = {}
+
+        # The parts are parsed again (from the raw log) if the log or the parsing options are different
+        if self._state.get('uri') != uri:
+            self._reset(keep_log=False)
+        elif self._state.get('parse_options') != self._parse_options():
+            self._reset(keep_log=True)
+
+    def _path(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def _parse_options(self):
+        return {
+            'column_names': self.column_names,
+            'skip_lines': self.skip_lines,
+            'sep': self.sep,
+            'on_bad_lines': self.on_bad_lines,
+        }
+
+    def _save_state(self):
+        state_path = self._path(self.state_file_name)
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(state_path + '.tmp', state_path)
+
+    def _reset(self, keep_log):
+        # Drops the parsed parts (and, unless `keep_log` is set, the raw log as well)
+        shutil.rmtree(self._path(self.parts_folder_name), ignore_errors=True)
+        os.makedirs(self._path(self.parts_folder_name))
+        state = {
+            'uri': self.uri,
+            'parse_options': self._parse_options(),
+            'parsed_bytes': 0,
+            'skipped_lines': 0,
+            'parts': [],
+        }
+        if keep_log and os.path.exists(self._path(self.log_file_name)):
+            state.update({k: self._state[k] for k in ['size', 'last_modified', 'etag'] if k in self._state})
+        else:
+            with open(self._path(self.log_file_name), 'wb'):
+                pass
+            state['size'] = 0
+        self._state = state
+        self._save_state()
+
+    @property
+    def size(self):
+        '''
+        Number of bytes of the log that are mirrored.
+        '''
+        return self._state['size']
+
+    @property
+    def parsed_bytes(self):
+        '''
+        Number of bytes of the mirrored log that are parsed (i.e., up to the last complete line).
+        '''
+        return self._state['parsed_bytes']
+
+    def update(self):
+        '''
+        Downloads the bytes appended to the log since the last update, and parses its new
+        complete lines. Returns the number of new rows.
+        '''
+        self._download()
+        return self._parse()
+
+    # Download of the log
+
+    def _download(self):
+        if urlsplit(self.uri).scheme in ['http', 'https']:
+            self._download_from_http()
+        else:
+            self._download_from_file()
+
+    def _matches_mirror(self, offset, data):
+        # Whether some bytes match those of the mirrored log at the same offset
+        with open(self._path(self.log_file_name), 'rb') as f:
+            f.seek(offset)
+            return f.read(len(data)) == data
+
+    def _append_to_mirror(self, chunks):
+        with open(self._path(self.log_file_name), 'ab') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            self._state['size'] = f.tell()
+
+    def _download_from_file(self):
+        size = os.path.getsize(self.uri)
+        with open(self.uri, 'rb') as f:
+            overlap_start = max(0, self.size - self.overlap_bytes)
+            f.seek(overlap_start)
+            if size < self.size or not self._matches_mirror(overlap_start, f.read(self.size - overlap_start)):
+                self._reset(keep_log=False)
+                f.seek(0)
+            self._append_to_mirror(iter(lambda: f.read(self.chunk_bytes), b''))
+        self._save_state()
+
+    def _download_from_http(self, retry=True):
+        # Ranges refer to the raw bytes of the log, so it must not be compressed by the server
+        headers = {'Accept-Encoding': 'identity'}
+        overlap_start = max(0, self.size - self.overlap_bytes)
+        if self.size:
+            headers['Range'] = f'bytes={overlap_start}-'
+            if self._state.get('last_modified'):
+                headers['If-Modified-Since'] = self._state['last_modified']
+            if self._state.get('etag'):
+                headers['If-None-Match'] = self._state['etag']
+
+        with requests.get(self.uri, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                return
+            if response.status_code == 416:
+                # The range starts beyond the end of the log, so it was truncated
+                self._reset(keep_log=False)
+                return self._download_from_http(retry=False) if retry else None
+            response.raise_for_status()
+
+            # A full response (e.g., from a server that ignores ranges) starts at the beginning of the log
+            start = 0
+            if response.status_code == 206:
+                start = int(response.headers['Content-Range'].split()[1].split('-')[0])
+            chunks = response.iter_content(chunk_size=1024 * 1024)
+
+            # The bytes already mirrored must be the same, or the log was rewritten
+            overlap = bytearray()
+            while len(overlap) < self.size - start:
+                chunk = next(chunks, b'')
+                if not chunk:
+                    break
+                overlap += chunk
+            mirrored = bytes(overlap[:self.size - start])
+            if start > self.size or not self._matches_mirror(start, mirrored) or len(mirrored) < self.size - start:
+                self._reset(keep_log=False)
+                if start > 0:
+                    return self._download_from_http(retry=False) if retry else None
+                mirrored = b''
+
+            self._append_to_mirror([bytes(overlap[len(mirrored):])] + [chunk for chunk in chunks])
+            self._state['last_modified'] = response.headers.get('Last-Modified')
+            self._state['etag'] = response.headers.get('ETag')
+        self._save_state()
+
+    # Parsing of the log
+
+    def _part_extension(self):
+        return '.parquet' if pyarrow else '.pkl'
+
+    def _skip_lines(self, f):
+        # Skips the first lines of the log, as long as all of them are complete
+        f.seek(self.parsed_bytes)
+        while self._state['skipped_lines'] < self.skip_lines:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                return False
+            self._state['parsed_bytes'] += len(line)
+            self._state['skipped_lines'] += 1
+            self._save_state()
+        return True
+
+    def _read_complete_lines(self, f):
+        # Reads a chunk of complete lines (it may exceed `chunk_bytes` to complete the last one)
+        data = f.read(self.chunk_bytes)
+        end = data.rfind(b'\n')
+        while end < 0 and data:
+            more = f.read(self.chunk_bytes)
+            if not more:
+                return b''
+            end = more.rfind(b'\n')
+            end = len(data) + end if end >= 0 else -1
+            data += more
+        return data[:end + 1]
+
+    def _parse_chunk(self, data):
+        # A first row with an extra field would be taken as an index, instead of as a bad line, so
+        # the chunk starts with a well-formed row (the names of the columns) that is dropped afterwards
+        first_row = (self.sep.join(self.column_names) + '\n').encode('utf-8')
+        df = pd.read_csv(
+            io.BytesIO(first_row + data),
+            sep=self.sep,
+            header=None,
+            names=self.column_names,
+            dtype=str,
+            on_bad_lines=self.on_bad_lines
+        )
+        return df.iloc[1:].reset_index(drop=True)
+
+    def _write_part(self, df, start, end):
+        file_name = f'part-{start:015d}-{end:015d}{self._part_extension()}'
+        path = self._path(self.parts_folder_name, file_name)
+        if pyarrow:
+            df.to_parquet(path + '.tmp', index=False)
+        else:
+            df.to_pickle(path + '.tmp', compression=None)
+        os.replace(path + '.tmp', path)
+        return file_name
+
+    def _read_part(self, file_name):
+        path = self._path(self.parts_folder_name, file_name)
+        if file_name.endswith('.parquet'):
+            if pyarrow is None:
+                raise RuntimeError(f'pyarrow is needed to read "{path}"')
+            return pd.read_parquet(path)
+        return pd.read_pickle(path, compression=None)
+
+    def _parse(self):
+        new_rows = 0
+        with open(self._path(self.log_file_name), 'rb') as f:
+            if not self._skip_lines(f):
+                return 0
+
+            while True:
+                f.seek(self.parsed_bytes)
+                data = self._read_complete_lines(f)
+                if not data:
+                    break
+                start = self.parsed_bytes
+                df = self._parse_chunk(data)
+                self._state['parts'].append(self._write_part(df, start, start + len(data)))
+                self._state['parsed_bytes'] += len(data)
+                self._save_state()
+                new_rows += len(df)
+
+        if len(self._state['parts']) > self.max_parts:
+            self.compact()
+        return new_rows
+
+    def compact(self):
+        '''
+        Merges all the parsed parts into a single one.
+        '''
+        parts = self._state['parts']
+        if len(parts) < 2:
+            return
+        start = int(parts[0].split('-')[1])
+        file_name = self._write_part(self.load(), start, self.parsed_bytes)
+        self._state['parts'] = [file_name]
+        self._save_state()
+        for former_file_name in parts:
+            if former_file_name != file_name:
+                os.remove(self._path(self.parts_folder_name, former_file_name))
+
+    def load(self):
+        '''
+        Pandas dataframe with all the parsed rows of the log, in their original order.
+        '''
+        if not self._state['parts']:
+            return pd.DataFrame({column: pd.Series(dtype='object') for column in self.column_names})
+        return pd.concat([self._read_part(file_name) for file_name in self._state['parts']], ignore_index=True)
@@ -0,0 +1,76 @@
+# Parsing of the queries of the installation events (`&key1=value1&key2=value2...`) into columns
+
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.compute
+except ImportError:     # Falls back to Python regular expressions if pyarrow is not available
+    pyarrow = None
+
+
+# Keys of the queries sent by the installer, in their usual order
+QUERY_KEYS = ['installation_id', 'local_ts', 'event', 'operation', 'value', 'comment', 'tags']
+
+
+def _query_pattern(keys):
+    # Each key is optional, but they must be in order. As in former versions of the parser, a value
+    # ends at the first `=` (bogus extra `=` are tolerated, but discarded) or `&`
+    return '^' + ''.join(f'(?:&{re.escape(key)}(?:=(?P<{key}>[^&=]*)[^&]*)?)?' for key in keys) + '$'
+
+
+def _none_if_empty(values):
+    values = np.array(values, dtype='object')
+    values[pd.isna(values) | (values == '')] = None
+    return values
+
+
+def _parse_with_pyarrow(queries, keys):
+    # Native (RE2) regular expressions. Non-matching (or missing) queries are null, and so are their fields
+    matches = pyarrow.compute.extract_regex(pyarrow.array(queries, type=pyarrow.string(), from_pandas=True), _query_pattern(keys))
+    fields = {key: matches.field(key).to_numpy(zero_copy_only=False) for key in keys}
+    return fields, matches.is_valid().to_numpy(zero_copy_only=False)
+
+
+def _parse_with_re(queries, keys):
+    pattern = re.compile(_query_pattern(keys))
+    matches = [pattern.match(query) if isinstance(query, str) else None for query in queries]
+    rows = [match.groups() if match else (None,) * len(keys) for match in matches]
+    fields = dict(zip(keys, np.array(rows, dtype='object').reshape(-1, len(keys)).T))
+    return fields, np.array([match is not None for match in matches], dtype='bool')
+
+
+def parse_queries(queries, keys=QUERY_KEYS, categorical=None):
+    '''
+    Parses the queries of the installation events (e.g., `&installation_id=...&event=...`)
+    into a Pandas dataframe with a column per key, in a single pass of a regular expression
+    (native, if pyarrow is available). Empty or missing values are `None`. Returns the
+    dataframe and a boolean series that flags the malformed queries:
+
+    def parse_queries(queries, keys=QUERY_KEYS, categorical=None)
+
+    - queries: Pandas series of queries. The dataframe keeps its index.
+    - keys: keys of the queries. Well-formed queries have (some of) them in this order, and no other key.
+    - categorical: if set, list of keys whose columns are converted into (unordered) categoricals.
+
+    Malformed queries (i.e., with unknown keys, or with keys out of order) are parsed again,
+    looking for each key anywhere in the query, so they only slow down the rows that need it.
+    Missing queries are flagged as malformed, and all their values are `None`.
+    '''
+    queries = pd.Series(queries)
+    fields, well_formed = (_parse_with_pyarrow if pyarrow else _parse_with_re)(queries.to_numpy(dtype='object'), keys)
+    df_queries = pd.DataFrame({key: _none_if_empty(fields[key]) for key in keys}, index=queries.index)
+
+    malformed = pd.Series(~well_formed, index=queries.index)
+    malformed_queries = queries.loc[malformed].dropna()
+    for key in keys:
+        values = malformed_queries.str.extract(f'(?:^|&){re.escape(key)}=([^&=]*)', expand=False)
+        df_queries.loc[malformed_queries.index, key] = _none_if_empty(values)
+
+    for key in categorical or []:
+        df_queries[key] = df_queries[key].astype('category')
+
+    return df_queries, malformed
@@ -15,8 +15,10 @@ import getpass
 from jenkins_lib import *
 from robot_lib import *
 from jenkins_robot_etl import *
+from parquet_snapshot import *
+from etl_metrics import metrics
 import json
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 
 # %% [markdown]
 # 0. Input parameters
@@ -32,6 +34,31 @@ table_known_builds = 'builds_info'
 table_robot_reports = 'robot_reports'
 table_robot_reports_extended = 'robot_reports_extended'
 dump_all_as_spreadsheets = False
+fetch_workers = 1
+max_in_flight = None
+spool_reports = False
+write_mode = 'incremental'
+use_report_cache = False
+report_cache_folder = None
+report_cache_max_mb = None
+etl_mode = 'update'
+bulk_load = False
+bulk_load_chunk_size = 100000
+details_schema = 'flat'
+parquet_snapshot_folder = None
+checkpoint_builds = None
+checkpoint_rows = None
+parse_workers = 0
+metrics_file = None
+daily_summaries = True
+table_builds_daily_summary = 'builds_daily_summary'
+table_suites_daily_summary = 'suites_daily_summary'
+table_status_runs = 'status_runs'
+keyword_depth = None
+failure_index = True
+table_failure_signatures = 'failure_signatures'
+table_failure_occurrences = 'failure_occurrences'
+pushgateway_url = None
 
 # %% [markdown]
 # Tries to bulk load credentials and other environment variables from .env file:
@@ -42,9 +69,15 @@ load_dotenv();
 
 
 # %%
+# Mode of operation: 'update' (from Jenkins) or 'reprocess-from-cache' (from the local cache of reports, without Jenkins)
+etl_mode = os.environ.get('ETL_MODE', None) or etl_mode
+if etl_mode not in ['update', 'reprocess-from-cache']:
+    raise ValueError(f'Unknown ETL mode: {etl_mode}')
+
 # Retrieves Jenkins credentials from environment, if applicable
-username = os.environ.get('JENKINS_USER', None) or input('Username: ')
-password = os.environ.get('JENKINS_PASS', None) or getpass.getpass()
+if etl_mode == 'update':
+    username = os.environ.get('JENKINS_USER', None) or input('Username: ')
+    password = os.environ.get('JENKINS_PASS', None) or getpass.getpass()
 
 # Other environment variables
 url_jenkins_server = os.environ.get('URL_JENKINS_SERVER', None) or url_jenkins_server
@@ -55,6 +88,31 @@ input_robot_file = os.environ.get('INPUT_ROBOT_FILE', None) or input_robot_file
 table_known_builds = os.environ.get('TABLE_KNOWN_BUILDS', None) or table_known_builds
 table_robot_reports = os.environ.get('TABLE_ROBOT_REPORTS', None) or table_robot_reports
 table_robot_reports_extended = os.environ.get('TABLE_ROBOT_REPORTS_EXTENDED', None) or table_robot_reports_extended
+fetch_workers = int(os.environ.get('JENKINS_FETCH_WORKERS', None) or fetch_workers)
+max_in_flight = int(os.environ.get('JENKINS_MAX_IN_FLIGHT', None) or max_in_flight or fetch_workers)
+spool_reports = (os.environ.get('SPOOL_ROBOT_REPORTS', None) or str(spool_reports)).lower() in ['yes', 'true']
+write_mode = os.environ.get('BUILDS_INFO_WRITE_MODE', None) or write_mode
+use_report_cache = (os.environ.get('REPORT_CACHE', None) or str(use_report_cache)).lower() in ['yes', 'true'] or etl_mode == 'reprocess-from-cache'
+report_cache_folder = os.environ.get('REPORT_CACHE_FOLDER', None) or report_cache_folder or os.path.join(inputs_folder, 'report_cache')
+report_cache_max_mb = float(os.environ.get('REPORT_CACHE_MAX_MB', None) or report_cache_max_mb or 0) or None
+bulk_load = (os.environ.get('BULK_LOAD', None) or str(bulk_load)).lower() in ['yes', 'true']
+bulk_load_chunk_size = int(os.environ.get('BULK_LOAD_CHUNK_SIZE', None) or bulk_load_chunk_size)
+details_schema = os.environ.get('ROBOT_REPORTS_EXTENDED_SCHEMA', None) or details_schema
+parquet_snapshot_folder = os.environ.get('PARQUET_SNAPSHOT_FOLDER', None) or parquet_snapshot_folder
+checkpoint_builds = int(os.environ.get('CHECKPOINT_BUILDS', None) or checkpoint_builds or 0) or None
+checkpoint_rows = int(os.environ.get('CHECKPOINT_ROWS', None) or checkpoint_rows or 0) or None
+parse_workers = int(os.environ.get('PARSE_WORKERS', None) or parse_workers)
+metrics_file = os.environ.get('ETL_METRICS_FILE', None) or metrics_file or os.path.join(outputs_folder, 'etl_metrics.json')
+pushgateway_url = os.environ.get('PUSHGATEWAY_URL', None) or pushgateway_url
+daily_summaries = (os.environ.get('DAILY_SUMMARIES', None) or str(daily_summaries)).lower() in ['yes', 'true']
+table_builds_daily_summary = os.environ.get('TABLE_BUILDS_DAILY_SUMMARY', None) or table_builds_daily_summary
+table_suites_daily_summary = os.environ.get('TABLE_SUITES_DAILY_SUMMARY', None) or table_suites_daily_summary
+table_status_runs = os.environ.get('TABLE_STATUS_RUNS', None) or table_status_runs
+keyword_depth = os.environ.get('KEYWORD_DEPTH', None) or keyword_depth
+keyword_depth = int(keyword_depth) if keyword_depth is not None else None
+failure_index = (os.environ.get('FAILURE_INDEX', None) or str(failure_index)).lower() in ['yes', 'true']
+table_failure_signatures = os.environ.get('TABLE_FAILURE_SIGNATURES', None) or table_failure_signatures
+table_failure_occurrences = os.environ.get('TABLE_FAILURE_OCCURRENCES', None) or table_failure_occurrences
 
 # %% [markdown]
 # 2. Populates the database with all builds from a set of relevant jobs
@@ -79,21 +137,78 @@ relevant_jobs = [job_ids_prefix + job_id for job_id in job_ids]
 
 
 # %%
-# Connection to the Jenkins server
-server = jenkins.Jenkins(
-    url_jenkins_server,
-    username=username,
-    password=password
-)
+# Connection to the Jenkins server (not needed when reprocessing from the cache)
+server = None
+if etl_mode == 'update':
+    server = jenkins.Jenkins(
+        url_jenkins_server,
+        username=username,
+        password=password
+    )
+
+    # Several builds may be retrieved at the same time, sharing the same pool of connections
+    if fetch_workers > 1:
+        setup_connection_pool(server, pool_size=fetch_workers, max_in_flight=max_in_flight)
 #------------------------------
 
+# Local cache of raw Robot reports, if enabled
+report_cache = None
+if use_report_cache:
+    report_cache = RobotReportCache(
+        report_cache_folder,
+        max_bytes=int(report_cache_max_mb * 1024 * 1024) if report_cache_max_mb else None
+    )
+
 # %%
-# Database setup
-engine = create_engine(database_uri)
+# Database setup (bulk loads need some extra settings of the connection)
+if bulk_load:
+    engine = create_bulk_load_engine(database_uri)
+else:
+    engine = create_engine(database_uri)
+
+# The first time the Parquet snapshot is enabled, it is bootstrapped with the content of the database
+if parquet_snapshot_folder and not os.path.isdir(parquet_snapshot_folder):
+    if inspect(engine).has_table(table_known_builds):
+        print(f'Exporting database to Parquet snapshot in "{parquet_snapshot_folder}"...')
+        export_database_to_parquet_snapshot(
+            engine,
+            parquet_snapshot_folder,
+            table_known_builds=table_known_builds,
+            table_robot_reports=table_robot_reports,
+            table_robot_reports_extended=table_robot_reports_extended
+        )
+
+# The first time the daily summary tables are enabled, they are computed for all the days already in the database
+if daily_summaries and not (inspect(engine).has_table(table_builds_daily_summary) and inspect(engine).has_table(table_status_runs)):
+    if inspect(engine).has_table(table_known_builds):
+        print('Computing daily summaries of the builds in the database...')
+        rebuild_daily_summaries(
+            engine,
+            table_known_builds=table_known_builds,
+            table_robot_reports=table_robot_reports,
+            table_builds_daily_summary=table_builds_daily_summary,
+            table_suites_daily_summary=table_suites_daily_summary,
+            table_status_runs=table_status_runs
+        )
+
+# The first time the failure-signature index is enabled, it is computed for all the builds already in the database
+if failure_index and not inspect(engine).has_table(table_failure_signatures):
+    if inspect(engine).has_table(table_known_builds):
+        print('Indexing failures of the builds in the database...')
+        rebuild_failure_index(
+            engine,
+            table_known_builds=table_known_builds,
+            table_robot_reports=table_robot_reports,
+            table_failure_signatures=table_failure_signatures,
+            table_failure_occurrences=table_failure_occurrences
+        )
 
 
 # %%
-print(f"Getting new builds from: {', '.join(relevant_jobs)}")
+if etl_mode == 'reprocess-from-cache':
+    print(f"Reprocessing cached builds from: {', '.join(relevant_jobs)}")
+else:
+    print(f"Getting new builds from: {', '.join(relevant_jobs)}")
 for job in relevant_jobs:
     ingest_update_all_jenkins_job(
         jenkins_server=server,
@@ -105,7 +220,35 @@ for job in relevant_jobs:
         ),
         table_known_builds=table_known_builds,
         table_robot_reports=table_robot_reports,
-        table_robot_reports_extended=table_robot_reports_extended
+        table_robot_reports_extended=table_robot_reports_extended,
+        fetch_workers=fetch_workers,
+        spool_reports=spool_reports,
+        write_mode=write_mode,
+        report_cache=report_cache,
+        reprocess_cached_builds=(etl_mode == 'reprocess-from-cache'),
+        bulk_load=bulk_load,
+        chunk_size=bulk_load_chunk_size,
+        details_schema=details_schema,
+        parquet_snapshot_folder=parquet_snapshot_folder,
+        checkpoint_builds=checkpoint_builds,
+        checkpoint_rows=checkpoint_rows,
+        parse_workers=parse_workers,
+        daily_summaries=daily_summaries,
+        table_builds_daily_summary=table_builds_daily_summary,
+        table_suites_daily_summary=table_suites_daily_summary,
+        table_status_runs=table_status_runs,
+        keyword_depth=keyword_depth,
+        failure_index=failure_index,
+        table_failure_signatures=table_failure_signatures,
+        table_failure_occurrences=table_failure_occurrences
     )
 
+# %%
+# Summary of the metrics of the run (time per stage, bytes downloaded, rows written, HTTP requests...)
+os.makedirs(os.path.dirname(metrics_file) or '.', exist_ok=True)
+metrics.write_json(metrics_file)
+print(f'Metrics of the run saved to "{metrics_file}"')
+if pushgateway_url:
+    metrics.push_to_gateway(pushgateway_url)
+
 print("DONE")
@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+
+# Analysis of Robot reports from OSM Jenkins (Step 2), without a Jupyter kernel
+#
+# Same report as `01-analysis_of_test_results.ipynb`, exported to HTML. Shared data is loaded and
+# the sequences are found only once, and then the figures (which are independent) are rendered
+# by a pool of processes
+
+import os
+import json
+import html
+import multiprocessing
+import time
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+# Figures are never shown, so no GUI is needed (neither here nor in the worker processes)
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+from sqlalchemy import create_engine, inspect
+from parquet_snapshot import load_parquet_snapshot
+from data_access import *
+from analysis_lib import *
+from analytics_duckdb import open_analytics_backend
+
+
+# 0. Input parameters
+
+# Default values
+inputs_folder = 'etl_outputs'
+outputs_folder = 'report_outputs'
+database_uri = f'sqlite:///{inputs_folder}/test_executions.db'
+report_file = None
+
+table_known_builds = 'builds_info'
+table_robot_reports = 'robot_reports'
+table_robot_reports_extended = 'robot_reports_extended'
+table_builds_daily_summary = 'builds_daily_summary'
+table_suites_daily_summary = 'suites_daily_summary'
+parquet_snapshot_folder = None
+analytics_uri = None
+
+too_old_builds = "2023-12-15"
+days_since_today_4_analysis = 21
+
+link_to_build = "https://osm.etsi.org/jenkins/view/Robot%20tests/job/{stage}/job/{branch}/{build}/"
+link_to_report = "https://osm.etsi.org/jenkins/view/Robot%20tests/job/{stage}/job/{branch}/{build}/robot/report/report.html"
+
+extended_print = False
+dump_sequences = True
+report_workers = os.cpu_count() or 1
+
+job_ids_prefix = 'osm-stage_3-merge/'
+job_ids = ['master', 'v17.0', 'v16.0', 'v15.0', 'v14.0']
+job_names = ['Master branch', 'Release SEVENTEEN', 'Release SIXTEEN', 'Release FIFTEEN', 'Release FOURTEEN']
+
+# Tries to bulk load credentials and other environment variables from .env file
+load_dotenv()
+
+# Modifies input parameters based on environment variables (when applicable)
+database_uri = os.environ.get('DATABASE_URI', None) or database_uri
+inputs_folder = os.environ.get('INPUTS_FOLDER', None) or inputs_folder
+outputs_folder = os.environ.get('OUTPUTS_FOLDER', None) or outputs_folder
+report_file = os.environ.get('REPORT_FILE', None) or report_file or os.path.join(outputs_folder, 'analysis_of_test_results.html')
+table_known_builds = os.environ.get('TABLE_KNOWN_BUILDS', None) or table_known_builds
+table_robot_reports = os.environ.get('TABLE_ROBOT_REPORTS', None) or table_robot_reports
+table_robot_reports_extended = os.environ.get('TABLE_ROBOT_REPORTS_EXTENDED', None) or table_robot_reports_extended
+table_builds_daily_summary = os.environ.get('TABLE_BUILDS_DAILY_SUMMARY', None) or table_builds_daily_summary
+table_suites_daily_summary = os.environ.get('TABLE_SUITES_DAILY_SUMMARY', None) or table_suites_daily_summary
+parquet_snapshot_folder = os.environ.get('PARQUET_SNAPSHOT_FOLDER', None) or parquet_snapshot_folder
+analytics_uri = os.environ.get('ANALYTICS_URI', None) or analytics_uri
+link_to_build = os.environ.get('LINK_TO_BUILD', None) or link_to_build
+link_to_report = os.environ.get('LINK_TO_REPORT', None) or link_to_report
+too_old_builds = os.environ.get('TOO_OLD_BUILDS', None) or too_old_builds
+days_since_today_4_analysis = int(os.environ.get('DAYS_SINCE_TODAY_4_ANALYSIS', None) or days_since_today_4_analysis)
+report_workers = int(os.environ.get('REPORT_WORKERS', None) or report_workers)
+job_ids_prefix = os.environ.get('JOB_IDS_PREFIX', None) or job_ids_prefix
+
+temp_job_ids = os.environ.get('JOB_IDS', None)
+if temp_job_ids:
+    job_ids = json.loads(temp_job_ids.replace("'", ""))
+
+temp_job_names = os.environ.get('JOB_NAMES', None)
+if temp_job_names:
+    job_names = json.loads(temp_job_names.replace("'", ""))
+
+relevant_jobs = [job_ids_prefix + job_id for job_id in job_ids]
+
+today_as_datetime = pd.to_datetime("today")
+today = today_as_datetime.strftime('%Y-%m-%d')
+
+first_date = (today_as_datetime - dt.timedelta(days=days_since_today_4_analysis)).strftime('%Y-%m-%d')
+last_date = today
+
+# In case there were specific environment variables, they should override these dates
+first_date = os.environ.get('FIRST_DATE', None) or first_date
+last_date = os.environ.get('LAST_DATE', None) or last_date
+
+
+# Pieces of the HTML report
+
+def html_markdown(text):
+    return f'<p>{text}</p>'
+
+def html_link(text, url):
+    return f'<a href="{html.escape(url)}">{text}</a>'
+
+def html_table(df):
+    return df.to_html(border=0, classes='dataframe', na_rep='NaN')
+
+def html_figure(png):
+    return f'<img src="data:image/png;base64,{png}"/>' if png else html_markdown('Empty dataframe. Skipping.')
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8"/>
+<title>{title}</title>
+<style>
+body {{font-family: sans-serif; margin: 2em;}}
+table {{align: left; display: block; border-collapse: collapse; font-size: 12px;}}
+th, td {{padding: 0.3em 0.6em; border-bottom: 1px solid #ddd; text-align: right;}}
+img {{max-width: 100%;}}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+'''
+
+
+def main():
+    start = time.perf_counter()
+    os.makedirs(outputs_folder, exist_ok=True)
+
+    # 1. Retrieval of all current data for aggregate analytics
+    print('Retrieving from database...\t', end='', flush=True)
+    engine = create_engine(database_uri)
+
+    if parquet_snapshot_folder and os.path.isdir(parquet_snapshot_folder):
+        # Only the builds of the analysed period are read from the Parquet snapshot
+        snapshot_first_date = max(first_date, too_old_builds)
+        df_known_builds = load_parquet_snapshot(parquet_snapshot_folder, table_known_builds, jobs=relevant_jobs, first_date=snapshot_first_date, last_date=last_date)
+        df_known_builds = fix_types(df_known_builds, 'builds')
+        df_all_build_reports = load_parquet_snapshot(parquet_snapshot_folder, table_robot_reports, jobs=relevant_jobs, first_date=snapshot_first_date, last_date=last_date)
+    else:
+        # Only the builds of the analysed period (and of the relevant jobs) are read from the database
+        period = dict(too_old_builds=too_old_builds, first_date=first_date, last_date=last_date, jobs=relevant_jobs, table_known_builds=table_known_builds)
+        df_known_builds = load_known_builds(engine, **period)
+        df_all_build_reports = load_all_build_reports(engine, **period, table_robot_reports=table_robot_reports)
+    df_known_builds = add_pass_fail_pct(df_known_builds)
+
+    # DuckDB analytics backend (only if selected with `ANALYTICS_URI`, or with a DuckDB `DATABASE_URI`)
+    analytics = open_analytics_backend(
+        analytics_uri,
+        database_uri,
+        parquet_snapshot_folder=parquet_snapshot_folder,
+        table_known_builds=table_known_builds,
+        table_robot_reports=table_robot_reports,
+        table_robot_reports_extended=table_robot_reports_extended
+    )
+
+    if analytics is not None:
+        # Aggregated as SQL by the DuckDB backend
+        df_test_pass_rate = analytics.test_pass_rate_per_day(first_date, last_date, relevant_jobs)
+        df_success_per_suite = analytics.success_per_suite(first_date, last_date, relevant_jobs)
+        df_failing_days_per_suite = analytics.failing_days_per_suite(first_date, last_date, relevant_jobs)
+    elif inspect(engine).has_table(table_builds_daily_summary):
+        # Daily summaries are small, so they are read straight from the database
+        df_builds_daily = load_daily_summary(engine, table_builds_daily_summary, first_date, last_date, jobs=relevant_jobs)
+        df_suites_daily = load_daily_summary(engine, table_suites_daily_summary, first_date, last_date, jobs=relevant_jobs)
+        df_test_pass_rate = get_test_pass_rate_per_day(df_builds_daily)
+        df_success_per_suite = get_success_per_suite(df_suites_daily)
+        df_failing_days_per_suite = get_failing_days_per_suite(df_suites_daily)
+    else:
+        df_test_pass_rate = df_success_per_suite = df_failing_days_per_suite = None
+
+    if analytics is not None:
+        # The latest builds are found as SQL by the DuckDB backend
+        df_latest_builds_all_jobs = analytics.latest_builds_all_jobs(too_old_builds=too_old_builds)
+        df_latest_report_all_jobs = analytics.latest_report_all_jobs(too_old_builds=too_old_builds)
+        df_latest_extended_report_all_jobs = analytics.latest_extended_report_all_jobs(too_old_builds=too_old_builds)
+        analytics.close()
+    else:
+        latest = dict(too_old_builds=too_old_builds, jobs=relevant_jobs, table_known_builds=table_known_builds)
+        df_latest_builds_all_jobs = load_latest_builds_all_jobs(engine, **latest)
+        df_latest_report_all_jobs = load_latest_report_all_jobs(engine, **latest, table_robot_reports=table_robot_reports)
+        df_latest_extended_report_all_jobs = load_latest_extended_report_all_jobs(engine, **latest, table_robot_reports_extended=table_robot_reports_extended)
+
+    sorted_categorical_builds = CategoricalDtype(categories=relevant_jobs, ordered=True)
+    df_latest_builds_all_jobs = (
+        df_latest_builds_all_jobs
+        .assign(job = lambda x: x.job.astype(sorted_categorical_builds))
+        .dropna(subset = ['job'])
+        .sort_values('job')
+        .reset_index(drop=True)
+    )
+
+    # Connections are not shared with the worker processes
+    engine.dispose()
+    print('DONE')
+
+    # 2. Aggregated analysis of stability
+    print('Finding sequences...\t', end='', flush=True)
+    data = add_sequence_labels(restrict_to_period(df_known_builds, first_date, last_date))
+    test_suites_data = add_suite_sequence_labels(restrict_to_period(df_all_build_reports, first_date, last_date))
+    sequences = create_build_sequences(data)
+    sequences['sequence_test_suites'] = create_suite_sequences(test_suites_data)
+
+    # If requested, it also dumps all the calculated sequences
+    if dump_sequences:
+        dump_sequences_to_excel(
+            os.path.join(outputs_folder, 'sequences_dump.xlsx'),
+            {name: sequences[name] for name in ['sequence_build_result', 'sequence_test_result', 'sequence_success_fail', 'sequence_test_suites']}
+        )
+
+    # Days failing/passing of each test suite, per job
+    fail_pass_durations = {}
+    for relevant_job, job_name in zip(relevant_jobs, job_names):
+        sequence_suites_filtered = sequences['sequence_test_suites'].query('job==@relevant_job')
+        fail_pass_durations[relevant_job] = get_fail_pass_durations_per_suite(sequence_suites_filtered)
+
+    fail_pass_data = [
+        pd.DataFrame(
+            dict(
+                suites = durations.name,
+                days_failing = durations.FAIL,
+                days_passing = durations.PASS
+            )
+        )
+        .assign(job = job_name)
+        for (relevant_job, durations), job_name in zip(fail_pass_durations.items(), job_names) if durations is not None
+    ]
+    df_fail_pass_summary = summarize_fail_pass(fail_pass_data) if fail_pass_data else None
+    print('DONE')
+
+    # 3. Reports: figures are rendered in parallel, and collected in the order of the report
+    print(f'Rendering figures with {report_workers} workers...\t', end='', flush=True)
+    figures = {}
+
+    for relevant_job, job_name, job_id in zip(relevant_jobs, job_names, job_ids):
+        figures[('success_rate', relevant_job)] = (plot_aggregated_success_rate, dict(
+            data_filtered=data.query("job==@relevant_job"),
+            title=f'{job_name} - % of successful test steps ({today})',
+            filename=os.path.join(outputs_folder, f'fully_successful_builds_{job_id}')
+        ))
+
+        if extended_print:
+            for kind, sequence, state_col, title, ok_states, nok_states in [
+                ('successful_failed_builds', 'sequence_build_result', 'build_result', 'Build completions and failures', ['SUCCESS'], ['FAILURE']),
+                ('global_robot_status', 'sequence_test_result', 'test_result', 'Robot tests status', ['PASS'], ['FAIL']),
+                ('global_stability_status', 'sequence_success_fail', 'success_fail', 'Stability for point release', ['PASS'], ['FAIL']),
+            ]:
+                figures[(kind, relevant_job)] = (plot_aggregated_builds_and_tests, dict(
+                    data_filtered=sequences[sequence].query("job==@relevant_job"),
+                    state_col=state_col,
+                    title=f'{job_name} - {title} ({today})',
+                    ok_states=ok_states, nok_states=nok_states,
+                    filename=os.path.join(outputs_folder, f'{kind}_{job_id}')
+                ))
+
+        figures[('global_compared_stability_status', relevant_job)] = (plot_aggregated_stability_sequences, dict(
+            sequences=[
+                sequences['sequence_build_result'].query("job==@relevant_job"),
+                sequences['sequence_test_result_strict'].query("job==@relevant_job"),
+                sequences['sequence_success_fail_strict'].query("job==@relevant_job")
+            ],
+            state_cols=['build_result', 'test_result', 'success_fail'],
+            titles=[
+                'Build completions and failures',
+                'Robot tests status',
+                'Stability for point release'
+            ],
+            suptitle=f'{job_name} - Robot tests status ({today})\n',
+            ok_states=[['SUCCESS'], ['PASS'], ['PASS']],
+            nok_states=[['FAILURE'], ['FAIL'], ['FAIL']],
+            filename=os.path.join(outputs_folder, f'global_compared_stability_status_{job_id}')
+        ))
+
+        _, suites, suite_sequences = prepare_suite_sequences_for_plotting(sequences['sequence_test_suites'].query('job==@relevant_job'))
+        figures[('success_per_test_suite_status', relevant_job)] = (plot_aggregated_stability_sequences, dict(
+            sequences=suite_sequences,
+            state_cols = ['test_result'] * len(suite_sequences),
+            titles = [''] * len(suite_sequences),
+            text = suites,
+            suptitle = f'{job_name} ({today})',
+            ok_states = ['PASS'] * len(suite_sequences),
+            nok_states = ['FAIL'] * len(suite_sequences),
+            filename = os.path.join(outputs_folder, f'success_per_test_suite_status_{job_id}'),
+            figsize = (18,16),
+            tight = False
+        ))
+
+        durations = fail_pass_durations[relevant_job]
+        if durations is not None:
+            figures[('failing_days_per_suite', relevant_job)] = (plot_days_suites_ok_nok, dict(
+                suites=durations.name,
+                days_failing=durations.FAIL,
+                days_passing=durations.PASS,
+                title=f'{job_name} - Failing days per test suite ({today})',
+                filename=os.path.join(outputs_folder, f'failing_days_per_suite_{job_id}')
+            ))
+
+    if df_fail_pass_summary is not None:
+        figures[('failing_days_per_suite_comparison', None)] = (plot_error_rate_heatmap, dict(
+            df_fail_pass_summary=df_fail_pass_summary,
+            title=f'% time in error state per test suite and release ({today})',
+            filename=os.path.join(outputs_folder, 'failing_days_per_suite_comparison')
+        ))
+
+    if report_workers > 1:
+        # Forked workers do not need to import the libraries again (where available)
+        mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=report_workers, mp_context=mp_context) as executor:
+            futures = {key: executor.submit(render_figure, plot, kwargs) for key, (plot, kwargs) in figures.items()}
+            images = {key: future.result() for key, future in futures.items()}
+    else:
+        images = {key: render_figure(plot, kwargs) for key, (plot, kwargs) in figures.items()}
+    print('DONE')
+
+    # Assembly of the HTML report
+    body = [
+        '<h1>Analysis of Robot reports from OSM Jenkins</h1>',
+        html_markdown(f'<b>Date and time of the report:</b> {today_as_datetime}'),
+        html_markdown(f'<b>Analysed period:</b> {first_date} to {last_date}.'),
+        '<h2>3. Reports</h2>',
+        '<h3>3.1 Aggregated success rate per test step</h3>',
+    ]
+    body += [html_figure(images[('success_rate', relevant_job)]) for relevant_job in relevant_jobs]
+
+    body.append('<h3>3.2 Overall success of Jenkins builds and Robot tests</h3>')
+    for kind in ['successful_failed_builds', 'global_robot_status', 'global_stability_status', 'global_compared_stability_status']:
+        body += [html_figure(images[(kind, relevant_job)]) for relevant_job in relevant_jobs if (kind, relevant_job) in images]
+
+    body.append('<h3>3.3 Sequences of pass/fails per test suites</h3>')
+    body += [html_figure(images[('success_per_test_suite_status', relevant_job)]) for relevant_job in relevant_jobs]
+
+    body.append('<h3>3.4 Failing days per test suite</h3>')
+    body += [html_figure(images.get(('failing_days_per_suite', relevant_job))) for relevant_job in relevant_jobs]
+    if df_fail_pass_summary is not None:
+        body.append(html_figure(images[('failing_days_per_suite_comparison', None)]))
+        body.append(html_table(
+            df_fail_pass_summary
+            .pivot(
+                index = 'suites',
+                columns = 'job',
+                values = ['days_failing', 'days_passing', 'days_run', 'error_rate']
+            )
+            .reorder_levels([1, 0], axis=1).sort_index(axis=1)
+        ))
+
+    body.append('<h3>3.5 Daily results per job and test suite</h3>')
+    if df_test_pass_rate is not None:
+        # Share of builds per day whose Robot tests passed completely
+        body.append(html_table(
+            df_test_pass_rate
+            .pivot(index='day', columns='job', values='test_pass_rate')
+            .rename(columns=dict(zip(relevant_jobs, job_names)))
+            .round(2)
+        ))
+        # Runs of each test suite, and share of them that passed
+        body.append(html_table(
+            df_success_per_suite
+            .pivot(index='suite', columns='job', values=['runs', 'pass_rate'])
+            .reorder_levels([1, 0], axis=1).sort_index(axis=1)
+        ))
+        # Days with at least one failed run of each test suite
+        body.append(html_table(
+            df_failing_days_per_suite
+            .pivot(index='suite', columns='job', values=['days_failing', 'days_run', 'error_rate'])
+            .reorder_levels([1, 0], axis=1).sort_index(axis=1)
+        ))
+    else:
+        body.append(html_markdown('Daily summaries not available. Skipping.'))
+
+    # 4. Information about the latest builds of relevant jobs
+    body.append('<h2>4. Information about the latest builds of relevant jobs</h2>')
+    body.append('<h3>Latest build of each job</h3>')
+    body.append(html_table(df_latest_builds_all_jobs))
+    for job_name, build in zip(df_latest_builds_all_jobs.job, df_latest_builds_all_jobs.build):
+        stage, branch = job_name.split('/')
+        link = link_to_build.format(stage=stage, branch=branch, build=build)
+        body.append(html_markdown(html_link(f'Click to see the details of <b>build {build} of {job_name}</b>', link)))
+
+    df_failed = (
+        df_latest_report_all_jobs
+        .query("status=='FAIL'")
+    )
+    df_details_failed = (
+        df_latest_extended_report_all_jobs
+        .merge(
+            df_failed[['job', 'build', 'name']],
+            how='inner',
+            left_on=['job', 'build', 'suite_name'],
+            right_on=['job', 'build', 'name']
+            )
+        .drop(columns=['suite_id', 'test_id', 'name'])
+        .query('status=="FAIL"')
+    )
+
+    for title, df, dropped_columns in [
+        ('Failed test suites per job (if any):', df_failed, ['build', 'source', 'job', 'id', 'failed_test_id']),
+        ('Details of failed tests into failing test suites (if any):', df_details_failed, ['job', 'build']),
+    ]:
+        body.append(f'<h3>{title}</h3>')
+        for job_name in relevant_jobs:
+            stage, branch = job_name.split('/')
+            build = (
+                df_latest_builds_all_jobs
+                .query('job==@job_name')
+                ['build']
+                .to_list()[0]
+            )
+
+            link = link_to_report.format(stage=stage, branch=branch, build=build)
+            body.append(html_markdown(f'<b>{job_name}:</b> ({html_link("full report", link)})'))
+            body.append(html_table(df.query('job==@job_name').drop(columns=dropped_columns)))
+
+    body.append('<hr/>')
+    body.append('<font size=2>Powered by <b><a href="https://github.com/fjramons/osm-analytics">osm-analytics</a></b></font>')
+
+    os.makedirs(os.path.dirname(report_file) or '.', exist_ok=True)
+    with open(report_file, 'w', encoding='utf-8') as f:
+        f.write(HTML_TEMPLATE.format(title='Analysis of Robot reports from OSM Jenkins', body='\n'.join(body)))
+    print(f'Report saved to "{report_file}" in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,632 @@
+# Library with the steps of the analysis of test results (sequences and plots), shared by the report notebook and its headless runner.
+# Data is loaded with `data_access`
+
+import base64
+import datetime as dt
+import io
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from run_length_lib import run_length_encode, label_runs
+
+
+# Mappings of the states of builds and test suites to successful (`True`) or failed (`False`) sequences.
+# States that are not in the mapping are inconclusive (e.g., 'ABORTED' or 'UNAVAILABLE' in some of them)
+mapping_build_result = {
+    'SUCCESS': True,
+    'UNSTABLE': True,
+    'FAILURE': False
+    # 'ABORTED' will yield 'N/A'
+}
+
+mapping_test_result = {
+    'PASS': True,
+    'FAIL': False
+    # 'UNAVAILABLE' will yield 'N/A'
+}
+
+mapping_success_fail = {
+    'PASS': True,
+    'FAIL': False,
+    'UNAVAILABLE': False
+}
+
+# Summarizes the conditions for the 3 types of sequences in different tables
+# Each condition is a pair: (state that, if found in any sample of the sequence, is the outcome of the whole sequence; outcome otherwise)
+
+# Was the build successful?: If at least one in the sequence is 'FAILURE', the whole sequence is in failure
+agg_build_result = ('FAILURE', 'SUCCESS')
+
+# Were all Robot tests successful?: If at least one in the sequence is 'FAIL', the whole sequence is failing
+agg_test_result = ('FAIL', 'PASS')
+
+# Was all the building and testing successful?: If at least one in the sequence is 'PASS', the whole sequence is passing tests
+agg_success_fail = ('PASS', 'FAIL')
+
+
+# Daily results of the analysed period (from the daily summary tables)
+
+def get_test_pass_rate_per_day(df_builds_daily):
+    '''
+    Share of builds per job and day whose Robot tests passed completely, from the daily summary of the builds:
+
+    def get_test_pass_rate_per_day(df_builds_daily)
+    '''
+    return (
+        df_builds_daily
+        .assign(test_pass_rate = lambda x: x.test_pass / x.builds)
+        .loc[:, ['day', 'job', 'test_pass_rate']]
+        .reset_index(drop=True)
+    )
+
+
+def get_success_per_suite(df_suites_daily):
+    '''
+    Runs of each test suite per job, and the share of them that passed, from the daily summary of the test suites:
+
+    def get_success_per_suite(df_suites_daily)
+    '''
+    return (
+        df_suites_daily
+        .groupby(['suite', 'job'], observed=True)
+        .agg(runs=('runs', 'sum'), runs_passed=('suite_pass', 'sum'))
+        .assign(pass_rate = lambda x: x.runs_passed / x.runs)
+        .reset_index()
+    )
+
+
+def get_failing_days_per_suite(df_suites_daily):
+    '''
+    Days with at least one failed run of each test suite per job, out of the days it was run,
+    from the daily summary of the test suites:
+
+    def get_failing_days_per_suite(df_suites_daily)
+    '''
+    return (
+        df_suites_daily
+        .assign(days_failing = lambda x: x.suite_fail > 0)
+        .groupby(['suite', 'job'], observed=True)
+        .agg(days_failing=('days_failing', 'sum'), days_run=('day', 'nunique'))
+        .assign(error_rate = lambda x: x.days_failing / x.days_run)
+        .reset_index()
+    )
+
+
+# Sequences of success/failure
+
+def restrict_to_period(df, first_date=None, last_date=None):
+    '''
+    Copy of the samples whose timestamp is in a period of days (both included):
+
+    def restrict_to_period(df, first_date=None, last_date=None)
+    '''
+    if first_date is not None:
+        df = df.query('timestamp>=@first_date')
+
+    if last_date is not None:
+        # Needs to include latest hour of the last day
+        last_timestamp = pd.Timestamp(last_date) + dt.timedelta(days=1)
+        df = df.query('timestamp<@last_timestamp')
+
+    return df.copy()
+
+
+def add_pass_fail_pct(df_known_builds):
+    '''
+    Adds columns with % of passed/failed sub-tests to the known builds:
+
+    def add_pass_fail_pct(df_known_builds)
+    '''
+    return (
+        df_known_builds
+        .copy()
+        .assign(pass_pct = lambda x: x.pass_count / (x.pass_count + x.fail_count))
+        .fillna({'pass_pct': 0})
+        .assign(fail_pct = lambda x: 1- x.pass_pct)
+        .fillna({'fail_pct': 100})
+    )
+
+
+def find_sequence_number(df, relevant_col, mapping, grouping=None):
+    '''
+    Labels each sample with the number of the sequence of consecutive successes/failures it belongs to:
+
+    def find_sequence_number(df, relevant_col, mapping, grouping=None)
+
+    - relevant_col: column with the state of the samples.
+    - mapping: states of a successful (`True`) or failed (`False`) sequence.
+    - grouping: columns whose samples are labelled separately. By default, `['job']`.
+    '''
+    if grouping is None:
+        grouping = ['job']
+
+    # Inconclusive samples (i.e. not in the mapping) join the previous sequence, or the next one if they are the first samples.
+    # If all the samples of a group are inconclusive, each of them is a sequence of its own
+    return label_runs(
+        df[grouping[0]].to_numpy(),
+        df[relevant_col].to_numpy(),
+        keys=df[grouping[1]].to_numpy() if len(grouping) > 1 else None,
+        mapping=mapping
+    )
+
+
+def add_sequence_labels(data):
+    '''
+    Adds to the builds the columns with the labels of their 3 types of sequences
+    (`grp_build_result`, `grp_test_result` and `grp_success_fail`):
+
+    def add_sequence_labels(data)
+    '''
+    return (
+        data
+        .assign(
+            grp_build_result = lambda x:
+                find_sequence_number(
+                    x,
+                    relevant_col='build_result',
+                    mapping=mapping_build_result
+                ),
+            grp_test_result = lambda x:
+                find_sequence_number(
+                    x,
+                    relevant_col='test_result',
+                    mapping=mapping_test_result
+                ),
+            grp_success_fail = lambda x:
+                find_sequence_number(
+                    x,
+                    relevant_col='test_result',
+                    mapping=mapping_success_fail
+                )
+            )
+    )
+
+
+def extend_sequence(df, agg):
+    df = df.copy()
+
+    left_shifted = df.groupby(agg, observed=False).min_timestamp.shift(-1)
+    not_null = ~ left_shifted.isna()
+
+    df.loc[not_null, 'max_timestamp'] = left_shifted.loc[not_null]
+
+    return df
+
+
+def extend_last_sample_per_group(df, agg):
+    df = df.copy()
+
+    max_right_edge = max(df.min_timestamp.max(), df.max_timestamp.max())
+
+    last_item_indexes = df.groupby(agg, observed=False).tail(1).index
+    df.loc[last_item_indexes, 'max_timestamp'] = max_right_edge
+
+    return df
+
+
+def extend_lastest_build_per_job(df):
+    df = df.copy()
+
+    # Finds indices of rows generated from latest build of each job
+    indices_latest_build_per_job = (
+        df.max_build == df.groupby('job', observed=False).max_build.transform('max')
+    )
+
+    # In those samples, changes 'max_timestamp' to the maximum of:
+    # - Current max_timestamp + 12 hours
+    # - Now
+    df.loc[indices_latest_build_per_job, 'max_timestamp'] = (
+        (
+            df.loc[indices_latest_build_per_job, ['max_timestamp']] + dt.timedelta(hours=12)
+        )
+        .assign(now = pd.to_datetime("now"))
+    ).max(axis=1)
+
+    return df
+
+
+def create_sequence(df, grp_cols, agg_outcome, result_name):
+    '''
+    Summarizes the labelled samples as a dataframe with a row per sequence of successes/failures:
+
+    def create_sequence(df, grp_cols, agg_outcome, result_name)
+
+    - grp_cols: columns of the groups of samples, ending with the column of the labels of the sequences (e.g., `['job', 'grp_build_result']`).
+    - agg_outcome: `{column: (any_state, other_state)}`. If any sample of the sequence is in `any_state`, it is the outcome of the sequence; otherwise, `other_state`.
+    - result_name: name of the column with the outcome of each sequence.
+    '''
+    # Each sequence is a run of consecutive samples with the same 'grp_*' ID, found in a single pass over the samples
+    (outcome_col, (any_state, other_state)), = agg_outcome.items()
+    sequences = run_length_encode(
+        df[grp_cols[0]].to_numpy(),
+        df[grp_cols[-1]].to_numpy(),
+        timestamps=df.timestamp.to_numpy(),
+        keys=df[grp_cols[1]].to_numpy() if len(grp_cols) > 2 else None,
+        positions=df.build.to_numpy(),
+        any_of={'any_state': (df[outcome_col] == any_state).to_numpy()}
+    )
+    column_names = {
+        'job': grp_cols[0], 'key': grp_cols[1], 'status': grp_cols[-1],
+        'start_timestamp': 'min_timestamp', 'end_timestamp': 'max_timestamp', 'start': 'min_build', 'end': 'max_build'
+    }
+
+    return (
+        sequences
+        .assign(**{result_name: lambda x: np.where(x.any_state, any_state, other_state)})
+        .rename(columns=column_names)
+        .loc[:, grp_cols + ['min_timestamp', 'max_timestamp', 'min_build', 'max_build', result_name]]
+        .dropna()
+
+        # Keeps the order of the jobs (if categorical)
+        .astype({grp_cols[0]: df[grp_cols[0]].dtype, grp_cols[-1]: int, 'min_build': int, 'max_build': int})
+        .sort_values(grp_cols[0], kind='stable', ignore_index=True)
+
+        # Extends the length of each sequence up to the beginning of the next sequence:
+        .pipe(extend_sequence, agg=grp_cols[:-1]) # We have already aggregated by the last 'grp_*' ID.
+
+        # Extend the right edge of the last sample of each group to the end of the observed period
+        .pipe(extend_last_sample_per_group, agg=grp_cols[:-1])
+
+        # Extend the sequences from the last build of each job to have some extra width to be visible
+        .pipe(extend_lastest_build_per_job)
+
+        # Add column with the duration of each period
+        .assign(duration = lambda x: (x.max_timestamp - x.min_timestamp))
+    )
+
+
+# Sometimes, Jenkins is able to create a test report, but it is unable to complete a proper build and image upload
+# This function allows to discount this effect
+def makes_stricter(df, change_to='UNAVAILABLE'):
+    df = df.copy()
+
+    cond = (df.build_result=='FAILURE') & (df.test_result=='PASS')
+    df.loc[cond, 'test_result'] = change_to
+
+    return df
+
+
+def add_suite_sequence_labels(test_suites_data):
+    '''
+    Adds to the results per test suite the column with the labels of their sequences (`grp_test_result`):
+
+    def add_suite_sequence_labels(test_suites_data)
+    '''
+    return (
+        test_suites_data
+        .assign(
+            grp_test_result = lambda x:
+                find_sequence_number(
+                    x,
+                    relevant_col='status',
+                    mapping=mapping_test_result,
+                    grouping=['job', 'name']
+                ),
+            )
+    )
+
+
+def create_build_sequences(data):
+    '''
+    Finds the sequences of the builds labelled by `add_sequence_labels` (including the strict ones,
+    see `makes_stricter`). Returns a dictionary with their dataframes, by name (e.g., `'sequence_build_result'`):
+
+    def create_build_sequences(data)
+    '''
+    return {
+        'sequence_build_result': create_sequence(
+            data,
+            grp_cols = ['job', 'grp_build_result'],
+            agg_outcome = {'build_result': agg_build_result},
+            result_name = 'build_result'
+        ),
+        'sequence_test_result': create_sequence(
+            data,
+            grp_cols = ['job', 'grp_test_result'],
+            agg_outcome = {'test_result': agg_test_result},
+            result_name = 'test_result'
+        ),
+        'sequence_success_fail': create_sequence(
+            data,
+            grp_cols = ['job', 'grp_success_fail'],
+            agg_outcome = {'test_result': agg_success_fail},
+            result_name = 'success_fail'
+        ),
+        'sequence_test_result_strict': create_sequence(
+            data.pipe(makes_stricter),
+            grp_cols = ['job', 'grp_test_result'],
+            agg_outcome = {'test_result': agg_test_result},
+            result_name = 'test_result'
+        ),
+        'sequence_success_fail_strict': create_sequence(
+            data.pipe(makes_stricter, 'FAIL'),
+            grp_cols = ['job', 'grp_success_fail'],
+            agg_outcome = {'test_result': agg_success_fail},
+            result_name = 'success_fail'
+        ),
+    }
+
+
+def create_suite_sequences(test_suites_data):
+    '''
+    Finds the sequences of the results per test suite labelled by `add_suite_sequence_labels`:
+
+    def create_suite_sequences(test_suites_data)
+    '''
+    return create_sequence(test_suites_data, grp_cols=['job', 'name', 'grp_test_result'], agg_outcome={'status': agg_test_result}, result_name='test_result')
+
+
+def dump_sequences_to_excel(filename, sequences):
+    '''
+    Saves some sequences (dictionary of dataframes, by name) to a spreadsheet, one per sheet:
+
+    def dump_sequences_to_excel(filename, sequences)
+    '''
+    with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+        for name, sequence in sequences.items():
+            sequence.to_excel(writer, index=False, sheet_name=name)
+
+
+# Rearranges the sequence as a list of sequences per 'job' x 'suite'
+def prepare_suite_sequences_for_plotting(df_suites):
+
+    jobs = []
+    suites = []
+    sequences = []
+    for name, group in df_suites.groupby(['job', 'name'], observed=False):
+        jobs.append(name[0])
+        suites.append(name[1])
+        sequences.append(group)
+
+    return jobs, suites, sequences
+
+
+def get_fail_pass_durations_per_suite(sequence_suites_filtered):
+    '''
+    Days passing (`PASS`) and failing (`FAIL`) of each test suite (`name`) of a job, sorted
+    by both. Returns `None` if there are no sequences:
+
+    def get_fail_pass_durations_per_suite(sequence_suites_filtered)
+    '''
+    fail_pass_durations_per_suite = (
+        sequence_suites_filtered
+        .assign(duration = lambda x: x.duration / pd.Timedelta(days=1))
+        .pivot_table(
+            index = 'name',
+            columns = 'test_result',
+            values = 'duration',
+            aggfunc = 'sum',
+            observed = False
+        )
+        .fillna(0)
+        .reset_index()
+    )
+
+    # Safe reordering in case none/every test is failing
+    try:
+        fail_pass_durations_per_suite = (
+            fail_pass_durations_per_suite
+            .sort_values(['FAIL', 'PASS'])
+        )
+    except KeyError as e:
+        try:
+            fail_pass_durations_per_suite = (
+                fail_pass_durations_per_suite
+                .sort_values(['PASS'])
+                .assign(FAIL = np.zeros(len(fail_pass_durations_per_suite.name)))
+            )
+        except KeyError as e1:
+            try:
+                fail_pass_durations_per_suite = (
+                    fail_pass_durations_per_suite
+                    .sort_values(['FAIL'])
+                    .assign(PASS = np.zeros(len(fail_pass_durations_per_suite.name)))
+                )
+            except KeyError as e2:
+                # Empty dataframe
+                return None
+
+    return fail_pass_durations_per_suite
+
+
+def summarize_fail_pass(fail_pass_data):
+    '''
+    Table with the days failing and passing, and the error rate, of each test suite per
+    job, from a list of dataframes with the columns `suites`, `days_failing`, `days_passing` and `job`:
+
+    def summarize_fail_pass(fail_pass_data)
+    '''
+    return (
+        pd.concat(fail_pass_data)
+        .assign(days_run = lambda x: x.days_passing + x.days_failing)
+        .assign(error_rate = lambda x: x.days_failing / x.days_run)
+        .fillna({'error_rate': 0})
+        .reindex(['suites', 'job', 'days_failing', 'days_passing', 'days_run', 'error_rate'], axis=1)
+        .sort_values(['suites', 'job'])
+    )
+
+
+def remove_extra_col_level(df):
+    df.columns = df.columns.droplevel()
+    df.columns.name = None
+    return df
+
+
+# Plots. All of them return the figure (or `None` if there is nothing to plot) and, if `show`, show it as well
+
+def _save_figure(fig, filename):
+    if filename:
+        fig.savefig(f'{filename}.png', dpi=300)
+        fig.savefig(f'{filename}.svg')
+
+
+def plot_aggregated_success_rate(data_filtered, title, filename=None, show=True):
+
+    # If the data frame is empty, it returns immediately
+    if not data_filtered.shape[0]:
+        print("Empty dataframe. Skipping.")
+        return
+
+    fig, ax = plt.subplots(figsize = (12,6))
+
+    t = data_filtered.timestamp
+    pass_pct = 100 * data_filtered.pass_pct
+    fail_pct = 100 * data_filtered.fail_pct
+    #unavailable = (data_filtered.test_result=='UNAVAILABLE')*100
+    unavailable = (
+        data_filtered.test_result.map({'UNAVAILABLE': 100})
+        .ffill(limit=1)
+        .bfill(limit=1)
+    )
+
+    ax.fill_between(t, fail_pct+pass_pct, pass_pct, color='red', alpha=0.5, label='Failed')
+    ax.fill_between(t, pass_pct, color='lime', alpha=0.5, label='Passed')
+    ax.fill_between(t, unavailable, color='dimgray', label='Unsuccessful builds')
+    ax.axhline(100, color='black', linewidth=2, linestyle='--')
+
+    ax.set_title(title, fontsize=16)
+    ax.legend(fontsize=12, fancybox=True, shadow=True, borderpad=1, bbox_to_anchor = (1, 1))
+    fig.autofmt_xdate()
+
+    fig.tight_layout()
+
+    _save_figure(fig, filename)
+    if show:
+        plt.show()
+    return fig
+
+
+def plot_aggregated_builds_and_tests(data_filtered, state_col, title, ok_states, nok_states, filename=None, show=True):
+
+    fig, ax = plt.subplots(figsize = (12,6))
+
+    for min_timestamp, max_timestamp, state in zip(data_filtered.min_timestamp, data_filtered.max_timestamp, data_filtered[state_col]):
+        color = 'red' if state in nok_states else 'lime'
+        ax.axvspan(min_timestamp, max_timestamp, color=color, alpha=0.5)
+
+    ax.set_title(title, fontsize=16)
+    fig.autofmt_xdate()
+
+    fig.tight_layout()
+
+    _save_figure(fig, filename)
+    if show:
+        plt.show()
+    return fig
+
+
+def plot_aggregated_stability_sequences(sequences, state_cols, titles, ok_states, nok_states, text=None, suptitle=None, filename=None, figsize=(14,8), tight=False, show=True):
+
+    # If empty, it returns immediately
+    if not sequences:
+        print("Empty dataframe. Skipping.")
+        return
+
+    fig, ax = plt.subplots(nrows=len(sequences), sharex=True, figsize=figsize)
+
+    for i in range(len(sequences)):
+        for min_timestamp, max_timestamp, state in zip(sequences[i].min_timestamp, sequences[i].max_timestamp, sequences[i][state_cols[i]]):
+            color = 'red' if state in nok_states[i] else 'lime'
+            ax[i].axvspan(min_timestamp, max_timestamp, color=color, alpha=0.5)
+        if text:
+            ax[i].text(0.5, 0.5, text[i], dict(size=14),
+                       horizontalalignment='center', verticalalignment='center', transform=ax[i].transAxes, rasterized=False)
+
+        if not text:
+            ax[i].set_title(titles[i], fontsize=16)
+        ax[i].set_yticklabels([])
+
+    fig.autofmt_xdate()
+
+    if tight:
+        fig.tight_layout()
+    if suptitle:
+        fig.suptitle(suptitle, fontsize=22)
+
+    _save_figure(fig, filename)
+    if show:
+        plt.show()
+    return fig
+
+
+def plot_days_suites_ok_nok(suites, days_failing, days_passing, title, filename=None, show=True):
+
+    fig, ax = plt.subplots(figsize = (12,16))
+
+    plt.barh(suites, days_failing, color='red', alpha=0.5, label='Failing')
+    plt.barh(suites, days_passing, color='lime', alpha=0.5, left=days_failing, label='Passing')
+
+    fig.suptitle(title, fontsize=20)
+    ax.set_xlabel('Number of days')
+
+    fig.tight_layout()
+
+    _save_figure(fig, filename)
+    if show:
+        plt.show()
+    return fig
+
+
+def plot_error_rate_heatmap(df_fail_pass_summary, title, filename=None, show=True):
+
+    df_heatmap = (
+        df_fail_pass_summary
+        .drop(columns = ['days_failing', 'days_passing', 'days_run'])
+        .pivot(
+            index = 'suites',
+            columns = 'job',
+        )
+        .pipe(remove_extra_col_level)
+    )
+
+    fig, ax = plt.subplots(figsize = (8, 40))
+
+    sns.heatmap(
+        df_heatmap,
+        annot = True,
+        fmt = '2.0%',
+        square = True,
+        linewidths = .5,
+        cmap = 'Reds',
+        cbar = None,
+        ax = ax
+    )
+
+    # Etiquetas personalizadas
+    ax.set_title(title, fontsize=22)
+    ax.set_ylabel(None)
+    ax.set_xlabel(None)
+
+    # Mueve categorías eje X a la parte superior
+    ax.xaxis.tick_top()
+    ax.tick_params(axis='x', rotation=90)
+    ax.xaxis.set_label_position('bottom')
+
+    fig.tight_layout()
+
+    _save_figure(fig, filename)
+    if show:
+        plt.show()
+    return fig
+
+
+def render_figure(plot, kwargs, style='fivethirtyeight'):
+    '''
+    Draws a figure with one of the plot functions (and saves it, if `filename` is in its
+    arguments) without showing it. Returns the figure as a PNG image encoded in base64, to be
+    embedded in an HTML report, or `None` if there was nothing to plot. Intended to be run in a
+    pool of processes, so it is picklable as long as `plot` is a function of this module:
+
+    def render_figure(plot, kwargs, style='fivethirtyeight')
+    '''
+    with plt.style.context(style):
+        fig = plot(**kwargs, show=False)
+        if fig is None:
+            return None
+
+        # Same resolution and margins as the figures embedded by Jupyter
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight')
+        plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
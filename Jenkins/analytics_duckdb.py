@@ -0,0 +1,261 @@
+# Optional DuckDB backend for the report, which runs its heavy aggregations as SQL on the tables of the ETL
+
+import os
+import pandas as pd
+from sqlalchemy.engine import make_url
+from parquet_snapshot import SNAPSHOT_COLUMNS
+from data_access import fix_types
+
+try:
+    import duckdb
+except ImportError:     # The backend is optional
+    duckdb = None
+
+
+def is_duckdb_uri(uri):
+    '''
+    Whether a URI refers to a DuckDB database (e.g., `duckdb:///analytics.duckdb`, or `duckdb://` for an in-memory one).
+    '''
+    return bool(uri) and uri.split(':', 1)[0] == 'duckdb'
+
+
+def _duckdb_path(uri):
+    # Same convention as SQLAlchemy URIs of SQLite: `duckdb:///relative/path`, `duckdb:////absolute/path`
+    path = uri.split(':///', 1)[1] if ':///' in uri else ''
+    return path or ':memory:'
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class DuckDBAnalytics:
+    '''
+    Runs the heavy aggregations of the report (latest build per job, pass rate per day,
+    success and failing days per test suite) as SQL in an embedded DuckDB database, so
+    that only small result frames come back to Pandas:
+
+    analytics = DuckDBAnalytics(analytics_uri, database_uri=None, parquet_snapshot_folder=None, ...)
+
+    - analytics_uri: URI of the DuckDB database (e.g., `duckdb://` for an in-memory one).
+    - database_uri: URI of the database of the ETL. SQLite and MySQL databases are attached (read only)
+    with the `sqlite` and `mysql` extensions of DuckDB, and other DuckDB files are attached too. If it
+    is the same as `analytics_uri`, the tables of the ETL are read directly.
+    - parquet_snapshot_folder: if set (and it exists), the tables are read from the Parquet snapshot
+    of the ETL instead of from the database (no extension is needed then).
+    - table_known_builds, table_robot_reports, table_robot_reports_extended: names of the tables of the ETL.
+    '''
+
+    def __init__(
+            self,
+            analytics_uri,
+            database_uri=None,
+            parquet_snapshot_folder=None,
+            table_known_builds='builds_info',
+            table_robot_reports='robot_reports',
+            table_robot_reports_extended='robot_reports_extended'
+        ):
+        if duckdb is None:
+            raise ImportError('duckdb is required to use the DuckDB analytics backend (e.g., `pip install duckdb`)')
+        if not is_duckdb_uri(analytics_uri):
+            raise ValueError(f'Unsupported URI for the analytics backend: "{analytics_uri}"')
+
+        self.conn = duckdb.connect(_duckdb_path(analytics_uri))
+        tables = {'builds': table_known_builds, 'reports': table_robot_reports, 'details': table_robot_reports_extended}
+
+        if parquet_snapshot_folder and os.path.isdir(parquet_snapshot_folder):
+            sources = {kind: self._parquet_source(parquet_snapshot_folder, table, kind) for kind, table in tables.items()}
+        else:
+            catalog = self._attach(analytics_uri, database_uri)
+            sources = {kind: f'{catalog}{table}' for kind, table in tables.items()}
+
+        # The tables are exposed as views with the same columns and types, whatever their source
+        self.conn.execute(f'''
+            CREATE OR REPLACE TEMP VIEW analytics_builds AS
+            SELECT * REPLACE (CAST(timestamp AS TIMESTAMP) AS timestamp) FROM {sources['builds']}
+        ''')
+        for kind in ['reports', 'details']:
+            self.conn.execute(f'''
+                CREATE OR REPLACE TEMP VIEW analytics_{kind} AS
+                SELECT * REPLACE (
+                    CAST(build AS BIGINT) AS build,
+                    CAST(starttime AS TIMESTAMP) AS starttime,
+                    CAST(endtime AS TIMESTAMP) AS endtime
+                )
+                FROM {sources[kind]}
+            ''')
+
+    @staticmethod
+    def _parquet_source(snapshot_folder, table, kind):
+        # Job names are URL-encoded in the names of the partitions, and the timestamp of the build is only kept in the builds
+        columns = [column for column, _ in SNAPSHOT_COLUMNS[kind] if kind == 'builds' or column != 'timestamp']
+        path = os.path.join(snapshot_folder, table, '**', '*.parquet')
+        return f'''(
+            SELECT url_decode(job) AS job, {', '.join(f'"{column}"' for column in columns)}
+            FROM read_parquet({_quote(path)}, hive_partitioning = true, hive_types_autocast = false)
+        )'''
+
+    def _attach(self, analytics_uri, database_uri):
+        # Returns the prefix of the tables of the ETL (i.e., the name of the attached catalog)
+        if not database_uri or database_uri == analytics_uri:
+            return ''
+
+        if is_duckdb_uri(database_uri):
+            self.conn.execute(f'ATTACH {_quote(_duckdb_path(database_uri))} AS etl (READ_ONLY)')
+            return 'etl.'
+
+        url = make_url(database_uri)
+        if url.get_backend_name() == 'sqlite':
+            self.conn.execute(f'ATTACH {_quote(url.database)} AS etl (TYPE sqlite, READ_ONLY)')
+        elif url.get_backend_name() == 'mysql':
+            parameters = {'host': url.host, 'port': url.port, 'user': url.username, 'passwd': url.password, 'db': url.database}
+            connection_string = ' '.join(f'{key}={value}' for key, value in parameters.items() if value is not None)
+            self.conn.execute(f'ATTACH {_quote(connection_string)} AS etl (TYPE mysql, READ_ONLY)')
+        else:
+            raise ValueError(f'Unsupported database for the analytics backend: "{url.get_backend_name()}"')
+        return 'etl.'
+
+    def close(self):
+        self.conn.close()
+
+    def _query(self, query, params=None):
+        return self.conn.execute(query, params or []).df()
+
+    @staticmethod
+    def _period(first_date, last_date):
+        # Needs to include latest hour of the last day
+        return [pd.Timestamp(first_date).to_pydatetime(), (pd.Timestamp(last_date) + pd.Timedelta(days=1)).to_pydatetime()]
+
+    # Latest build of each job
+
+    _latest_builds = '''
+        latest_builds AS (
+            SELECT job, build
+            FROM analytics_builds
+            WHERE timestamp > CAST(? AS TIMESTAMP)
+            QUALIFY timestamp = MAX(timestamp) OVER (PARTITION BY job)
+        )
+    '''
+
+    def latest_builds_all_jobs(self, too_old_builds='1980-12-15'):
+        '''
+        Same as `load_latest_builds_all_jobs` (with the same data types): the latest build of each job, as a row per job.
+        '''
+        df = self._query('''
+            SELECT *
+            FROM analytics_builds
+            WHERE timestamp > CAST(? AS TIMESTAMP)
+            QUALIFY timestamp = MAX(timestamp) OVER (PARTITION BY job)
+            ORDER BY job
+        ''', [too_old_builds])
+        return fix_types(df, 'builds')
+
+    def latest_report_all_jobs(self, too_old_builds='1980-12-15'):
+        '''
+        Same as `load_latest_report_all_jobs` (with the same data types): the report of the latest build of each job, as a row per suite per job.
+        '''
+        df = self._query(f'''
+            WITH {self._latest_builds}
+            SELECT details.*
+            FROM analytics_reports AS details
+            INNER JOIN latest_builds AS main
+            ON details.job=main.job AND details.build=main.build
+            ORDER BY details.job, details.build, details.starttime
+        ''', [too_old_builds])
+        return fix_types(df, 'reports')
+
+    def latest_extended_report_all_jobs(self, too_old_builds='1980-12-15'):
+        '''
+        Same as `load_latest_extended_report_all_jobs` (with the same data types): the extended report of the latest build of each job, as a row per keyword per test per suite per job.
+        '''
+        df = self._query(f'''
+            WITH {self._latest_builds}
+            SELECT details.*
+            FROM analytics_details AS details
+            INNER JOIN latest_builds AS main
+            ON details.job=main.job AND details.build=main.build
+            ORDER BY details.job, details.build, details.starttime
+        ''', [too_old_builds])
+        return fix_types(df, 'details')
+
+    # Daily results of the analysed period
+
+    def test_pass_rate_per_day(self, first_date, last_date, jobs):
+        '''
+        Same as `get_test_pass_rate_per_day`: share of builds per job and day whose Robot tests passed completely.
+        '''
+        return self._query('''
+            SELECT
+                CAST(date_trunc('day', timestamp) AS TIMESTAMP) AS day,
+                job,
+                AVG(CASE WHEN test_result = 'PASS' THEN 1.0 ELSE 0.0 END) AS test_pass_rate
+            FROM analytics_builds
+            WHERE timestamp >= ? AND timestamp < ? AND list_contains(?, job)
+            GROUP BY ALL
+            ORDER BY job, day
+        ''', self._period(first_date, last_date) + [list(jobs)])
+
+    _suite_runs_per_day = '''
+        suite_runs_per_day AS (
+            SELECT
+                details.name AS suite,
+                details.job,
+                date_trunc('day', main.timestamp) AS day,
+                COUNT(*) AS runs,
+                COUNT(*) FILTER (WHERE details.status = 'PASS') AS suite_pass,
+                COUNT(*) FILTER (WHERE details.status = 'FAIL') AS suite_fail
+            FROM analytics_reports AS details
+            INNER JOIN analytics_builds AS main
+            ON details.job=main.job AND details.build=main.build
+            WHERE main.timestamp >= ? AND main.timestamp < ? AND list_contains(?, main.job)
+            GROUP BY ALL
+        )
+    '''
+
+    def success_per_suite(self, first_date, last_date, jobs):
+        '''
+        Same as `get_success_per_suite`: runs of each test suite per job, and the share of them that passed.
+        '''
+        return self._query(f'''
+            WITH {self._suite_runs_per_day}
+            SELECT
+                suite,
+                job,
+                CAST(SUM(runs) AS BIGINT) AS runs,
+                CAST(SUM(suite_pass) AS BIGINT) AS runs_passed,
+                SUM(suite_pass) / SUM(runs) AS pass_rate
+            FROM suite_runs_per_day
+            GROUP BY ALL
+            ORDER BY suite, job
+        ''', self._period(first_date, last_date) + [list(jobs)])
+
+    def failing_days_per_suite(self, first_date, last_date, jobs):
+        '''
+        Same as `get_failing_days_per_suite`: days with at least one failed run of each test suite per job, out of the days it was run.
+        '''
+        return self._query(f'''
+            WITH {self._suite_runs_per_day}
+            SELECT
+                suite,
+                job,
+                COUNT(*) FILTER (WHERE suite_fail > 0) AS days_failing,
+                COUNT(*) AS days_run,
+                COUNT(*) FILTER (WHERE suite_fail > 0) / COUNT(*) AS error_rate
+            FROM suite_runs_per_day
+            GROUP BY ALL
+            ORDER BY suite, job
+        ''', self._period(first_date, last_date) + [list(jobs)])
+
+
+def open_analytics_backend(analytics_uri=None, database_uri=None, **kwargs):
+    '''
+    Opens the DuckDB analytics backend, if selected: either with `analytics_uri` or, if not set,
+    with a `database_uri` that is itself a DuckDB database. Returns `None` otherwise (i.e., the
+    aggregations are done in Pandas). The rest of the arguments are those of `DuckDBAnalytics`:
+
+    def open_analytics_backend(analytics_uri=None, database_uri=None, **kwargs)
+    '''
+    analytics_uri = analytics_uri or (database_uri if is_duckdb_uri(database_uri) else None)
+    if not analytics_uri:
+        return None
+    return DuckDBAnalytics(analytics_uri, database_uri=database_uri, **kwargs)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+# Benchmark of the ETL (`ingest_update_all_jenkins_job`), end to end, against a fake Jenkins server and SQLite
+
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jenkins
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from benchmark_lib import SCALES, generate_scale_reports, peak_rss_mb, report_results, run_isolated
+from etl_metrics import metrics
+from fake_jenkins import FakeJenkinsServer
+from jenkins_lib import setup_connection_pool
+from jenkins_robot_etl import create_bulk_load_engine, ingest_update_all_jenkins_job
+
+
+JOB_NAME = 'osm-stage_3-merge/benchmark'
+
+# Tables written by the ETL, whose rows are counted
+TABLES = ['builds_info', 'robot_reports', 'robot_reports_extended']
+
+
+def run_etl(jenkins_url, database_file, fetch_workers=1, parse_workers=0, bulk_load=False, details_schema='flat'):
+    '''
+    Runs the ETL of the benchmark job into an empty SQLite database, and returns its
+    wall time, peak RSS and number of rows written (meant to run in a fresh process):
+
+    def run_etl(jenkins_url, database_file, fetch_workers=1, parse_workers=0, bulk_load=False, details_schema='flat')
+    '''
+    database_uri = f'sqlite:///{database_file}'
+    engine = create_bulk_load_engine(database_uri) if bulk_load else create_engine(database_uri)
+    server = jenkins.Jenkins(jenkins_url)
+    if fetch_workers > 1:
+        setup_connection_pool(server, pool_size=fetch_workers)
+
+    # The progress of each build is not printed, since it would distort the measurements
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        ingest_update_all_jenkins_job(
+            server,
+            JOB_NAME,
+            engine,
+            fetch_workers=fetch_workers,
+            parse_workers=parse_workers,
+            bulk_load=bulk_load,
+            details_schema=details_schema
+        )
+    wall_seconds = time.perf_counter() - start
+
+    with engine.connect() as conn:
+        rows = {table: conn.execute(text(f'SELECT COUNT(*) FROM {table}')).scalar() for table in TABLES}
+
+    stages = pd.DataFrame(metrics.summary()['stages'])
+    return {
+        'wall_seconds': wall_seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'rows': sum(rows.values()),
+        **{f'rows_{table}': count for table, count in rows.items()},
+        **{f'{stage}_seconds': seconds for stage, seconds in stages.groupby('stage').seconds.sum().items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the Jenkins and Robot ETL, against a fake Jenkins server and SQLite')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['tiny', 'small', 'medium'], help='Scales to run (default: %(default)s)')
+    parser.add_argument('--fetch-workers', type=int, default=1, help='Builds downloaded at the same time (default: %(default)s)')
+    parser.add_argument('--parse-workers', type=int, default=0, help='Processes that parse the reports (default: %(default)s)')
+    parser.add_argument('--bulk-load', action='store_true', help='Use the bulk-load path to write the reports')
+    parser.add_argument('--details-schema', choices=['flat', 'normalized'], default='flat', help='Schema of keyword-level results (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0, help='Extra latency (in seconds) of each request to the fake Jenkins (default: %(default)s)')
+    parser.add_argument('--work-folder', default=os.path.join(tempfile.gettempdir(), 'osm-analytics-benchmarks'), help='Folder for the generated reports (default: %(default)s)')
+    parser.add_argument('--output', help='JSON file where the results are saved')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        print(f'Running ETL at scale "{scale}" ({SCALES[scale]})...')
+        report_paths = generate_scale_reports(args.work_folder, scale)
+
+        # Every tenth build has no Robot report
+        builds = {
+            build_number: None if build_number % 10 == 0 else report_paths[build_number % len(report_paths)]
+            for build_number in range(1, SCALES[scale]['builds'] + 1)
+        }
+        report_mb = sum(os.path.getsize(path) for path in builds.values() if path) / 1024 / 1024
+
+        with FakeJenkinsServer({JOB_NAME: builds}, latency=args.latency) as fake_jenkins, tempfile.TemporaryDirectory() as database_folder:
+            result = run_isolated(
+                run_etl,
+                fake_jenkins.url,
+                os.path.join(database_folder, 'benchmark.db'),
+                fetch_workers=args.fetch_workers,
+                parse_workers=args.parse_workers,
+                bulk_load=args.bulk_load,
+                details_schema=args.details_schema
+            )
+
+        results.append({
+            'scale': scale,
+            'builds': len(builds),
+            'report_mb': report_mb,
+            **result,
+            'rows_per_second': result['rows'] / result['wall_seconds'],
+            'fetch_workers': args.fetch_workers,
+            'parse_workers': args.parse_workers,
+            'bulk_load': args.bulk_load,
+            'details_schema': args.details_schema,
+        })
+
+    report_results(
+        results,
+        ['scale', 'builds', 'report_mb', 'rows', 'wall_seconds', 'peak_rss_mb', 'rows_per_second', 'download_seconds', 'parse_seconds', 'transform_seconds', 'write_seconds'],
+        output=args.output
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Benchmark of each parser of Robot reports in `robot_lib`, on its own
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import robot_lib
+from benchmark_lib import SCALES, generate_scale_reports, peak_rss_mb, report_results, run_isolated
+
+
+# Parsers of `robot_lib` (by name), and the keyword arguments they are called with
+PARSERS = {
+    'parse_robot_report': {},
+    'get_stats_from_report': {},
+    'get_results_from_report': {},
+    'get_detailed_results_from_report': {},
+    'get_consolidated_results_from_report': {'with_rca': True},
+}
+
+
+def run_parser(parser_name, robot_report_path, repeat=3):
+    '''
+    Parses a Robot report `repeat` times with a parser of `robot_lib`, and returns the
+    best wall time, the peak RSS and the number of rows of the result (meant to run in
+    a fresh process):
+
+    def run_parser(parser_name, robot_report_path, repeat=3)
+    '''
+    parser = getattr(robot_lib, parser_name)
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parser(robot_report_path, **PARSERS[parser_name])
+        wall_times.append(time.perf_counter() - start)
+
+    # `parse_robot_report` returns several dataframes, whose main output are the detailed results
+    df_result = result.details if isinstance(result, robot_lib.RobotReportFrames) else result
+    return {
+        'wall_seconds': min(wall_times),
+        'peak_rss_mb': peak_rss_mb(),
+        'rows': len(df_result),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of each parser of Robot reports in robot_lib')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['tiny', 'small', 'medium', 'large'], help='Scales to run (default: %(default)s)')
+    parser.add_argument('--parsers', nargs='+', choices=list(PARSERS), default=list(PARSERS), help='Parsers to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each parser, of which the best one is reported (default: %(default)s)')
+    parser.add_argument('--work-folder', default=os.path.join(tempfile.gettempdir(), 'osm-analytics-benchmarks'), help='Folder for the generated reports (default: %(default)s)')
+    parser.add_argument('--output', help='JSON file where the results are saved')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        robot_report_path = generate_scale_reports(args.work_folder, scale, variants=1)[0]
+        report_mb = os.path.getsize(robot_report_path) / 1024 / 1024
+        for parser_name in args.parsers:
+            print(f'Running {parser_name} at scale "{scale}" ({report_mb:.1f} MB)...')
+            result = run_isolated(run_parser, parser_name, robot_report_path, repeat=args.repeat)
+            results.append({
+                'scale': scale,
+                'parser': parser_name,
+                'report_mb': report_mb,
+                **result,
+                'rows_per_second': result['rows'] / result['wall_seconds'],
+                'mb_per_second': report_mb / result['wall_seconds'],
+            })
+
+    report_results(
+        results,
+        ['scale', 'parser', 'report_mb', 'rows', 'wall_seconds', 'peak_rss_mb', 'rows_per_second', 'mb_per_second'],
+        output=args.output
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Common utilities of the benchmarks: scales, generation of inputs, isolated runs and reporting
+
+import json
+import multiprocessing
+import os
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from synthetic_reports import generate_robot_report
+
+
+# Sizes of the Robot reports (and number of builds of the job) at each scale
+SCALES = {
+    'tiny': {'builds': 10, 'suites': 3, 'tests': 4, 'keywords': 4, 'depth': 1},
+    'small': {'builds': 20, 'suites': 10, 'tests': 8, 'keywords': 6, 'depth': 1},
+    'medium': {'builds': 30, 'suites': 20, 'tests': 10, 'keywords': 10, 'depth': 2},
+    'large': {'builds': 20, 'suites': 30, 'tests': 15, 'keywords': 12, 'depth': 3},
+}
+
+
+def generate_scale_reports(work_folder, scale, variants=4):
+    '''
+    Generates (only once, since they are kept in `work_folder`) some different Robot
+    reports with the size of a scale, and returns the list of their file names:
+
+    def generate_scale_reports(work_folder, scale, variants=4)
+    '''
+    params = SCALES[scale]
+    report_params = {k: params[k] for k in ['suites', 'tests', 'keywords', 'depth']}
+    os.makedirs(work_folder, exist_ok=True)
+
+    paths = []
+    for seed in range(variants):
+        path = os.path.join(work_folder, f"output-{scale}-{'-'.join(str(v) for v in report_params.values())}-{seed}.xml")
+        if not os.path.exists(path):
+            generate_robot_report(path + '.tmp', seed=seed, **report_params)
+            os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    '''
+    Peak resident set size (in MB) of the current process so far.
+    '''
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports it in KB, but macOS in bytes
+    return peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_isolated(func, *args, **kwargs):
+    '''
+    Runs a function in a fresh process and returns its result, so that the peak RSS
+    it measures is not affected by former runs (the function must be picklable):
+
+    def run_isolated(func, *args, **kwargs)
+    '''
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(func, *args, **kwargs).result()
+
+
+def report_results(results, columns, output=None):
+    '''
+    Prints a table with some `columns` of the results of a benchmark (list of
+    dictionaries) and, if `output` is set, saves all of them to a JSON file.
+    '''
+    df_results = pd.DataFrame(results)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', '{:,.2f}'.format):
+        print(df_results.loc[:, [column for column in columns if column in df_results.columns]].to_string(index=False))
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results saved to "{output}"')
@@ -0,0 +1,184 @@
+# Local stand-in of a Jenkins server, serving the builds of some jobs and their Robot reports
+
+import gzip
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+
+class FakeJenkinsServer:
+    '''
+    Minimal HTTP server that emulates the parts of the Jenkins API used by the ETL: the
+    JSON summaries of jobs and builds (including `tree=allBuilds[...]{from,to}` paging)
+    and the Robot report of each build (`<build>/robot/report/output.xml`, gzipped if
+    accepted by the client). It runs in a background thread:
+
+    with FakeJenkinsServer(jobs, latency=0) as fake_jenkins:
+        server = jenkins.Jenkins(fake_jenkins.url)
+
+    - jobs: dictionary `{job_name: {build_number: robot_report_path}}`. Builds mapped to
+    `None` have no Robot report (i.e., it returns 404, as Jenkins does).
+    - latency: extra delay (in seconds) before answering each request, to emulate a remote server.
+    '''
+
+    # Start of the timestamps of the builds (in ms, as in Jenkins), one hour apart
+    first_timestamp = 1704103200000
+
+    def __init__(self, jobs, latency=0, host='127.0.0.1', port=0):
+        self.jobs = jobs
+        self.latency = latency
+        self.requests = 0
+        self._compressed_reports = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def build_summary(self, job_name, build_number):
+        '''
+        Summary of a build, with the fields returned by Jenkins that the ETL keeps
+        (every fifth build is still running, so its result is `None`).
+        '''
+        return {
+            '_class': 'org.jenkinsci.plugins.workflow.job.WorkflowRun',
+            'id': str(build_number),
+            'number': build_number,
+            'result': None if build_number % 5 == 0 else ('SUCCESS' if build_number % 3 else 'FAILURE'),
+            'duration': 1000 * (3600 + build_number % 600),
+            'estimatedDuration': 3600000,
+            'timestamp': self.first_timestamp + 3600000 * build_number,
+            'url': f'{self.url}{self._job_path(job_name)}/{build_number}/',
+        }
+
+    @staticmethod
+    def _job_path(job_name):
+        return '/'.join(f'job/{part}' for part in job_name.split('/'))
+
+    def _robot_report(self, job_name, build_number, compressed):
+        path = self.jobs[job_name][build_number]
+        if not compressed:
+            with open(path, 'rb') as f:
+                return f.read()
+
+        # Reports are compressed only once (several builds may share the same file)
+        with self._lock:
+            if path not in self._compressed_reports:
+                with open(path, 'rb') as f:
+                    self._compressed_reports[path] = gzip.compress(f.read(), compresslevel=1)
+            return self._compressed_reports[path]
+
+    def _handler_class(self):
+        fake_jenkins = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, body=b'', content_type='application/json', headers=None):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-Jenkins', '2.440.3')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, data):
+                self._send(200, json.dumps(data).encode('utf-8'))
+
+            def do_POST(self):
+                # Request bodies (if any) are discarded, so that the connection can be reused
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.do_GET()
+
+            def do_GET(self):
+                with fake_jenkins._lock:
+                    fake_jenkins.requests += 1
+                if fake_jenkins.latency:
+                    time.sleep(fake_jenkins.latency)
+
+                url = urlsplit(self.path)
+                path, query = unquote(url.path), unquote(url.query)
+
+                if path in ['/', '/api/json']:
+                    return self._send_json({'jobs': [{'name': job_name} for job_name in fake_jenkins.jobs]})
+                if path == '/me/api/json':
+                    return self._send_json({'fullName': 'Benchmark'})
+
+                # Job, build or report: `/job/<folder>/job/<name>[/<build>[/robot/report/output.xml]]`
+                parts = path.strip('/').split('/')
+                job_parts = []
+                while len(parts) > 1 and parts[0] == 'job':
+                    job_parts.append(parts[1])
+                    parts = parts[2:]
+                builds = fake_jenkins.jobs.get('/'.join(job_parts))
+                if builds is None:
+                    return self._send(404)
+                job_name = '/'.join(job_parts)
+
+                if parts in [[], ['api', 'json']]:
+                    return self._send_json(self._job_info(job_name, builds, query))
+                if not parts[0].isdigit() or int(parts[0]) not in builds:
+                    return self._send(404)
+
+                build_number = int(parts[0])
+                if parts[1:] in [[], ['api', 'json']]:
+                    return self._send_json(fake_jenkins.build_summary(job_name, build_number))
+                if parts[1:] == ['robot', 'report', 'output.xml'] and builds[build_number] is not None:
+                    compressed = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+                    return self._send(
+                        200,
+                        fake_jenkins._robot_report(job_name, build_number, compressed),
+                        content_type='application/xml',
+                        headers={'Content-Encoding': 'gzip'} if compressed else None
+                    )
+                return self._send(404)
+
+            def _job_info(self, job_name, builds, query):
+                summaries = [fake_jenkins.build_summary(job_name, build_number) for build_number in sorted(builds, reverse=True)]
+
+                # Paged list of builds, as requested by `get_all_job_builds_summaries`
+                if 'allBuilds' in query:
+                    page = re.search(r'\{(\d+),(\d+)\}', query)
+                    if page:
+                        summaries = summaries[int(page[1]):int(page[2])]
+                    return {'_class': 'org.jenkinsci.plugins.workflow.job.WorkflowJob', 'allBuilds': summaries}
+
+                return {
+                    '_class': 'org.jenkinsci.plugins.workflow.job.WorkflowJob',
+                    'name': job_name.split('/')[-1],
+                    'fullName': job_name,
+                    'url': f'{fake_jenkins.url}{fake_jenkins._job_path(job_name)}/',
+                    'builds': [{'_class': summary['_class'], 'number': summary['number'], 'url': summary['url']} for summary in summaries],
+                    'firstBuild': {'number': min(builds), 'url': summaries[-1]['url']} if builds else None,
+                    'lastBuild': {'number': max(builds), 'url': summaries[0]['url']} if builds else None,
+                    'healthReport': [{'description': 'Build stability', 'score': 80}],
+                }
+
+        return Handler
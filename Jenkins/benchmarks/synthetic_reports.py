@@ -0,0 +1,150 @@
+# Generator of synthetic Robot reports (`output.xml`), with the same structure as the ones of OSM
+
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape, quoteattr
+
+
+# Format of the timestamps in Robot reports
+_TIMESTAMP_FORMAT = '%Y%m%d %H:%M:%S.%f'
+
+# Libraries and names used for the synthetic keywords
+_LIBRARIES = ['BuiltIn', 'OperatingSystem', 'Process', 'Collections', 'String', 'osm_lib']
+_VERBS = ['Create', 'Delete', 'Check', 'Wait For', 'Get', 'Deploy', 'Upgrade', 'Verify']
+_OBJECTS = ['NS', 'VNF', 'VIM', 'Package', 'K8s Cluster', 'Network Slice', 'Repository', 'User']
+
+
+def _format_timestamp(timestamp):
+    return timestamp.strftime(_TIMESTAMP_FORMAT)[:-3]
+
+
+class _Clock:
+    # Simulated time of the execution, which advances as keywords are written
+    def __init__(self, start):
+        self.now = start
+
+    def tick(self, rng):
+        self.now += timedelta(milliseconds=rng.randint(5, 2000))
+        return self.now
+
+
+def _write_status(f, status, starttime, endtime, message=None):
+    text = escape(message) if message else ''
+    f.write(f'<status status="{status}" starttime="{_format_timestamp(starttime)}" endtime="{_format_timestamp(endtime)}">{text}</status>\n')
+
+
+def _write_keyword(f, rng, clock, level, depth, fail, keyword_type=None):
+    name = f'{rng.choice(_VERBS)} {rng.choice(_OBJECTS)}'
+    type_attribute = f' type="{keyword_type}"' if keyword_type else ''
+    f.write(f'<kw name={quoteattr(name)} library="{rng.choice(_LIBRARIES)}"{type_attribute}>\n')
+    f.write(f'<doc>{escape(name)} with the given arguments.</doc>\n')
+    f.write(f'<arguments>\n<arg>${{{rng.choice(_OBJECTS).lower().replace(" ", "_")}_name}}</arg>\n<arg>timeout={rng.randint(1, 60)}s</arg>\n</arguments>\n')
+
+    starttime = clock.tick(rng)
+    # Nested keywords: if the keyword fails, the failure comes from its last child
+    if level < depth:
+        children = rng.randint(1, 3)
+        for child in range(children):
+            _write_keyword(f, rng, clock, level + 1, depth, fail and child == children - 1)
+    f.write(f'<msg timestamp="{_format_timestamp(clock.now)}" level="{"FAIL" if fail else "INFO"}">{escape(name)}: {"error" if fail else "done"} &amp; logged</msg>\n')
+    _write_status(f, 'FAIL' if fail else 'PASS', starttime, clock.tick(rng))
+    f.write('</kw>\n')
+
+
+def write_robot_report(
+        robot_report_file,
+        suites=10,
+        tests=10,
+        keywords=10,
+        depth=1,
+        fail_ratio=0.2,
+        seed=0,
+        start=datetime(2024, 1, 1, 10, 0, 0)
+    ):
+    '''
+    Writes a synthetic Robot report into a text file object, so that reports of any size
+    can be generated without keeping them in memory. The report has a top-level suite with
+    `suites` test suites, each of them with `tests` tests of `keywords` top-level keywords.
+    Keywords embed nested keywords up to `depth` levels:
+
+    def write_robot_report(robot_report_file, suites=10, tests=10, keywords=10, depth=1, fail_ratio=0.2, seed=0, start=datetime(2024, 1, 1, 10, 0, 0))
+
+    - fail_ratio: probability of a test failing (in one of its keywords, chosen at random).
+    - seed: seed of the random generator, so that reports are reproducible.
+
+    Returns a dictionary with the number of suites, tests and top-level keywords (i.e., rows
+    of the detailed results) written.
+    '''
+    rng = random.Random(seed)
+    clock = _Clock(start)
+    f = robot_report_file
+    suite_stats = []
+    keywords_written = 0
+
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write(f'<robot generator="Robot 3.2.2 (Python 3.8.10 on linux)" generated="{_format_timestamp(start)}" rpa="false">\n')
+    f.write('<suite id="s1" name="Basic Test Suites" source="/robot-systest/testsuite">\n')
+
+    for suite in range(1, suites + 1):
+        suite_id = f's1-s{suite}'
+        suite_name = f'Suite {suite:03d} {rng.choice(_OBJECTS)}'
+        suite_start = clock.tick(rng)
+        f.write(f'<suite id="{suite_id}" name={quoteattr(suite_name)} source="/robot-systest/testsuite/suite_{suite:03d}.robot">\n')
+
+        passed = failed = 0
+        for test in range(1, tests + 1):
+            test_fails = rng.random() < fail_ratio
+            failing_keyword = rng.randrange(keywords) if test_fails else -1
+            test_start = clock.tick(rng)
+            f.write(f'<test id="{suite_id}-t{test}" name="Test {test:03d} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}">\n')
+            _write_keyword(f, rng, clock, depth, depth, False, keyword_type='setup')
+            keywords_written += 1
+            for keyword in range(keywords):
+                _write_keyword(f, rng, clock, 1, depth, keyword == failing_keyword)
+                keywords_written += 1
+                # Once a keyword fails, the remaining ones are not run, as in Robot
+                if keyword == failing_keyword:
+                    break
+            f.write('<tags>\n<tag>sanity</tag>\n<tag>regression</tag>\n</tags>\n')
+            _write_status(f, 'FAIL' if test_fails else 'PASS', test_start, clock.tick(rng), 'Synthetic failure' if test_fails else None)
+            f.write('</test>\n')
+            passed += not test_fails
+            failed += test_fails
+
+        f.write('<doc>Synthetic test suite.</doc>\n')
+        _write_status(f, 'FAIL' if failed else 'PASS', suite_start, clock.tick(rng))
+        f.write('</suite>\n')
+        suite_stats.append((suite_id, suite_name, passed, failed))
+
+    total_passed = sum(stat[2] for stat in suite_stats)
+    total_failed = sum(stat[3] for stat in suite_stats)
+    _write_status(f, 'FAIL' if total_failed else 'PASS', start, clock.tick(rng))
+    f.write('</suite>\n')
+
+    # Statistics, with the same layout as in real reports (the first row of the suites summarizes all of them)
+    f.write('<statistics>\n<total>\n')
+    f.write(f'<stat pass="{total_passed}" fail="{total_failed}">Critical Tests</stat>\n')
+    f.write(f'<stat pass="{total_passed}" fail="{total_failed}">All Tests</stat>\n')
+    f.write('</total>\n<tag>\n')
+    f.write(f'<stat pass="{total_passed}" fail="{total_failed}">sanity</stat>\n')
+    f.write('</tag>\n<suite>\n')
+    f.write(f'<stat pass="{total_passed}" fail="{total_failed}" id="s1" name="Basic Test Suites">Basic Test Suites</stat>\n')
+    for suite_id, suite_name, passed, failed in suite_stats:
+        f.write(f'<stat pass="{passed}" fail="{failed}" id="{suite_id}" name={quoteattr(suite_name)}>Basic Test Suites.{escape(suite_name)}</stat>\n')
+    f.write('</suite>\n</statistics>\n<errors>\n</errors>\n</robot>\n')
+
+    return {
+        'suites': suites,
+        'tests': suites * tests,
+        'keywords': keywords_written,
+    }
+
+
+def generate_robot_report(path, **kwargs):
+    '''
+    Same as `write_robot_report`, but the report is saved to the file `path`:
+
+    def generate_robot_report(path, **kwargs)
+    '''
+    with open(path, 'w', encoding='utf-8') as robot_report_file:
+        return write_robot_report(robot_report_file, **kwargs)
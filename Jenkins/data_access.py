@@ -0,0 +1,326 @@
+# Typed access to the tables of the ETL, shared by the report notebooks
+#
+# Queries are parameterized, the window of dates and the list of jobs are filtered by the database,
+# and results are streamed in chunks whose data types are fixed as they arrive (e.g., strings are
+# turned into categories), so that only a chunk of raw rows is held in memory at a time
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date, DateTime
+
+
+# Rows read from the database at a time
+DEFAULT_CHUNKSIZE = 50000
+
+# Data types of the columns of each kind of table. Columns not listed are kept as read
+COLUMN_TYPES = {
+    'builds': {
+        'job': 'category',
+        'timestamp': 'datetime',
+        'duration': 'timedelta',
+        'build_result': 'category',
+        'test_result': 'category',
+    },
+    'reports': {
+        'timestamp': 'datetime',
+        'job': 'category',
+        'build': 'int64',
+        'id': 'category',
+        'name': 'category',
+        'source': 'category',
+        'starttime': 'datetime',
+        'endtime': 'datetime',
+        'status': 'category',
+        'failed_test_id': 'category',
+        'failed_test_name': 'category',
+        'failed_keyword': 'category',
+    },
+    'details': {
+        'timestamp': 'datetime',
+        'job': 'category',
+        # Build numbers are saved as text in the flat schema, but they are joined with those of the basic reports
+        'build': 'int64',
+        'suite_id': 'category',
+        'suite_name': 'category',
+        'test_id': 'category',
+        'test_name': 'category',
+        'keyword_name': 'category',
+        'status': 'category',
+        'starttime': 'datetime',
+        'endtime': 'datetime',
+    },
+    'daily': {
+        'day': 'datetime',
+        'job': 'category',
+    },
+}
+
+
+def fix_types(df, kind):
+    '''
+    Fixes the data types of the columns of a dataframe read from a kind of table (see `COLUMN_TYPES`):
+
+    def fix_types(df, kind)
+    '''
+    for column, column_type in COLUMN_TYPES[kind].items():
+        if column not in df.columns:
+            continue
+        if column_type == 'datetime':
+            # Some backends (e.g., DuckDB) return timestamps in microseconds
+            df[column] = pd.to_datetime(df[column]).astype('datetime64[ns]')
+        elif column_type == 'timedelta':
+            # Durations are saved in milliseconds
+            df[column] = pd.to_timedelta(df[column].astype('float')*1000, unit='us')
+        else:
+            df[column] = df[column].astype(column_type)
+    return df
+
+
+def _concat_chunks(chunks):
+    # Each chunk has its own categories, which are merged (and sorted, as if the whole column had
+    # been converted at once) so that the columns are still categorical after the concatenation
+    for column in chunks[0].select_dtypes('category').columns:
+        categories = union_categoricals([chunk[column] for chunk in chunks], sort_categories=True).categories
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_sql_typed(engine, query, kind, params=None, chunksize=DEFAULT_CHUNKSIZE):
+    '''
+    Runs a query and returns its results as a dataframe, with the data types of a kind of table
+    (see `COLUMN_TYPES`). Results are streamed in chunks, and their types are fixed chunk by chunk:
+
+    def read_sql_typed(engine, query, kind, params=None, chunksize=DEFAULT_CHUNKSIZE)
+
+    - query: SQLAlchemy `text` query, with its parameters bound (e.g., with `bindparams`).
+    - params: values of the parameters of the query.
+    - chunksize: rows read from the database at a time.
+    '''
+    # Server-side cursors (when supported) avoid buffering the whole result in the client
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        chunks = [fix_types(chunk, kind) for chunk in pd.read_sql(query, con=conn, params=params, chunksize=chunksize)]
+
+    # Empty results are still read as a (single) empty chunk
+    return chunks[0] if len(chunks) == 1 else _concat_chunks(chunks)
+
+
+def _build_filters(alias, too_old_builds, first_date=None, last_date=None, jobs=None):
+    # Conditions on the builds of the table `alias` (with their parameters), for the `WHERE` of a query
+    conditions = [f'{alias}.timestamp > :too_old_builds']
+    parameters = [bindparam('too_old_builds', pd.Timestamp(too_old_builds).to_pydatetime(), type_=DateTime())]
+    if first_date is not None:
+        conditions.append(f'{alias}.timestamp >= :first_date')
+        parameters.append(bindparam('first_date', pd.Timestamp(first_date).to_pydatetime(), type_=DateTime()))
+    if last_date is not None:
+        # Needs to include latest hour of the last day
+        conditions.append(f'{alias}.timestamp < :end_date')
+        parameters.append(bindparam('end_date', (pd.Timestamp(last_date) + pd.Timedelta(days=1)).to_pydatetime(), type_=DateTime()))
+    if jobs is not None:
+        conditions.append(f'{alias}.job IN :jobs')
+        parameters.append(bindparam('jobs', list(jobs), expanding=True))
+    return ' AND '.join(conditions), parameters
+
+
+# Builds and Robot reports of a period
+
+def load_known_builds(
+        engine,
+        too_old_builds='1980-12-15',
+        first_date=None,
+        last_date=None,
+        jobs=None,
+        table_known_builds='builds_info',
+        chunksize=DEFAULT_CHUNKSIZE
+    ):
+    '''
+    Retrieves the builds not older than a date, with their data types fixed:
+
+    def load_known_builds(engine, too_old_builds='1980-12-15', first_date=None, last_date=None, jobs=None, table_known_builds='builds_info', chunksize=DEFAULT_CHUNKSIZE)
+
+    - too_old_builds: builds older than this date are never read. By default, it does not limit in practice (1980!).
+    - first_date: first day of the builds to read (e.g., '2024-12-15'). By default, unconstrained.
+    - last_date: last day of the builds to read (included). By default, unconstrained.
+    - jobs: list of jobs to read. By default, all of them.
+    '''
+    conditions, parameters = _build_filters('main', too_old_builds, first_date, last_date, jobs)
+    query_known_builds = text(f'''
+    SELECT main.*
+    FROM {table_known_builds} AS main
+    WHERE {conditions}
+    ORDER BY main.job, main.build
+    ''').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_known_builds, 'builds', chunksize=chunksize)
+
+
+def load_all_build_reports(
+        engine,
+        too_old_builds='1980-12-15',
+        first_date=None,
+        last_date=None,
+        jobs=None,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        chunksize=DEFAULT_CHUNKSIZE
+    ):
+    '''
+    Retrieves the results per test suite of the builds not older than a date, along with the timestamp of their build.
+    Arguments are the same as in `load_known_builds`:
+
+    def load_all_build_reports(engine, too_old_builds='1980-12-15', first_date=None, last_date=None, jobs=None, table_known_builds='builds_info', table_robot_reports='robot_reports', chunksize=DEFAULT_CHUNKSIZE)
+    '''
+    conditions, parameters = _build_filters('main', too_old_builds, first_date, last_date, jobs)
+    query_robot_reports = text(f'''
+    SELECT main.timestamp, details.*
+    FROM {table_robot_reports} AS details
+    INNER JOIN {table_known_builds} AS main
+    ON details.job=main.job AND details.build=main.build
+    WHERE {conditions}
+    ORDER BY details.job, details.build, details.starttime
+    ''').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_robot_reports, 'reports', chunksize=chunksize)
+
+
+def load_all_build_reports_details(
+        engine,
+        too_old_builds='1980-12-15',
+        first_date=None,
+        last_date=None,
+        jobs=None,
+        table_known_builds='builds_info',
+        table_robot_reports_extended='robot_reports_extended',
+        chunksize=DEFAULT_CHUNKSIZE
+    ):
+    '''
+    Retrieves the results per keyword of the builds not older than a date, along with the timestamp of their build.
+    Arguments are the same as in `load_known_builds`:
+
+    def load_all_build_reports_details(engine, too_old_builds='1980-12-15', first_date=None, last_date=None, jobs=None, table_known_builds='builds_info', table_robot_reports_extended='robot_reports_extended', chunksize=DEFAULT_CHUNKSIZE)
+    '''
+    conditions, parameters = _build_filters('main', too_old_builds, first_date, last_date, jobs)
+    query_robot_reports_extended = text(f'''
+    SELECT main.timestamp, details.*
+    FROM {table_robot_reports_extended} AS details
+    INNER JOIN {table_known_builds} AS main
+    ON details.job=main.job AND details.build=main.build
+    WHERE {conditions}
+    ORDER BY details.job, details.build, details.starttime
+    ''').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_robot_reports_extended, 'details', chunksize=chunksize)
+
+
+def load_daily_summary(engine, table, first_date, last_date, jobs=None):
+    '''
+    Retrieves the rows of a daily summary table maintained by the ETL between two dates (both included):
+
+    def load_daily_summary(engine, table, first_date, last_date, jobs=None)
+
+    - jobs: list of jobs to read. By default, all of them.
+    '''
+    conditions = ['day >= :first_date', 'day <= :last_date']
+    parameters = [
+        bindparam('first_date', pd.Timestamp(first_date).date(), type_=Date()),
+        bindparam('last_date', pd.Timestamp(last_date).date(), type_=Date()),
+    ]
+    if jobs is not None:
+        conditions.append('job IN :jobs')
+        parameters.append(bindparam('jobs', list(jobs), expanding=True))
+    query_daily_summary = text(f'SELECT * FROM {table} WHERE {" AND ".join(conditions)} ORDER BY job, day').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_daily_summary, 'daily')
+
+
+# Latest build of each job
+
+def _latest_builds(table_known_builds, conditions):
+    # Subquery with the timestamp of the latest build of each job
+    return f'''
+    INNER JOIN (
+        SELECT latest.job, MAX(latest.timestamp) AS ts
+        FROM {table_known_builds} AS latest
+        WHERE {conditions}
+        GROUP BY latest.job
+    ) AS latest_build
+    ON main.job=latest_build.job AND main.timestamp=latest_build.ts
+    '''
+
+
+def load_latest_builds_all_jobs(engine, too_old_builds='1980-12-15', jobs=None, table_known_builds='builds_info'):
+    '''
+    From each of the known jobs, retrieves their latest build.
+    Returns a dataframe with a row per job.
+
+    Usage:
+
+    load_latest_builds_all_jobs(engine, too_old_builds='1980-12-15', jobs=None, table_known_builds='builds_info')
+
+    - `engine`: Database engine to use for the connection.
+    - `too_old_builds`: Limits the query to builds not older than a date. By default, it does not limit in practice (1980!).
+    - `jobs`: Limits the query to a list of jobs. By default, all of them.
+    '''
+    conditions, parameters = _build_filters('latest', too_old_builds, jobs=jobs)
+    query_latest_builds = text(f'''
+    SELECT main.*
+    FROM {table_known_builds} AS main
+    {_latest_builds(table_known_builds, conditions)}
+    ORDER BY main.job
+    ''').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_latest_builds, 'builds')
+
+
+def load_latest_report_all_jobs(engine, too_old_builds='1980-12-15', jobs=None, table_known_builds='builds_info', table_robot_reports='robot_reports'):
+    '''
+    From each of the known jobs, retrieves the report from their latest build.
+    Returns a dataframe with a row per suite per job (in case the latest build of the job generated a report).
+
+    Usage:
+
+    load_latest_report_all_jobs(engine, too_old_builds='1980-12-15', jobs=None, table_known_builds='builds_info', table_robot_reports='robot_reports')
+
+    - `engine`: Database engine to use for the connection.
+    - `too_old_builds`: Limits the query to builds not older than a date. By default, it does not limit in practice (1980!).
+    - `jobs`: Limits the query to a list of jobs. By default, all of them.
+    '''
+    conditions, parameters = _build_filters('latest', too_old_builds, jobs=jobs)
+    query_robot_reports = text(f'''
+    SELECT details.*
+    FROM {table_robot_reports} AS details
+    INNER JOIN {table_known_builds} AS main
+    ON details.job=main.job AND details.build=main.build
+    {_latest_builds(table_known_builds, conditions)}
+    ORDER BY details.job, details.build, details.starttime
+    ''').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_robot_reports, 'reports')
+
+
+def load_latest_extended_report_all_jobs(engine, too_old_builds='1980-12-15', jobs=None, table_known_builds='builds_info', table_robot_reports_extended='robot_reports_extended'):
+    '''
+    From each of the known jobs, retrieves the extended report from their latest build.
+    Returns a dataframe with a row per test per suite per job (in case the latest build of the job generated a report).
+
+    Usage:
+
+    load_latest_extended_report_all_jobs(engine, too_old_builds='1980-12-15', jobs=None, table_known_builds='builds_info', table_robot_reports_extended='robot_reports_extended')
+
+    - `engine`: Database engine to use for the connection.
+    - `too_old_builds`: Limits the query to builds not older than a date. By default, it does not limit in practice (1980!).
+    - `jobs`: Limits the query to a list of jobs. By default, all of them.
+    '''
+    conditions, parameters = _build_filters('latest', too_old_builds, jobs=jobs)
+    query_robot_reports = text(f'''
+    SELECT details.*
+    FROM {table_robot_reports_extended} AS details
+    INNER JOIN {table_known_builds} AS main
+    ON details.job=main.job AND details.build=main.build
+    {_latest_builds(table_known_builds, conditions)}
+    ORDER BY details.job, details.build, details.starttime
+    ''').bindparams(*parameters)
+
+    return read_sql_typed(engine, query_robot_reports, 'details')
@@ -0,0 +1,202 @@
+# Instrumentation of the ETL: durations per stage, counters and latencies of HTTP requests
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import requests
+
+
+# Upper bounds (in seconds) of the buckets of the histograms of HTTP latencies
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + '}' if labels else ''
+
+
+class EtlMetrics:
+    '''
+    Thread-safe collector of the metrics of a run of the ETL. All of them are labelled
+    with the job they refer to (if any):
+    - Stages: total time spent (and number of times entered) in each stage (e.g., `parse`, `write`).
+    - Counters: e.g., bytes downloaded or rows written (with extra labels, such as the table).
+    - Requests: number, errors and histogram of latencies of the HTTP requests, per endpoint.
+
+    metrics = EtlMetrics()
+
+    The metrics can be saved as a JSON summary (`write_json`) or pushed to a Prometheus
+    Pushgateway (`push_to_gateway`).
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Discards all the metrics collected so far, and restarts the clock of the run.
+        '''
+        with self._lock:
+            self._started_at = datetime.now(timezone.utc)
+            self._start = time.perf_counter()
+            self._stages = {}
+            self._counters = {}
+            self._requests = {}
+
+    def add_time(self, stage, seconds, job=None):
+        '''
+        Adds a duration (in seconds) to a stage.
+        '''
+        with self._lock:
+            totals = self._stages.setdefault((job, stage), [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    @contextmanager
+    def stage(self, stage, job=None):
+        '''
+        Context manager that adds the time spent inside the `with` block to a stage.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start, job=job)
+
+    def count(self, name, value=1, job=None, **labels):
+        '''
+        Increases a counter (e.g., `count('rows_written', 100, job=job_name, table='robot_reports')`).
+        '''
+        key = (job, name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_request(self, endpoint, seconds, job=None, error=False):
+        '''
+        Records an HTTP request and its latency (in seconds).
+        '''
+        with self._lock:
+            request = self._requests.setdefault((job, endpoint), {
+                'count': 0,
+                'errors': 0,
+                'seconds': 0.0,
+                'max_seconds': 0.0,
+                'buckets': [0] * len(LATENCY_BUCKETS)
+            })
+            request['count'] += 1
+            request['errors'] += int(error)
+            request['seconds'] += seconds
+            request['max_seconds'] = max(request['max_seconds'], seconds)
+            for i, upper_bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= upper_bound:
+                    request['buckets'][i] += 1
+
+    @contextmanager
+    def request(self, endpoint, job=None):
+        '''
+        Context manager that records the request sent inside the `with` block (it is
+        counted as an error if an exception is raised).
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.add_request(endpoint, time.perf_counter() - start, job=job, error=True)
+            raise
+        self.add_request(endpoint, time.perf_counter() - start, job=job)
+
+    def summary(self):
+        '''
+        Dictionary with all the metrics collected so far (as saved by `write_json`).
+        '''
+        with self._lock:
+            return {
+                'started_at': self._started_at.isoformat(),
+                'elapsed_seconds': time.perf_counter() - self._start,
+                'stages': [
+                    {'job': job, 'stage': stage, 'seconds': seconds, 'count': count}
+                    for (job, stage), (seconds, count) in self._stages.items()
+                ],
+                'counters': [
+                    {'job': job, 'name': name, **dict(labels), 'value': value}
+                    for (job, name, labels), value in self._counters.items()
+                ],
+                'requests': [
+                    {
+                        'job': job,
+                        'endpoint': endpoint,
+                        **{k: v for k, v in request.items() if k != 'buckets'},
+                        'buckets': dict(zip([str(upper_bound) for upper_bound in LATENCY_BUCKETS], request['buckets']))
+                    }
+                    for (job, endpoint), request in self._requests.items()
+                ],
+            }
+
+    def write_json(self, path):
+        '''
+        Saves the summary of the metrics to a JSON file.
+        '''
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_prometheus(self, prefix='osm_etl'):
+        '''
+        Metrics in the text format of Prometheus. Jobs are labelled as `jenkins_job`,
+        since `job` is reserved by the Pushgateway.
+        '''
+        summary = self.summary()
+        lines = [
+            f'# TYPE {prefix}_run_duration_seconds gauge',
+            f'{prefix}_run_duration_seconds {summary["elapsed_seconds"]}',
+            f'# TYPE {prefix}_stage_duration_seconds gauge',
+        ]
+        for stage in summary['stages']:
+            labels = _format_labels([('jenkins_job', stage['job'] or ''), ('stage', stage['stage'])])
+            lines.append(f'{prefix}_stage_duration_seconds{labels} {stage["seconds"]}')
+
+        for name in sorted({counter['name'] for counter in summary['counters']}):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for counter in summary['counters']:
+                if counter['name'] == name:
+                    extra_labels = [(k, v) for k, v in counter.items() if k not in ['job', 'name', 'value']]
+                    labels = _format_labels([('jenkins_job', counter['job'] or '')] + extra_labels)
+                    lines.append(f'{prefix}_{name}_total{labels} {counter["value"]}')
+
+        lines.append(f'# TYPE {prefix}_http_request_duration_seconds histogram')
+        for request in summary['requests']:
+            labels = [('jenkins_job', request['job'] or ''), ('endpoint', request['endpoint'])]
+            for upper_bound, count in request['buckets'].items():
+                lines.append(f'{prefix}_http_request_duration_seconds_bucket{_format_labels(labels + [("le", upper_bound)])} {count}')
+            lines.append(f'{prefix}_http_request_duration_seconds_bucket{_format_labels(labels + [("le", "+Inf")])} {request["count"]}')
+            lines.append(f'{prefix}_http_request_duration_seconds_sum{_format_labels(labels)} {request["seconds"]}')
+            lines.append(f'{prefix}_http_request_duration_seconds_count{_format_labels(labels)} {request["count"]}')
+        lines.append(f'# TYPE {prefix}_http_request_errors_total counter')
+        for request in summary['requests']:
+            labels = [('jenkins_job', request['job'] or ''), ('endpoint', request['endpoint'])]
+            lines.append(f'{prefix}_http_request_errors_total{_format_labels(labels)} {request["errors"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def push_to_gateway(self, gateway_url, job='jenkins_robot_etl', timeout=30):
+        '''
+        Pushes the metrics to a Prometheus Pushgateway (or compatible endpoint), replacing
+        the former metrics of the same `job`.
+        '''
+        response = requests.put(
+            f"{gateway_url.rstrip('/')}/metrics/job/{job}",
+            data=self.to_prometheus().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4'},
+            timeout=timeout
+        )
+        response.raise_for_status()
+
+
+# Metrics of the current run of the ETL, shared by all modules
+metrics = EtlMetrics()
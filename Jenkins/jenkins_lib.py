@@ -1,8 +1,28 @@
 # High-level library to handle communications with Jenkins
 
+import io
 import jenkins
+import json
+import multiprocessing
 import pandas as pd
 import requests
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from itertools import islice
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from etl_metrics import metrics
+
+
+# Key data kept from each build
+RELEVANT_BUILD_FIELDS = ['id', 'number', 'result', 'duration', 'estimatedDuration', 'timestamp', 'url']
+
+# Semaphores that cap the number of in-flight requests per Jenkins server (indexed by server URL)
+_in_flight_limits = {}
 
 
 def test_jenkins_connection(server):
@@ -20,6 +40,90 @@ def test_jenkins_connection(server):
     print(f'Hello {user["fullName"]} from Jenkins {version}')
 
 
+def setup_connection_pool(server, pool_size, max_in_flight=None, retries=3):
+    '''
+    Prepares the Jenkins server handler to be shared by several threads. All the
+    requests will reuse the same HTTP session, with a pool of up to `pool_size`
+    persistent connections, and no more than `max_in_flight` requests will be
+    sent to the server at the same time:
+
+    def setup_connection_pool(server, pool_size, max_in_flight=None, retries=3)
+
+    - server: handler of Jenkins server.
+    - pool_size: number of connections kept alive in the pool.
+    - max_in_flight: maximum number of concurrent requests to the server. If not set, equals `pool_size`.
+    '''
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, backoff_factor=0.1)
+    )
+    # Requests picks the adapter with the longest matching prefix, so it is mounted on the URL of the
+    # server (mounting it on the bare scheme would leave the default `https://` adapter in use)
+    server._session.mount(server.server.rstrip('/') + '/', adapter)
+    _in_flight_limits[server.server] = threading.BoundedSemaphore(max_in_flight or pool_size)
+
+
+def in_flight_slot(server):
+    '''
+    Context manager that waits for a free slot before sending a request to the
+    Jenkins server (only applies if `setup_connection_pool` set a limit for it):
+
+    def in_flight_slot(server)
+    '''
+    return _in_flight_limits.get(server.server) or nullcontext()
+
+
+@contextmanager
+def jenkins_request(server, endpoint, job_name=None):
+    '''
+    Context manager that wraps a request to the Jenkins server: waits for a free slot
+    (see `in_flight_slot`) and records the latency of the request in the ETL metrics:
+
+    def jenkins_request(server, endpoint, job_name=None)
+
+    - endpoint: kind of request, used to label the metrics (e.g., 'build_info').
+    '''
+    with in_flight_slot(server), metrics.request(endpoint, job=job_name):
+        yield
+
+
+def map_in_order(func, items, workers=1, processes=False):
+    '''
+    Applies `func` to each of the `items` with a pool of `workers` threads and yields
+    the results in the same order as the items. Only a bounded number of items is
+    processed ahead of the consumer, so that memory does not grow with the number
+    of items. With `workers=1`, it is equivalent to the builtin `map`:
+
+    def map_in_order(func, items, workers=1, processes=False)
+
+    - processes: if `True`, a pool of `workers` processes is used instead (for CPU-bound
+    functions). Then, `func`, the items and the results must be picklable. Processes are
+    forked, so this is only available where `fork` is (e.g., Linux); otherwise, threads are used.
+    '''
+    if workers <= 1 and not processes:
+        yield from map(func, items)
+        return
+
+    if processes and 'fork' in multiprocessing.get_all_start_methods():
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+        # Worker processes are started before pulling any item, since items may be produced by
+        # other threads (e.g., downloads), and forking a process while threads run is unsafe
+        executor.submit(int).result()
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    items = iter(items)
+    with executor:
+        pending = deque(executor.submit(func, item) for item in islice(items, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            for item in islice(items, 1):
+                pending.append(executor.submit(func, item))
+            yield result
+
+
 def get_all_jenkins_jobs_as_df(server):
     '''
     Retrieves the list of jobs that exist in the Jenkins server:
@@ -39,7 +143,8 @@ def get_job_summary(server, job_name):
     '''
 
     # Obtains all the raw information about the job:
-    my_job = server.get_job_info(job_name, 0, True)
+    with jenkins_request(server, 'job_info', job_name):
+        my_job = server.get_job_info(job_name, 0, True)
 
     job_fields = [key for key in my_job]
 
@@ -66,7 +171,8 @@ def get_job_health(server, job_name):
 
     def get_job_health(server, job_name)
     '''
-    my_job = server.get_job_info(job_name, 0, True)
+    with jenkins_request(server, 'job_info', job_name):
+        my_job = server.get_job_info(job_name, 0, True)
     return my_job.get('healthReport')
 
 
@@ -76,10 +182,50 @@ def get_all_job_builds(server, job_name):
 
     def get_all_job_builds(server, job_name)
     '''
-    my_job = server.get_job_info(job_name, 0, True)
+    with jenkins_request(server, 'job_info', job_name):
+        my_job = server.get_job_info(job_name, 0, True)
     return pd.DataFrame(my_job.get('builds')).drop(columns='_class')
 
 
+def get_job_url(server, job_name):
+    '''
+    URL of a job in the Jenkins server, also for jobs inside folders (e.g., `osm-stage_3-merge/master`):
+
+    def get_job_url(server, job_name)
+    '''
+    return server.server.rstrip('/') + '/' + ''.join(f'job/{quote(part)}/' for part in job_name.split('/'))
+
+
+def get_all_job_builds_summaries(server, job_name, page_size=1000):
+    '''
+    Retrieves the summary of all the historical builds of the job, with the same fields
+    as `get_build_summary`, as a Pandas dataframe. Requests to the JSON API of Jenkins
+    are restricted (with `tree=`) to the relevant fields and paged through `allBuilds`,
+    so that a single request per `page_size` builds is needed:
+
+    def get_all_job_builds_summaries(server, job_name, page_size=1000)
+    '''
+    builds_tree = f"allBuilds[{','.join(RELEVANT_BUILD_FIELDS)}]"
+    url_all_builds = get_job_url(server, job_name) + 'api/json?tree=' + builds_tree
+
+    builds = []
+    known_numbers = set()
+    while True:
+        page = f'{{{len(builds)},{len(builds) + page_size}}}'
+        with jenkins_request(server, 'all_builds', job_name):
+            page_builds = json.loads(server.jenkins_open(requests.Request('GET', url_all_builds + page))).get('allBuilds', [])
+        new_builds = [build for build in page_builds if build.get('number') not in known_numbers]
+        known_numbers.update(build.get('number') for build in new_builds)
+        builds.extend(new_builds)
+
+        # The last page is incomplete. If the range is not supported by the server, all builds come at once,
+        # and a page with no new builds means that the same list was returned again
+        if len(page_builds) != page_size or not new_builds:
+            break
+
+    return pd.DataFrame(builds, columns=RELEVANT_BUILD_FIELDS)
+
+
 def get_build_summary(server, job_name, build_number):
     '''
     Retrieves all the information about a specific build:
@@ -87,19 +233,124 @@ def get_build_summary(server, job_name, build_number):
     def get_build_summary(server, job_name, build_number)
     '''
     # Retrieves raw build data
-    build_info = server.get_build_info(job_name, build_number)
+    with jenkins_request(server, 'build_info', job_name):
+        build_info = server.get_build_info(job_name, build_number)
 
     # Summary of key data of the build
-    relevant_build_fields = ['id', 'number', 'result', 'duration', 'estimatedDuration', 'timestamp', 'url']
-    return {k: build_info.get(k, None) for k in relevant_build_fields}
+    return {k: build_info.get(k, None) for k in RELEVANT_BUILD_FIELDS}
 
 
-def get_robot_report(server, job_name, build_number):
+def get_robot_report(server, job_name, build_number, build_url=None):
     '''
     Retrieves the contents of the report file of a given build of a job:
 
-    def get_robot_report(server, job_name, build_number)
+    def get_robot_report(server, job_name, build_number, build_url=None)
+
+    - build_url: URL of the build, if already known (otherwise, it is requested to Jenkins).
     '''
-    robot_results_url = get_build_summary(server, job_name, build_number)['url'] + 'robot/report/output.xml'
+    build_url = build_url or get_build_summary(server, job_name, build_number)['url']
+    robot_results_url = build_url + 'robot/report/output.xml'
     req = requests.Request('POST',  robot_results_url)
-    return server.jenkins_open(req)
+    with jenkins_request(server, 'robot_report', job_name):
+        return server.jenkins_open(req)
+
+
+class RobotReportStream(io.RawIOBase):
+    '''
+    Read-only file object over the body of an HTTP response. The body is downloaded in
+    chunks as it is read (transparently decoded if it was compressed by the server) and,
+    optionally, copied to a spool file and/or to another file object at the same time.
+    The number of bytes received and the time spent waiting for them are kept in
+    `bytes_read` and `read_seconds`.
+    '''
+
+    def __init__(self, response, chunk_size=64*1024, spool_to=None, copy_to=None, on_close=None):
+        self._response = response
+        self._on_close = on_close
+        self._chunks = response.iter_content(chunk_size=chunk_size)
+        self._pending = memoryview(b'')
+        self._spool = open(spool_to, 'wb') if spool_to else None
+        self._copy = copy_to
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Waits for the next (non-empty) chunk, unless the response is exhausted
+        while not self._pending:
+            start = time.perf_counter()
+            chunk = next(self._chunks, None)
+            self.read_seconds += time.perf_counter() - start
+            if chunk is None:
+                return 0
+            self.bytes_read += len(chunk)
+            self._pending = memoryview(chunk)
+            if self._spool:
+                self._spool.write(chunk)
+            if self._copy:
+                self._copy.write(chunk)
+
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+            if self._spool:
+                self._spool.close()
+            if self._on_close:
+                self._on_close(self)
+        super().close()
+
+
+def get_robot_report_stream(server, job_name, build_number, build_url=None, spool_to=None, copy_to=None, chunk_size=64*1024):
+    '''
+    Opens the report file of a given build of a job as a stream, so that it can be
+    parsed while it is downloaded, without keeping the whole contents in memory:
+
+    def get_robot_report_stream(server, job_name, build_number, build_url=None, spool_to=None, copy_to=None, chunk_size=64*1024)
+
+    - build_url: URL of the build, if already known (otherwise, it is requested to Jenkins).
+    - spool_to: if set, name of the file where a copy of the report is saved.
+    - copy_to: if set, binary file object where a copy of the report is written.
+
+    The result is a file object that must be closed after use (e.g., with a `with` statement).
+    '''
+    build_url = build_url or get_build_summary(server, job_name, build_number)['url']
+    robot_results_url = build_url + 'robot/report/output.xml'
+    req = requests.Request('POST',  robot_results_url, headers={'Accept-Encoding': 'gzip'})
+
+    # The slot for in-flight requests is kept until the stream is closed
+    with ExitStack() as stack:
+        stack.enter_context(in_flight_slot(server))
+        with metrics.request('robot_report', job=job_name):
+            response = server.jenkins_open_stream(req)
+        release_slot = stack.pop_all().close
+
+    # Once the download finishes, its size and duration are added to the ETL metrics
+    def on_close(stream):
+        release_slot()
+        metrics.count('bytes_downloaded', stream.bytes_read, job=job_name)
+        metrics.add_time('download', stream.read_seconds, job=job_name)
+
+    return RobotReportStream(response, chunk_size=chunk_size, spool_to=spool_to, copy_to=copy_to, on_close=on_close)
+
+
+def get_build_summary_and_robot_report(server, job_name, build_number):
+    '''
+    Retrieves both the summary of a build and the contents of its Robot report. If
+    the report does not exist, `None` is returned in its place:
+
+    def get_build_summary_and_robot_report(server, job_name, build_number)
+    '''
+    build_info = get_build_summary(server, job_name, build_number)
+    try:
+        robot_report_contents = get_robot_report(server, job_name, build_number, build_url=build_info['url'])
+    except jenkins.NotFoundException:
+        robot_report_contents = None
+
+    return build_info, robot_report_contents
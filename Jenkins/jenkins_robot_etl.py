@@ -6,9 +6,1203 @@ import jenkins
 from jenkins_lib import *
 from robot_lib import *
 from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy import bindparam
 from sqlalchemy import text
-from sqlalchemy.types import BigInteger, String, Float, DateTime, Integer
-import warnings
+from sqlalchemy import event
+from sqlalchemy.types import BigInteger, String, Float, Date, DateTime, Integer
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+from functools import partial
+from report_cache import RobotReportCache
+from parquet_snapshot import update_parquet_snapshot_of_job
+from etl_metrics import metrics
+from run_length_lib import run_length_encode, extend_runs
+
+
+# Columns saved from each Robot report: results per suite (consolidated), and detailed results per keyword
+REPORT_COLUMNS = ['id', 'name', 'source', 'status', 'starttime', 'endtime', 'pass', 'fail', 'failed_test_id', 'failed_test_name', 'failed_keyword']
+DETAILS_COLUMNS = ['suite_id', 'suite_name', 'test_id', 'test_name', 'keyword_name', 'status', 'starttime', 'endtime']
+
+# Compact version of a Robot report, with just what the ETL saves (rows as arrays per column, plus totals), and
+# the time spent (in seconds) in each stage of its processing, so that it can be reported by the process that saves it
+CompactRobotReport = namedtuple('CompactRobotReport', ['report', 'details', 'test_result', 'pass_count', 'fail_count', 'timings'])
+
+
+def fetch_and_parse_build(jenkins_server, job_name, build_number, build_info=None, spool_to=None, report_cache=None, timings=None, keyword_depth=None):
+    '''
+    Retrieves the summary of a build and parses its Robot report while it is being
+    downloaded. If the report does not exist, `None` is returned in its place:
+
+    def fetch_and_parse_build(jenkins_server, job_name, build_number, build_info=None, spool_to=None, report_cache=None, timings=None, keyword_depth=None)
+
+    - build_info: summary of the build, if already known (otherwise, it is requested to Jenkins).
+    - spool_to: if set, name of the file where a copy of the report is saved.
+    - report_cache: if set, `RobotReportCache` where reports are looked up before downloading them, and saved afterwards.
+    - timings: if set, dictionary where the time spent parsing (excluding the wait for the download) is saved as 'parse'.
+    - keyword_depth: if set, depth of the tree of keywords that is walked to find the root cause of the failures (see `parse_robot_report`).
+    '''
+    build_info = build_info or get_build_summary(jenkins_server, job_name, build_number)
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+
+    # Reports already in the cache do not need to be downloaded again
+    if report_cache is not None and report_cache.contains(job_name, build_number):
+        metrics.count('cache_hits', job=job_name)
+        with report_cache.open(job_name, build_number) as robot_report_file:
+            report_frames = parse_robot_report(robot_report_file, keyword_depth=keyword_depth)
+        timings['parse'] = time.perf_counter() - start
+        return build_info, report_frames
+
+    try:
+        with ExitStack() as stack:
+            cache_file = stack.enter_context(report_cache.writer(job_name, build_number, build_info)) if report_cache is not None else None
+            robot_report_stream = stack.enter_context(
+                get_robot_report_stream(jenkins_server, job_name, build_number, build_url=build_info['url'], spool_to=spool_to, copy_to=cache_file)
+            )
+            report_frames = parse_robot_report(robot_report_stream, keyword_depth=keyword_depth)
+        timings['parse'] = time.perf_counter() - start - robot_report_stream.read_seconds
+    except jenkins.NotFoundException:
+        report_frames = None
+
+    return build_info, report_frames
+
+
+def df_to_columns(df, columns):
+    '''
+    Converts some columns of a dataframe to a dictionary of arrays (missing columns are
+    filled with `None`):
+
+    def df_to_columns(df, columns)
+    '''
+    return {
+        column: df[column].to_numpy() if column in df.columns else np.full(len(df), None, dtype='object')
+        for column in columns
+    }
+
+
+def compact_report_frames(report_frames, timings=None):
+    '''
+    Reduces the dataframes extracted from a Robot report to a `CompactRobotReport`,
+    which is cheap to pass between processes:
+
+    def compact_report_frames(report_frames, timings=None)
+
+    - timings: time spent in former stages (e.g., 'parse'), to which the time spent here is added as 'transform'.
+
+    If the tree of keywords was parsed, only the top-level keywords of the tests (not their control structures,
+    e.g., FOR loops) are kept in the detailed results, as if only the top-level keywords had been parsed.
+    '''
+    start = time.perf_counter()
+    df_build_report = consolidate_report_frames(report_frames, with_rca=True)
+    df_details = report_frames.details
+    if 'depth' in df_details.columns:
+        df_details = df_details.loc[(df_details.depth == 1) & df_details.test_id.notna() & ~df_details.keyword_type.isin(CONTROL_STRUCTURE_TAGS)]
+
+    compact_report = CompactRobotReport(
+        report=df_to_columns(df_build_report, REPORT_COLUMNS),
+        details=df_to_columns(df_details, DETAILS_COLUMNS),
+        # If any test is different from 'PASS', the whole build is marked as 'FAIL'
+        test_result='FAIL' if (df_build_report.status!='PASS').any() else 'PASS',
+        # Records the number of tests passed vs. failed
+        pass_count=df_build_report['pass'].sum(),
+        fail_count=df_build_report['fail'].sum(),
+        timings=dict(timings or {})
+    )
+    compact_report.timings['transform'] = time.perf_counter() - start
+    return compact_report
+
+
+def fetch_and_compact_build(jenkins_server, job_name, build_number, **kwargs):
+    '''
+    Same as `fetch_and_parse_build`, but the Robot report is returned as a `CompactRobotReport`:
+
+    def fetch_and_compact_build(jenkins_server, job_name, build_number, **kwargs)
+    '''
+    timings = {}
+    build_info, report_frames = fetch_and_parse_build(jenkins_server, job_name, build_number, timings=timings, **kwargs)
+    return build_info, compact_report_frames(report_frames, timings) if report_frames is not None else None
+
+
+def download_build(jenkins_server, job_name, build_number, download_folder, build_info=None, spool_to=None, report_cache=None):
+    '''
+    Retrieves the summary of a build and downloads its Robot report to a temporary file
+    in `download_folder`, to be parsed afterwards (e.g., in another process) with
+    `parse_downloaded_build`. If the report does not exist, `None` is returned in place
+    of the name of the file:
+
+    def download_build(jenkins_server, job_name, build_number, download_folder, build_info=None, spool_to=None, report_cache=None)
+    '''
+    build_info = build_info or get_build_summary(jenkins_server, job_name, build_number)
+    file_descriptor, robot_report_path = tempfile.mkstemp(suffix='.xml', dir=download_folder)
+
+    try:
+        with ExitStack() as stack, open(file_descriptor, 'wb') as robot_report_file:
+            # Reports already in the cache do not need to be downloaded again
+            if report_cache is not None and report_cache.contains(job_name, build_number):
+                metrics.count('cache_hits', job=job_name)
+                source = stack.enter_context(report_cache.open(job_name, build_number))
+            else:
+                cache_file = stack.enter_context(report_cache.writer(job_name, build_number, build_info)) if report_cache is not None else None
+                source = stack.enter_context(
+                    get_robot_report_stream(jenkins_server, job_name, build_number, build_url=build_info['url'], spool_to=spool_to, copy_to=cache_file)
+                )
+            shutil.copyfileobj(source, robot_report_file, 1024*1024)
+    except jenkins.NotFoundException:
+        os.remove(robot_report_path)
+        return build_info, None
+    except BaseException:
+        os.remove(robot_report_path)
+        raise
+
+    return build_info, robot_report_path
+
+
+def parse_downloaded_build(downloaded_build, keyword_depth=None):
+    '''
+    Parses the Robot report downloaded by `download_build` (and removes its file). It
+    is meant to run in a separate process, so it returns a `CompactRobotReport`:
+
+    def parse_downloaded_build(downloaded_build, keyword_depth=None)
+
+    - downloaded_build: tuple `(build_info, robot_report_path)`, as returned by `download_build`.
+    - keyword_depth: see `parse_robot_report`.
+    '''
+    build_info, robot_report_path = downloaded_build
+    if robot_report_path is None:
+        return build_info, None
+
+    try:
+        start = time.perf_counter()
+        with open(robot_report_path, 'rb') as robot_report_file:
+            report_frames = parse_robot_report(robot_report_file, keyword_depth=keyword_depth)
+        return build_info, compact_report_frames(report_frames, {'parse': time.perf_counter() - start})
+    finally:
+        os.remove(robot_report_path)
+
+
+def new_records_buffer(columns):
+    '''
+    Creates an empty buffer to accumulate the rows extracted from the reports of several
+    builds. Rows are kept as typed arrays per column, so that a single dataframe can be
+    built at the end with `records_buffer_to_df`:
+
+    def new_records_buffer(columns)
+    '''
+    return {'columns': {column: [] for column in columns}, 'builds': [], 'lengths': []}
+
+
+def append_to_records_buffer(buffer, df, build_number):
+    '''
+    Appends to a buffer of records the rows of a dataframe (or of a dictionary of arrays,
+    as returned by `df_to_columns`) extracted from the report of a build (missing columns
+    are filled with `None`):
+
+    def append_to_records_buffer(buffer, df, build_number)
+    '''
+    columns = df if isinstance(df, dict) else df_to_columns(df, buffer['columns'])
+    length = len(next(iter(columns.values()))) if columns else len(df)
+    for column, chunks in buffer['columns'].items():
+        chunks.append(columns[column] if column in columns else np.full(length, None, dtype='object'))
+    buffer['builds'].append(build_number)
+    buffer['lengths'].append(length)
+
+
+def records_buffer_to_df(buffer, job_name, dtypes=None):
+    '''
+    Builds a single dataframe with all the rows accumulated in a buffer of records,
+    adding the `job` and `build` columns and applying the requested data types:
+
+    def records_buffer_to_df(buffer, job_name, dtypes=None)
+    '''
+    df = pd.DataFrame({
+        column: np.concatenate(chunks) if chunks else np.array([], dtype='object')
+        for column, chunks in buffer['columns'].items()
+    })
+    df.insert(0, 'build', np.repeat(np.array(buffer['builds'], dtype='int'), buffer['lengths']))
+    df.insert(0, 'job', job_name)
+
+    return df.astype(dtypes or {})
+
+
+def load_known_builds_of_job(database_engine, job_name, table_known_builds='builds_info'):
+    '''
+    Retrieves from the database the builds of a job that are already known, along with
+    their result (if there is no table of known builds yet, it returns an empty dataframe):
+
+    def load_known_builds_of_job(database_engine, job_name, table_known_builds='builds_info')
+    '''
+    if not inspect(database_engine).has_table(table_known_builds):
+        return pd.DataFrame(columns=['job', 'build', 'build_result'])
+
+    query_known_builds = text(f'SELECT job, build, build_result FROM {table_known_builds} WHERE job = :job')
+    with database_engine.connect() as connection:
+        return pd.read_sql(query_known_builds, con=connection, params={'job': job_name})
+
+
+def create_known_builds_table(conn, table_known_builds='builds_info'):
+    '''
+    Creates the table of known builds if it does not exist yet, and guarantees that it
+    has a unique key on (job, build), so that the rows of each build can be upserted
+    while keeping their `auto_id`:
+
+    def create_known_builds_table(conn, table_known_builds='builds_info')
+    '''
+    is_mysql = conn.dialect.name == 'mysql'
+    unique_key = f'uq_{table_known_builds}_job_build'
+
+    if not inspect(conn).has_table(table_known_builds):
+        if is_mysql:
+            conn.execute(text(f"""
+                CREATE TABLE {table_known_builds} (
+                    auto_id BIGINT PRIMARY KEY AUTO_INCREMENT,
+                    job TEXT,
+                    build BIGINT,
+                    timestamp DATETIME,
+                    duration BIGINT,
+                    build_result TEXT,
+                    test_result TEXT,
+                    pass_count DOUBLE,
+                    fail_count DOUBLE
+                ) ENGINE=InnoDB;
+            """))
+        else:
+            conn.execute(text(f"""
+                CREATE TABLE {table_known_builds} (
+                    auto_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT,
+                    build BIGINT,
+                    timestamp DATETIME,
+                    duration BIGINT,
+                    build_result TEXT,
+                    test_result TEXT,
+                    pass_count FLOAT,
+                    fail_count FLOAT
+                );
+            """))
+
+    # Tables created by former versions do not have the unique key
+    existing_keys = [index['name'] for index in inspect(conn).get_indexes(table_known_builds)]
+    if unique_key not in existing_keys:
+        # MySQL can only index a prefix of TEXT columns
+        job_column = 'job(255)' if is_mysql else 'job'
+        conn.execute(text(f'CREATE UNIQUE INDEX {unique_key} ON {table_known_builds} ({job_column}, build)'))
+
+
+def upsert_known_builds(conn, df_builds, known_builds, table_known_builds='builds_info', dtype=None):
+    '''
+    Saves into the database the information about a set of builds of a job. Builds that
+    were already known are updated in place, while the new ones are inserted:
+
+    def upsert_known_builds(conn, df_builds, known_builds, table_known_builds='builds_info', dtype=None)
+
+    - df_builds: dataframe with the rows of the builds to save.
+    - known_builds: list of build numbers of the job that already exist in the database.
+    '''
+    is_known = df_builds.build.isin(known_builds)
+
+    # New builds are just appended
+    df_builds.loc[~is_known].to_sql(
+        name=table_known_builds,
+        con=conn,
+        if_exists='append',
+        index=False,
+        dtype=dtype,
+        method='multi'
+    )
+
+    # Known builds are updated (in a single statement executed for all of them)
+    df_updates = df_builds.loc[is_known]
+    if len(df_updates):
+        columns = [c for c in df_updates.columns if c not in ['job', 'build']]
+        update_query = text(
+            f"UPDATE {table_known_builds} SET {', '.join(f'{c} = :{c}' for c in columns)} WHERE job = :job AND build = :build"
+        ).bindparams(*[bindparam(c, type_=t) for c, t in (dtype or {}).items() if c in df_updates.columns])
+        rows = df_updates.astype('object').where(df_updates.notna(), None).to_dict('records')
+        for row in rows:
+            row['build'] = int(row['build'])
+        conn.execute(update_query, rows)
+
+
+def delete_build_reports(conn, job_name, build_numbers, tables):
+    '''
+    Removes from the tables of Robot reports the rows of a set of builds of a job, so
+    that they can be replaced by a fresh copy (for tables in the normalized schema, rows
+    are removed from their fact table):
+
+    def delete_build_reports(conn, job_name, build_numbers, tables)
+    '''
+    delete_queries = []
+    for table in tables:
+        if is_view(conn, table):
+            delete_queries.append(text(
+                f'DELETE FROM {table}_facts WHERE job_key IN (SELECT job_key FROM dim_jobs WHERE job = :job) AND build = :build'
+            ))
+        elif inspect(conn).has_table(table):
+            delete_queries.append(text(f'DELETE FROM {table} WHERE job = :job AND build = :build'))
+
+    rows = [{'job': job_name, 'build': int(build_number)} for build_number in build_numbers]
+    if rows:
+        for delete_query in delete_queries:
+            conn.execute(delete_query, rows)
+
+
+# Daily summary tables: (name of the table, unique key, columns with their SQL types). Days are those of the timestamps of the builds
+DAILY_SUMMARY_TABLES = {
+    'builds': (
+        ['job', 'day'],
+        [
+            ('job', 'TEXT'), ('day', 'DATE'), ('builds', 'BIGINT'),
+            ('build_success', 'BIGINT'), ('build_unstable', 'BIGINT'), ('build_failure', 'BIGINT'), ('build_other', 'BIGINT'),
+            ('test_pass', 'BIGINT'), ('test_fail', 'BIGINT'), ('test_unavailable', 'BIGINT'),
+            ('tests_passed', 'FLOAT'), ('tests_failed', 'FLOAT'), ('first_build', 'BIGINT'), ('last_build', 'BIGINT'),
+        ]
+    ),
+    'suites': (
+        ['job', 'suite', 'day'],
+        [
+            ('job', 'TEXT'), ('suite', 'TEXT'), ('day', 'DATE'), ('runs', 'BIGINT'),
+            ('suite_pass', 'BIGINT'), ('suite_fail', 'BIGINT'), ('tests_passed', 'FLOAT'), ('tests_failed', 'FLOAT'),
+        ]
+    ),
+}
+
+
+def create_daily_summary_tables(conn, table_builds_daily_summary='builds_daily_summary', table_suites_daily_summary='suites_daily_summary'):
+    '''
+    Creates (if they do not exist yet) the daily summary tables, with a unique key on
+    (job, day) and (job, suite, day), respectively:
+
+    def create_daily_summary_tables(conn, table_builds_daily_summary='builds_daily_summary', table_suites_daily_summary='suites_daily_summary')
+    '''
+    is_mysql = conn.dialect.name == 'mysql'
+
+    for table, (unique_columns, columns) in zip([table_builds_daily_summary, table_suites_daily_summary], DAILY_SUMMARY_TABLES.values()):
+        if inspect(conn).has_table(table):
+            continue
+        column_types = ', '.join(f"{column} {'DOUBLE' if is_mysql and column_type == 'FLOAT' else column_type}" for column, column_type in columns)
+        conn.execute(text(f'CREATE TABLE {table} ({column_types})'))
+
+        # MySQL can only index a prefix of TEXT columns
+        key_columns = ', '.join(f'{column}(255)' if is_mysql and dict(columns)[column] == 'TEXT' else column for column in unique_columns)
+        conn.execute(text(f'CREATE UNIQUE INDEX uq_{table}_{"_".join(unique_columns)} ON {table} ({key_columns})'))
+
+
+def compute_daily_summaries(conn, job_name, days, table_known_builds='builds_info', table_robot_reports='robot_reports'):
+    '''
+    Aggregates, from the tables of builds and Robot reports, the results of a job on a
+    set of days. Returns two dataframes, with the rows per (job, day) and per (job,
+    suite, day) of the daily summary tables:
+
+    def compute_daily_summaries(conn, job_name, days, table_known_builds='builds_info', table_robot_reports='robot_reports')
+    '''
+    days = pd.DatetimeIndex(days).normalize().unique()
+    builds_columns = [column for column, _ in DAILY_SUMMARY_TABLES['builds'][1]]
+    suites_columns = [column for column, _ in DAILY_SUMMARY_TABLES['suites'][1]]
+    if not len(days):
+        return pd.DataFrame(columns=builds_columns), pd.DataFrame(columns=suites_columns)
+
+    # Only the builds of the range of days are read (and then, those of the requested days are kept)
+    params = {'job': job_name, 'first_day': days.min().to_pydatetime(), 'last_day': (days.max() + pd.Timedelta(days=1)).to_pydatetime()}
+    bind_params = [bindparam('first_day', type_=DateTime()), bindparam('last_day', type_=DateTime())]
+    query_builds = text(f'''
+        SELECT build, timestamp, build_result, test_result, pass_count, fail_count
+        FROM {table_known_builds}
+        WHERE job = :job AND timestamp >= :first_day AND timestamp < :last_day
+    ''').bindparams(*bind_params)
+    query_suites = text(f'''
+        SELECT main.timestamp, details.name AS suite, details.status, details.pass, details.fail
+        FROM {table_robot_reports} AS details
+        INNER JOIN {table_known_builds} AS main
+        ON details.job=main.job AND details.build=main.build
+        WHERE main.job = :job AND main.timestamp >= :first_day AND main.timestamp < :last_day
+    ''').bindparams(*bind_params)
+
+    df_builds = pd.read_sql(query_builds, con=conn, params=params)
+    df_builds['day'] = pd.to_datetime(df_builds.timestamp).dt.normalize()
+    df_builds = df_builds.loc[df_builds.day.isin(days)]
+
+    df_builds_daily = (
+        df_builds
+        .assign(
+            build_success = lambda x: x.build_result == 'SUCCESS',
+            build_unstable = lambda x: x.build_result == 'UNSTABLE',
+            build_failure = lambda x: x.build_result == 'FAILURE',
+            build_other = lambda x: ~x.build_result.isin(['SUCCESS', 'UNSTABLE', 'FAILURE']),
+            test_pass = lambda x: x.test_result == 'PASS',
+            test_fail = lambda x: x.test_result == 'FAIL',
+            test_unavailable = lambda x: ~x.test_result.isin(['PASS', 'FAIL']),
+        )
+        .groupby('day')
+        .agg(
+            builds = ('build', 'size'),
+            build_success = ('build_success', 'sum'),
+            build_unstable = ('build_unstable', 'sum'),
+            build_failure = ('build_failure', 'sum'),
+            build_other = ('build_other', 'sum'),
+            test_pass = ('test_pass', 'sum'),
+            test_fail = ('test_fail', 'sum'),
+            test_unavailable = ('test_unavailable', 'sum'),
+            tests_passed = ('pass_count', 'sum'),
+            tests_failed = ('fail_count', 'sum'),
+            first_build = ('build', 'min'),
+            last_build = ('build', 'max'),
+        )
+        .reset_index()
+        .assign(job = job_name)
+        .loc[:, builds_columns]
+    )
+
+    df_suites = pd.read_sql(query_suites, con=conn, params=params)
+    df_suites['day'] = pd.to_datetime(df_suites.timestamp).dt.normalize()
+    df_suites = df_suites.loc[df_suites.day.isin(days)]
+
+    df_suites_daily = (
+        df_suites
+        .assign(
+            suite_pass = lambda x: x.status == 'PASS',
+            suite_fail = lambda x: x.status == 'FAIL',
+        )
+        .groupby(['suite', 'day'])
+        .agg(
+            runs = ('status', 'size'),
+            suite_pass = ('suite_pass', 'sum'),
+            suite_fail = ('suite_fail', 'sum'),
+            tests_passed = ('pass', 'sum'),
+            tests_failed = ('fail', 'sum'),
+        )
+        .reset_index()
+        .assign(job = job_name)
+        .loc[:, suites_columns]
+    )
+
+    return df_builds_daily, df_suites_daily
+
+
+def update_daily_summaries(
+        conn,
+        job_name,
+        days,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        table_builds_daily_summary='builds_daily_summary',
+        table_suites_daily_summary='suites_daily_summary'
+    ):
+    '''
+    Recomputes the daily summaries of a job on a set of days (e.g., those of the builds
+    just saved) and replaces their former rows. Other days are not touched:
+
+    def update_daily_summaries(conn, job_name, days, ...)
+    '''
+    days = pd.DatetimeIndex(days).normalize().unique()
+    if not len(days):
+        return
+
+    create_daily_summary_tables(conn, table_builds_daily_summary, table_suites_daily_summary)
+    df_builds_daily, df_suites_daily = compute_daily_summaries(conn, job_name, days, table_known_builds, table_robot_reports)
+
+    for table, df in [(table_builds_daily_summary, df_builds_daily), (table_suites_daily_summary, df_suites_daily)]:
+        conn.execute(
+            text(f'DELETE FROM {table} WHERE job = :job AND day IN :days').bindparams(bindparam('days', expanding=True, type_=Date())),
+            {'job': job_name, 'days': [day.date() for day in days]}
+        )
+        df.to_sql(name=table, con=conn, if_exists='append', index=False, dtype={'day': Date()}, method='multi', chunksize=1000)
+
+
+def rebuild_daily_summaries(
+        database_engine,
+        jobs=None,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        table_builds_daily_summary='builds_daily_summary',
+        table_suites_daily_summary='suites_daily_summary',
+        table_status_runs='status_runs'
+    ):
+    '''
+    Computes from scratch the daily summaries of all the days of some jobs (e.g., the
+    first time they are enabled), along with their status runs, one job at a time:
+
+    def rebuild_daily_summaries(database_engine, jobs=None, ...)
+
+    - jobs: list of jobs to summarize. By default, all the jobs in the table of known builds.
+    '''
+    with database_engine.connect() as conn:
+        if jobs is None:
+            jobs = pd.read_sql(text(f'SELECT DISTINCT job FROM {table_known_builds}'), con=conn).job.tolist()
+
+    for job_name in jobs:
+        with database_engine.begin() as conn:
+            timestamps = pd.read_sql(text(f'SELECT timestamp FROM {table_known_builds} WHERE job = :job'), con=conn, params={'job': job_name}).timestamp
+            update_daily_summaries(
+                conn,
+                job_name,
+                pd.to_datetime(timestamps).dropna(),
+                table_known_builds=table_known_builds,
+                table_robot_reports=table_robot_reports,
+                table_builds_daily_summary=table_builds_daily_summary,
+                table_suites_daily_summary=table_suites_daily_summary
+            )
+            update_status_runs(
+                conn,
+                job_name,
+                table_known_builds=table_known_builds,
+                table_robot_reports=table_robot_reports,
+                table_status_runs=table_status_runs
+            )
+
+
+# Status runs table: columns with their SQL types, and states of each kind of run (see `run_length_lib`). Runs of
+# build and test results have an empty suite. Statuses not in the mappings (e.g., 'ABORTED') are inconclusive
+STATUS_RUNS_COLUMNS = [
+    ('job', 'TEXT'), ('kind', 'TEXT'), ('suite', 'TEXT'), ('status', 'TEXT'),
+    ('first_build', 'BIGINT'), ('last_build', 'BIGINT'), ('builds', 'BIGINT'),
+    ('first_timestamp', 'DATETIME'), ('last_timestamp', 'DATETIME'),
+]
+STATUS_RUNS_MAPPINGS = {
+    'build_result': {'SUCCESS': 'SUCCESS', 'UNSTABLE': 'SUCCESS', 'FAILURE': 'FAILURE'},
+    'test_result': {'PASS': 'PASS', 'FAIL': 'FAIL'},
+    'suite_status': {'PASS': 'PASS', 'FAIL': 'FAIL'},
+}
+# Names of the columns in the dataframes of `run_length_lib`
+STATUS_RUNS_RENAMES = {
+    'key': 'suite', 'start': 'first_build', 'end': 'last_build', 'length': 'builds',
+    'start_timestamp': 'first_timestamp', 'end_timestamp': 'last_timestamp',
+}
+
+
+def create_status_runs_table(conn, table_status_runs='status_runs'):
+    '''
+    Creates (if it does not exist yet) the table of status runs, with a unique key on
+    (job, kind, suite, first_build):
+
+    def create_status_runs_table(conn, table_status_runs='status_runs')
+    '''
+    if inspect(conn).has_table(table_status_runs):
+        return
+    unique_columns = ['job', 'kind', 'suite', 'first_build']
+    is_mysql = conn.dialect.name == 'mysql'
+
+    column_types = ', '.join(f'{column} {column_type}' for column, column_type in STATUS_RUNS_COLUMNS)
+    conn.execute(text(f'CREATE TABLE {table_status_runs} ({column_types})'))
+    key_columns = ', '.join(f'{column}(255)' if is_mysql and dict(STATUS_RUNS_COLUMNS)[column] == 'TEXT' else column for column in unique_columns)
+    conn.execute(text(f'CREATE UNIQUE INDEX uq_{table_status_runs}_{"_".join(unique_columns)} ON {table_status_runs} ({key_columns})'))
+
+
+def compute_status_runs(df_builds, df_suites, df_former_runs=None):
+    '''
+    Finds the runs of build results, test results and suite statuses of a job, from its
+    builds (columns `job`, `build`, `timestamp`, `build_result` and `test_result`) and the
+    suites of its Robot reports (columns `job`, `build`, `timestamp`, `suite` and `status`),
+    both in chronological order. If the former runs of the job are given (as rows of the
+    status runs table), they are extended with the builds instead:
+
+    def compute_status_runs(df_builds, df_suites, df_former_runs=None)
+    '''
+    columns = [column for column, _ in STATUS_RUNS_COLUMNS]
+    df_runs = []
+    for kind, mapping in STATUS_RUNS_MAPPINGS.items():
+        df = df_suites if kind == 'suite_status' else df_builds
+        kwargs = dict(
+            jobs=df.job.to_numpy(),
+            statuses=df.loc[:, 'status' if kind == 'suite_status' else kind].to_numpy(),
+            timestamps=pd.to_datetime(df.timestamp).to_numpy(),
+            keys=df.suite.to_numpy() if kind == 'suite_status' else None,
+            mapping=mapping,
+            positions=df.build.to_numpy()
+        )
+        if df_former_runs is None:
+            df_kind_runs = run_length_encode(**kwargs)
+        else:
+            df_former_kind_runs = (
+                df_former_runs
+                .loc[df_former_runs.kind == kind]
+                .rename(columns={v: k for k, v in STATUS_RUNS_RENAMES.items()})
+                .drop(columns=['kind'] + ([] if kind == 'suite_status' else ['key']))
+                .assign(start_timestamp = lambda x: pd.to_datetime(x.start_timestamp), end_timestamp = lambda x: pd.to_datetime(x.end_timestamp))
+            )
+            df_kind_runs = extend_runs(df_former_kind_runs, **kwargs)
+        df_runs.append(df_kind_runs.rename(columns=STATUS_RUNS_RENAMES).assign(kind = kind).reindex(columns=columns))
+
+    return pd.concat(df_runs, ignore_index=True).fillna({'suite': ''})
+
+
+def update_status_runs(conn, job_name, build_numbers=None, table_known_builds='builds_info', table_robot_reports='robot_reports', table_status_runs='status_runs'):
+    '''
+    Updates the status runs of a job with its saved builds. If all of them are newer than
+    the last build of its runs, the former runs are just extended (only the runs that
+    change are written). Otherwise (or if `build_numbers` is `None`), they are computed
+    from scratch:
+
+    def update_status_runs(conn, job_name, build_numbers=None, table_known_builds='builds_info', table_robot_reports='robot_reports', table_status_runs='status_runs')
+    '''
+    create_status_runs_table(conn, table_status_runs)
+    params = {'job': job_name}
+    df_former_runs = pd.read_sql(text(f'SELECT * FROM {table_status_runs} WHERE job = :job ORDER BY kind, suite, first_build'), con=conn, params=params)
+
+    last_build = df_former_runs.last_build.max() if len(df_former_runs) else None
+    incremental = build_numbers is not None and last_build is not None and min(build_numbers, default=last_build + 1) > last_build
+    if incremental:
+        df_former_runs = df_former_runs.groupby(['kind', 'suite']).tail(1)
+        params['last_build'] = int(last_build)
+    else:
+        df_former_runs = None
+        params['last_build'] = -1
+
+    df_builds = pd.read_sql(text(f'''
+        SELECT job, build, timestamp, build_result, test_result
+        FROM {table_known_builds}
+        WHERE job = :job AND build > :last_build
+        ORDER BY build
+    '''), con=conn, params=params)
+    df_suites = pd.read_sql(text(f'''
+        SELECT main.job, main.build, main.timestamp, details.name AS suite, details.status
+        FROM {table_robot_reports} AS details
+        INNER JOIN {table_known_builds} AS main
+        ON details.job=main.job AND details.build=main.build
+        WHERE main.job = :job AND main.build > :last_build
+        ORDER BY main.build, details.starttime
+    '''), con=conn, params=params)
+
+    df_runs = compute_status_runs(df_builds, df_suites, df_former_runs)
+
+    if incremental:
+        # Only new runs, or former runs that continue in the new builds
+        df_runs = df_runs.loc[df_runs.last_build > last_build]
+        if len(df_runs):
+            conn.execute(
+                text(f'DELETE FROM {table_status_runs} WHERE job = :job AND kind = :kind AND suite = :suite AND first_build = :first_build'),
+                df_runs.loc[:, ['job', 'kind', 'suite', 'first_build']].astype({'first_build': 'int64'}).astype('object').to_dict('records')
+            )
+    else:
+        conn.execute(text(f'DELETE FROM {table_status_runs} WHERE job = :job'), {'job': job_name})
+
+    df_runs.to_sql(name=table_status_runs, con=conn, if_exists='append', index=False, dtype={'first_timestamp': DateTime(), 'last_timestamp': DateTime()}, method='multi', chunksize=1000)
+
+
+# Failure-signature index: one row per signature (see `get_failure_signature`), with its first and last occurrence, plus
+# one row per occurrence of each signature in a build. Columns with their SQL types, and indexes (name suffix, columns, unique)
+FAILURE_INDEX_TABLES = {
+    'signatures': (
+        [
+            ('signature', 'VARCHAR(16)'), ('suite', 'TEXT'), ('test', 'TEXT'), ('keyword', 'TEXT'),
+            ('first_seen', 'DATETIME'), ('last_seen', 'DATETIME'), ('occurrences', 'BIGINT'),
+        ],
+        [('signature', ['signature'], True), ('suite_keyword', ['suite', 'keyword'], False)]
+    ),
+    'occurrences': (
+        [('signature', 'VARCHAR(16)'), ('job', 'TEXT'), ('build', 'BIGINT'), ('timestamp', 'DATETIME')],
+        [('signature_timestamp', ['signature', 'timestamp'], False), ('job_build', ['job', 'build', 'signature'], True)]
+    ),
+}
+
+
+def create_failure_index_tables(conn, table_failure_signatures='failure_signatures', table_failure_occurrences='failure_occurrences'):
+    '''
+    Creates (if they do not exist yet) the tables of the failure-signature index, with
+    their indexes:
+
+    def create_failure_index_tables(conn, table_failure_signatures='failure_signatures', table_failure_occurrences='failure_occurrences')
+    '''
+    is_mysql = conn.dialect.name == 'mysql'
+
+    for table, (columns, indexes) in zip([table_failure_signatures, table_failure_occurrences], FAILURE_INDEX_TABLES.values()):
+        if inspect(conn).has_table(table):
+            continue
+        column_types = ', '.join(f'{column} {column_type}' for column, column_type in columns)
+        conn.execute(text(f'CREATE TABLE {table} ({column_types})'))
+
+        # MySQL can only index a prefix of TEXT columns
+        for suffix, index_columns, unique in indexes:
+            key_columns = ', '.join(f'{column}(255)' if is_mysql and dict(columns)[column] == 'TEXT' else column for column in index_columns)
+            conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {'uq' if unique else 'ix'}_{table}_{suffix} ON {table} ({key_columns})"))
+
+
+def _in_chunks(values, chunk_size=500):
+    # Splits a list of values for `IN` clauses, to keep the number of SQL variables bounded
+    values = list(values)
+    return [values[i:i+chunk_size] for i in range(0, len(values), chunk_size)]
+
+
+def update_failure_index(
+        conn,
+        job_name,
+        build_numbers=None,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        table_failure_signatures='failure_signatures',
+        table_failure_occurrences='failure_occurrences'
+    ):
+    '''
+    Replaces the occurrences of failures of some builds of a job (all of them, if
+    `build_numbers` is `None`) with those of its saved Robot reports, and recomputes the
+    first and last occurrence of the signatures involved. Other signatures are not touched:
+
+    def update_failure_index(conn, job_name, build_numbers=None, ...)
+    '''
+    create_failure_index_tables(conn, table_failure_signatures, table_failure_occurrences)
+    if build_numbers is not None:
+        build_numbers = [int(build_number) for build_number in build_numbers]
+        if not build_numbers:
+            return
+    build_chunks = _in_chunks(build_numbers) if build_numbers is not None else [None]
+
+    def build_filter(column, build_chunk):
+        return (f'AND {column} IN :builds', [bindparam('builds', expanding=True)], {'builds': build_chunk}) if build_chunk is not None else ('', [], {})
+
+    # Former occurrences of those builds
+    affected_signatures = set()
+    for build_chunk in build_chunks:
+        condition, bind_params, params = build_filter('build', build_chunk)
+        params['job'] = job_name
+        affected_signatures.update(conn.execute(
+            text(f'SELECT DISTINCT signature FROM {table_failure_occurrences} WHERE job = :job {condition}').bindparams(*bind_params), params
+        ).scalars())
+        conn.execute(text(f'DELETE FROM {table_failure_occurrences} WHERE job = :job {condition}').bindparams(*bind_params), params)
+
+    # New occurrences, from the test suites that failed
+    df_failures = []
+    for build_chunk in build_chunks:
+        condition, bind_params, params = build_filter('details.build', build_chunk)
+        params['job'] = job_name
+        df_failures.append(pd.read_sql(text(f'''
+            SELECT details.job, details.build, main.timestamp, details.name AS suite, details.failed_test_name AS test, details.failed_keyword AS keyword
+            FROM {table_robot_reports} AS details
+            INNER JOIN {table_known_builds} AS main
+            ON details.job=main.job AND details.build=main.build
+            WHERE details.job = :job AND details.status = 'FAIL' {condition}
+        ''').bindparams(*bind_params), con=conn, params=params))
+    df_failures = pd.concat(df_failures, ignore_index=True)
+    df_failures['timestamp'] = pd.to_datetime(df_failures.timestamp)
+    df_failures['signature'] = [get_failure_signature(*fields) for fields in zip(df_failures.suite, df_failures.test, df_failures.keyword)]
+    df_failures = df_failures.drop_duplicates(['signature', 'job', 'build'])
+
+    columns = [column for column, _ in FAILURE_INDEX_TABLES['occurrences'][0]]
+    df_failures.loc[:, columns].to_sql(name=table_failure_occurrences, con=conn, if_exists='append', index=False, dtype={'timestamp': DateTime()}, method='multi', chunksize=1000)
+    affected_signatures.update(df_failures.signature)
+
+    # First and last occurrences of the signatures involved, from the (indexed) occurrences of all the jobs
+    df_signatures = []
+    for signature_chunk in _in_chunks(sorted(affected_signatures)):
+        params = {'signatures': signature_chunk}
+        bind_params = [bindparam('signatures', expanding=True)]
+        df_descriptions = pd.concat([
+            pd.read_sql(text(f'SELECT signature, suite, test, keyword FROM {table_failure_signatures} WHERE signature IN :signatures').bindparams(*bind_params), con=conn, params=params),
+            df_failures.loc[:, ['signature', 'suite', 'test', 'keyword']],
+        ]).drop_duplicates('signature')
+        df_stats = pd.read_sql(text(f'''
+            SELECT signature, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen, COUNT(*) AS occurrences
+            FROM {table_failure_occurrences}
+            WHERE signature IN :signatures
+            GROUP BY signature
+        ''').bindparams(*bind_params), con=conn, params=params)
+        conn.execute(text(f'DELETE FROM {table_failure_signatures} WHERE signature IN :signatures').bindparams(*bind_params), params)
+        df_signatures.append(df_descriptions.merge(df_stats, on='signature'))
+
+    if df_signatures:
+        columns = [column for column, _ in FAILURE_INDEX_TABLES['signatures'][0]]
+        (
+            pd.concat(df_signatures, ignore_index=True)
+            .assign(first_seen = lambda x: pd.to_datetime(x.first_seen), last_seen = lambda x: pd.to_datetime(x.last_seen))
+            .loc[:, columns]
+            .to_sql(name=table_failure_signatures, con=conn, if_exists='append', index=False, dtype={'first_seen': DateTime(), 'last_seen': DateTime()}, method='multi', chunksize=1000)
+        )
+
+
+def rebuild_failure_index(
+        database_engine,
+        jobs=None,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        table_failure_signatures='failure_signatures',
+        table_failure_occurrences='failure_occurrences'
+    ):
+    '''
+    Computes from scratch the failure-signature index of all the builds of some jobs
+    (e.g., the first time it is enabled), one job at a time:
+
+    def rebuild_failure_index(database_engine, jobs=None, ...)
+
+    - jobs: list of jobs to index. By default, all the jobs in the table of known builds.
+    '''
+    with database_engine.connect() as conn:
+        if jobs is None:
+            jobs = pd.read_sql(text(f'SELECT DISTINCT job FROM {table_known_builds}'), con=conn).job.tolist()
+
+    for job_name in jobs:
+        with database_engine.begin() as conn:
+            update_failure_index(
+                conn,
+                job_name,
+                table_known_builds=table_known_builds,
+                table_robot_reports=table_robot_reports,
+                table_failure_signatures=table_failure_signatures,
+                table_failure_occurrences=table_failure_occurrences
+            )
+
+
+def find_failure_signatures(database_engine, suite=None, test=None, keyword=None, table_failure_signatures='failure_signatures'):
+    '''
+    Looks up in the failure-signature index the signatures of the failures of a test
+    suite, test and/or failed keyword (those not set match anything), and returns them
+    sorted by their first occurrence:
+
+    def find_failure_signatures(database_engine, suite=None, test=None, keyword=None, table_failure_signatures='failure_signatures')
+    '''
+    filters = {column: value for column, value in [('suite', suite), ('test', test), ('keyword', keyword)] if value is not None}
+    condition = ' AND '.join(f'{column} = :{column}' for column in filters) or '1 = 1'
+
+    with database_engine.connect() as conn:
+        df_signatures = pd.read_sql(text(f'SELECT * FROM {table_failure_signatures} WHERE {condition} ORDER BY first_seen'), con=conn, params=filters)
+    df_signatures['first_seen'] = pd.to_datetime(df_signatures.first_seen)
+    df_signatures['last_seen'] = pd.to_datetime(df_signatures.last_seen)
+
+    return df_signatures
+
+
+def get_failure_occurrences(database_engine, signatures, jobs=None, table_failure_occurrences='failure_occurrences'):
+    '''
+    Retrieves the occurrences (job, build and timestamp) of some failure signatures,
+    sorted by timestamp:
+
+    def get_failure_occurrences(database_engine, signatures, jobs=None, table_failure_occurrences='failure_occurrences')
+
+    - signatures: a signature or a list of them (e.g., from `find_failure_signatures`).
+    - jobs: if set, only occurrences in these jobs (e.g., branches) are returned.
+    '''
+    signatures = [signatures] if isinstance(signatures, str) else list(signatures)
+    df_occurrences = []
+
+    with database_engine.connect() as conn:
+        for signature_chunk in _in_chunks(signatures):
+            params = {'signatures': signature_chunk}
+            bind_params = [bindparam('signatures', expanding=True)]
+            condition = ''
+            if jobs is not None:
+                params['jobs'] = list(jobs)
+                bind_params.append(bindparam('jobs', expanding=True))
+                condition = 'AND job IN :jobs'
+            df_occurrences.append(pd.read_sql(
+                text(f'SELECT * FROM {table_failure_occurrences} WHERE signature IN :signatures {condition}').bindparams(*bind_params),
+                con=conn,
+                params=params
+            ))
+
+    columns = [column for column, _ in FAILURE_INDEX_TABLES['occurrences'][0]]
+    df_occurrences = pd.concat([pd.DataFrame(columns=columns)] + df_occurrences, ignore_index=True).astype({'build': 'int64'})
+    df_occurrences['timestamp'] = pd.to_datetime(df_occurrences.timestamp)
+
+    return df_occurrences.sort_values(['timestamp', 'job', 'build'], ignore_index=True)
+
+
+def get_failure_history(database_engine, suite=None, test=None, keyword=None, table_failure_signatures='failure_signatures', table_failure_occurrences='failure_occurrences'):
+    '''
+    Answers when a failure (of a test suite, test and/or keyword, as in
+    `find_failure_signatures`) started and stopped happening in each job. Returns a row
+    per signature and job, with its first and last occurrence (timestamp and build) and
+    the number of builds where it happened, sorted by first occurrence:
+
+    def get_failure_history(database_engine, suite=None, test=None, keyword=None, ...)
+    '''
+    df_signatures = find_failure_signatures(database_engine, suite, test, keyword, table_failure_signatures)
+    df_occurrences = get_failure_occurrences(database_engine, df_signatures.signature, table_failure_occurrences=table_failure_occurrences)
+
+    return (
+        df_occurrences
+        .groupby(['signature', 'job'])
+        .agg(
+            first_seen = ('timestamp', 'min'),
+            last_seen = ('timestamp', 'max'),
+            first_build = ('build', 'min'),
+            last_build = ('build', 'max'),
+            builds = ('build', 'size'),
+        )
+        .reset_index()
+        .merge(df_signatures.loc[:, ['signature', 'suite', 'test', 'keyword']], on='signature')
+        .loc[:, ['signature', 'suite', 'test', 'keyword', 'job', 'first_seen', 'last_seen', 'first_build', 'last_build', 'builds']]
+        .sort_values(['first_seen', 'job'], ignore_index=True)
+    )
+
+
+def create_bulk_load_engine(database_uri, **kwargs):
+    '''
+    Creates a database engine ready for bulk loads. On MySQL, `LOAD DATA LOCAL INFILE`
+    is enabled on the client side (it must be enabled on the server as well, with
+    `local_infile=ON`), while on SQLite the database is switched to WAL mode and
+    `synchronous=NORMAL`, which is safe in WAL mode and much faster for big inserts:
+
+    def create_bulk_load_engine(database_uri, **kwargs)
+
+    - kwargs: any other parameter accepted by `sqlalchemy.create_engine`.
+    '''
+    if database_uri.startswith('mysql'):
+        connect_args = {'local_infile': True, **kwargs.pop('connect_args', {})}
+        return create_engine(database_uri, connect_args=connect_args, **kwargs)
+
+    database_engine = create_engine(database_uri, **kwargs)
+    if database_engine.dialect.name == 'sqlite':
+        @event.listens_for(database_engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+
+    return database_engine
+
+
+def bulk_load_mysql(conn, df, table, chunk_size=100000):
+    '''
+    Loads a dataframe into an existing MySQL table with `LOAD DATA LOCAL INFILE`, from
+    temporary CSV files of up to `chunk_size` rows. Values are converted by MySQL to the
+    types of the columns of the table (which was created with the `dtype` of `to_sql`):
+
+    def bulk_load_mysql(conn, df, table, chunk_size=100000)
+    '''
+    quote = conn.dialect.identifier_preparer.quote
+    columns = ', '.join(quote(c) for c in df.columns)
+
+    # Backslash is the escape character of MySQL, so it must be escaped in text columns (`\\N` stands for NULL)
+    df = df.copy()
+    for column in df.columns[df.dtypes == 'object']:
+        df[column] = df[column].map(lambda value: value.replace('\\', '\\\\') if isinstance(value, str) else value)
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        csv_file = os.path.join(temp_folder, f'{table}.csv')
+        load_query = (
+            f"LOAD DATA LOCAL INFILE '{csv_file.replace(os.sep, '/')}' INTO TABLE {quote(table)} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+            "LINES TERMINATED BY '\\n' "
+            f"({columns})"
+        )
+        for start in range(0, len(df), chunk_size):
+            df.iloc[start:start + chunk_size].to_csv(
+                csv_file,
+                header=False,
+                index=False,
+                na_rep='\\N',
+                lineterminator='\n',
+                date_format='%Y-%m-%d %H:%M:%S.%f',
+                encoding='utf-8'
+            )
+            conn.exec_driver_sql(load_query)
+
+
+def bulk_insert_in_chunks(conn, df, table, dtype=None, chunk_size=100000):
+    '''
+    Inserts a dataframe into an existing table with a single-row `INSERT` executed for
+    chunks of up to `chunk_size` rows at once (i.e., `executemany`), within the ongoing
+    transaction:
+
+    def bulk_insert_in_chunks(conn, df, table, dtype=None, chunk_size=100000)
+    '''
+    quote = conn.dialect.identifier_preparer.quote
+    insert_query = text(
+        f"INSERT INTO {quote(table)} ({', '.join(quote(c) for c in df.columns)}) VALUES ({', '.join(f':{c}' for c in df.columns)})"
+    ).bindparams(*[bindparam(c, type_=t) for c, t in (dtype or {}).items() if c in df.columns])
+
+    for start in range(0, len(df), chunk_size):
+        df_chunk = df.iloc[start:start + chunk_size]
+        rows = df_chunk.astype('object').where(df_chunk.notna(), None).to_dict('records')
+        conn.execute(insert_query, rows)
+
+
+def write_df_to_table(conn, df, table, dtype=None, bulk_load=False, chunk_size=100000):
+    '''
+    Appends the rows of a dataframe to a table (which is created if it does not exist)
+    and reports the throughput achieved, in rows per second:
+
+    def write_df_to_table(conn, df, table, dtype=None, bulk_load=False, chunk_size=100000)
+
+    - bulk_load: if `True`, rows are bulk loaded (with `LOAD DATA LOCAL INFILE` on MySQL, or
+    with chunked `executemany` otherwise). If `False`, multi-row `INSERT`s from `to_sql` are used.
+    - chunk_size: maximum number of rows sent to the database at once.
+    '''
+    start_time = time.perf_counter()
+
+    if not bulk_load:
+        # SQLite limits the number of parameters of a statement, which multi-row `INSERT`s easily exceed
+        if conn.dialect.name == 'sqlite':
+            max_parameters = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+            chunk_size = min(chunk_size, max(1, max_parameters // max(len(df.columns), 1)))
+
+        df.to_sql(
+            name=table,
+            con=conn,
+            if_exists='append',
+            index=False,
+            dtype=dtype,
+            method='multi',
+            chunksize=chunk_size
+        )
+    else:
+        # The table is created with the same schema that `to_sql` would use
+        if not inspect(conn).has_table(table):
+            df.head(0).to_sql(name=table, con=conn, index=False, dtype=dtype)
+
+        if conn.dialect.name == 'mysql':
+            bulk_load_mysql(conn, df, table, chunk_size=chunk_size)
+        else:
+            bulk_insert_in_chunks(conn, df, table, dtype=dtype, chunk_size=chunk_size)
+
+    elapsed_time = time.perf_counter() - start_time
+    print(f'{len(df)} rows written to "{table}" in {elapsed_time:.2f} s ({len(df) / max(elapsed_time, 1e-9):.0f} rows/s)')
+
+
+# Dimension tables of the normalized schema of keyword-level results: (table, surrogate key, columns)
+## Surrogate keys are named `*_key`, since `suite_id` and `test_id` are already the IDs given by Robot
+NORMALIZED_DIMENSIONS = [
+    ('dim_jobs', 'job_key', ['job']),
+    ('dim_suites', 'suite_key', ['suite_id', 'suite_name']),
+    ('dim_tests', 'test_key', ['test_id', 'test_name']),
+    ('dim_keywords', 'keyword_key', ['keyword_name']),
+]
+
+
+def is_view(conn, table):
+    '''
+    Whether a table of the database is actually a view:
+
+    def is_view(conn, table)
+    '''
+    return table in inspect(conn).get_view_names()
+
+
+def create_normalized_details_schema(conn, table_robot_reports_extended='robot_reports_extended', chunk_size=100000):
+    '''
+    Creates the normalized schema of keyword-level results, if it does not exist yet:
+    - Dimension tables (see `NORMALIZED_DIMENSIONS`) with an integer surrogate key each.
+    - Fact table (`<table>_facts`) with integer columns only, indexed by (`job_key`, `build`).
+    - View named after the original table, with the same columns, so that existing
+    queries keep working.
+
+    If the original table exists as a regular table, its rows are moved to the new schema.
+
+    def create_normalized_details_schema(conn, table_robot_reports_extended='robot_reports_extended', chunk_size=100000)
+    '''
+    is_mysql = conn.dialect.name == 'mysql'
+    table_facts = f'{table_robot_reports_extended}_facts'
+    surrogate_key = 'BIGINT PRIMARY KEY AUTO_INCREMENT' if is_mysql else 'INTEGER PRIMARY KEY AUTOINCREMENT'
+
+    for table_dimension, key, columns in NORMALIZED_DIMENSIONS:
+        if not inspect(conn).has_table(table_dimension):
+            conn.execute(text(
+                f"CREATE TABLE {table_dimension} ({key} {surrogate_key}, {', '.join(f'{c} TEXT' for c in columns)})"
+            ))
+
+    if not inspect(conn).has_table(table_facts):
+        conn.execute(text(f"""
+            CREATE TABLE {table_facts} (
+                job_key BIGINT,
+                build BIGINT,
+                suite_key BIGINT,
+                test_key BIGINT,
+                keyword_key BIGINT,
+                status VARCHAR(16),
+                starttime DATETIME,
+                endtime DATETIME
+            )
+        """))
+        conn.execute(text(f'CREATE INDEX ix_{table_facts}_job_build ON {table_facts} (job_key, build)'))
+
+    if is_view(conn, table_robot_reports_extended):
+        return
+
+    # Rows in the former (flat) table are moved to the new schema, which takes its name afterwards
+    if inspect(conn).has_table(table_robot_reports_extended):
+        table_flat = f'{table_robot_reports_extended}_flat'
+        conn.execute(text(f'ALTER TABLE {table_robot_reports_extended} RENAME TO {table_flat}'))
+        for df_chunk in pd.read_sql(text(f'SELECT * FROM {table_flat}'), con=conn, chunksize=chunk_size):
+            df_chunk['starttime'] = pd.to_datetime(df_chunk.starttime)
+            df_chunk['endtime'] = pd.to_datetime(df_chunk.endtime)
+            write_normalized_details(conn, df_chunk, table_robot_reports_extended, chunk_size=chunk_size)
+        conn.execute(text(f'DROP TABLE {table_flat}'))
+
+    conn.execute(text(f"""
+        CREATE VIEW {table_robot_reports_extended} AS
+        SELECT
+            jobs.job AS job,
+            facts.build AS build,
+            suites.suite_id AS suite_id,
+            suites.suite_name AS suite_name,
+            tests.test_id AS test_id,
+            tests.test_name AS test_name,
+            keywords.keyword_name AS keyword_name,
+            facts.status AS status,
+            facts.starttime AS starttime,
+            facts.endtime AS endtime
+        FROM {table_facts} AS facts
+        LEFT JOIN dim_jobs AS jobs ON facts.job_key=jobs.job_key
+        LEFT JOIN dim_suites AS suites ON facts.suite_key=suites.suite_key
+        LEFT JOIN dim_tests AS tests ON facts.test_key=tests.test_key
+        LEFT JOIN dim_keywords AS keywords ON facts.keyword_key=keywords.keyword_key
+    """))
+
+
+def get_dimension_keys(conn, df, table_dimension, key, columns):
+    '''
+    Returns the surrogate keys of the values of some columns of a dataframe in a
+    dimension table, adding first the values that were not there yet. Rows whose
+    values are all null get a null key:
+
+    def get_dimension_keys(conn, df, table_dimension, key, columns)
+    '''
+    df_values = df[columns].astype('object')
+    df_values = df_values.where(df_values.notna(), None)
+    df_new_values = df_values.loc[df_values.notna().any(axis=1)].drop_duplicates()
+
+    query_dimension = text(f"SELECT {key}, {', '.join(columns)} FROM {table_dimension}")
+    df_dimension = pd.read_sql(query_dimension, con=conn)
+
+    # Values not known yet are added (and their keys are retrieved afterwards)
+    df_new_values = df_new_values.merge(df_dimension, how='left', on=columns)
+    df_new_values = df_new_values.loc[df_new_values[key].isna(), columns]
+    if len(df_new_values):
+        df_new_values.to_sql(name=table_dimension, con=conn, if_exists='append', index=False)
+        df_dimension = pd.read_sql(query_dimension, con=conn)
+
+    return df_values.merge(df_dimension, how='left', on=columns)[key].to_numpy()
+
+
+def write_normalized_details(conn, df, table_robot_reports_extended='robot_reports_extended', bulk_load=False, chunk_size=100000):
+    '''
+    Appends keyword-level results (as they are saved in the flat table) to the normalized
+    schema, replacing text columns by the surrogate keys of the dimension tables:
+
+    def write_normalized_details(conn, df, table_robot_reports_extended='robot_reports_extended', bulk_load=False, chunk_size=100000)
+    '''
+    df_facts = pd.DataFrame(index=df.index)
+    for table_dimension, key, columns in NORMALIZED_DIMENSIONS:
+        df_facts[key] = get_dimension_keys(conn, df, table_dimension, key, columns)
+    df_facts.insert(1, 'build', df.build.astype('int64'))
+    df_facts['status'] = df.status.astype(str)
+    df_facts['starttime'] = df.starttime
+    df_facts['endtime'] = df.endtime
+
+    dtype_facts = {
+        "job_key": BigInteger(),
+        "build": BigInteger(),
+        "suite_key": BigInteger(),
+        "test_key": BigInteger(),
+        "keyword_key": BigInteger(),
+        "status": String(16),
+        "starttime": DateTime(),
+        "endtime": DateTime(),
+    }
+
+    write_df_to_table(
+        conn,
+        df_facts,
+        f'{table_robot_reports_extended}_facts',
+        dtype=dtype_facts,
+        bulk_load=bulk_load,
+        chunk_size=chunk_size
+    )
 
 
 def ingest_update_all_jenkins_job(
@@ -18,18 +1212,87 @@ def ingest_update_all_jenkins_job(
         robot_report = 'tmp_robot_report.xml',
         table_known_builds = 'builds_info',
         table_robot_reports = 'robot_reports',
-        table_robot_reports_extended = 'robot_reports_extended'
+        table_robot_reports_extended = 'robot_reports_extended',
+        fetch_workers = 1,
+        spool_reports = False,
+        write_mode = 'incremental',
+        report_cache = None,
+        reprocess_cached_builds = False,
+        bulk_load = False,
+        chunk_size = 100000,
+        details_schema = 'flat',
+        parquet_snapshot_folder = None,
+        checkpoint_builds = None,
+        checkpoint_rows = None,
+        parse_workers = 0,
+        daily_summaries = False,
+        table_builds_daily_summary = 'builds_daily_summary',
+        table_suites_daily_summary = 'suites_daily_summary',
+        table_status_runs = 'status_runs',
+        keyword_depth = None,
+        failure_index = False,
+        table_failure_signatures = 'failure_signatures',
+        table_failure_occurrences = 'failure_occurrences'
     ):
+    '''
+    Retrieves from Jenkins the builds of a job that are not in the database yet (or whose
+    information is incomplete), along with their Robot reports, and saves them:
+
+    def ingest_update_all_jenkins_job(jenkins_server, job_name, database_engine, ...)
+
+    - report_cache: if set, `RobotReportCache` that keeps a copy of the raw Robot reports.
+    - reprocess_cached_builds: if `True`, the builds whose reports are in `report_cache` are parsed and saved again, even if already known.
+    - write_mode: how the table of known builds is updated:
+        - 'incremental': only the builds of this job are read, and only new or updated builds are written.
+        - 'rewrite': the whole table is read, dropped and written again (legacy behaviour, MySQL only).
+    - bulk_load: if `True`, the rows of the Robot reports are bulk loaded (see `write_df_to_table`).
+    - chunk_size: maximum number of rows of the Robot reports sent to the database at once.
+    - details_schema: how keyword-level results are saved:
+        - 'flat': as a single table, with all the columns as text (legacy behaviour).
+        - 'normalized': as a fact table plus dimension tables, behind a view with the same name and columns (see `create_normalized_details_schema`).
+    - parquet_snapshot_folder: if set, folder of the Parquet snapshot where the new rows are also saved (see `parquet_snapshot`).
+    - checkpoint_builds: if set, builds are saved (and committed) every time this number of builds has been retrieved.
+    - checkpoint_rows: if set, builds are saved (and committed) every time their reports add up to this number of rows.
+    Checkpoints keep memory bounded, and a restarted run resumes from the first build not saved yet (incremental mode only).
+    - parse_workers: if > 0, Robot reports are downloaded to temporary files by `fetch_workers` threads, and parsed by a pool
+    of `parse_workers` processes, while the results are saved in order (otherwise, reports are parsed while downloaded).
+    - daily_summaries: if `True`, the daily summary tables of the job are updated on the days of the saved builds (see `update_daily_summaries`),
+    and its status runs are extended with them (see `update_status_runs`).
+    - keyword_depth: if set, the tree of keywords of the Robot reports is walked up to this depth (0 for no limit), so that
+    the failed keyword of each test suite is the deepest one that failed (see `parse_robot_report`). Only top-level keywords are saved.
+    - failure_index: if `True`, the failure-signature index is updated with the failures of the saved builds (see `update_failure_index`).
+    '''
+    if write_mode not in ['incremental', 'rewrite']:
+        raise ValueError(f'Unknown write mode: {write_mode}')
+    if details_schema not in ['flat', 'normalized']:
+        raise ValueError(f'Unknown schema of detailed results: {details_schema}')
+    if write_mode == 'rewrite' and (checkpoint_builds or checkpoint_rows):
+        raise ValueError('Checkpoints are only supported in incremental write mode')
+    start = time.perf_counter()
 
     # If there is historical data about former builds of this job, it is retrieved first (otherwise, it should return an empty dataframe):
-    try:
-        with database_engine.connect() as connection:
-            df_known_builds = pd.read_sql_table(table_known_builds, con=connection)
-    except (NameError, ValueError) as e:   # If it does not exist, bootstraps a new dataframe
-        df_known_builds = pd.DataFrame(columns=['job', 'build', 'timestamp', 'duration', 'build_result', 'test_result', 'pass_count', 'fail_count'])
+    with metrics.stage('load_known_builds', job=job_name):
+        if write_mode == 'incremental':
+            df_known_builds = load_known_builds_of_job(database_engine, job_name, table_known_builds)
+        else:
+            try:
+                with database_engine.connect() as connection:
+                    df_known_builds = pd.read_sql_table(table_known_builds, con=connection)
+            except (NameError, ValueError) as e:   # If it does not exist, bootstraps a new dataframe
+                df_known_builds = pd.DataFrame(columns=['job', 'build', 'timestamp', 'duration', 'build_result', 'test_result', 'pass_count', 'fail_count'])
 
-    # Retrieves from Jenkins a fresh list of builds of the job:
-    df_builds_of_job = get_all_job_builds(jenkins_server, job_name)
+    # Retrieves from Jenkins a fresh list of builds of the job, along with their summaries:
+    if jenkins_server is not None:
+        with metrics.stage('list_builds', job=job_name):
+            df_builds_of_job = get_all_job_builds_summaries(jenkins_server, job_name)
+    else:
+        # Without connection to Jenkins, the summaries kept in the report cache are used instead
+        cached_build_summaries = [report_cache.build_info(job_name, build) for build in report_cache.builds(job_name)]
+        df_builds_of_job = pd.DataFrame(
+            [build_info for build_info in cached_build_summaries if build_info],
+            columns=RELEVANT_BUILD_FIELDS
+        )
+    build_summaries = {build_info['number']: build_info for build_info in df_builds_of_job.to_dict('records')}
 
     # Compares the fresh list with the historical one and determines which builds we need to add to our database:
     known_builds = df_known_builds.loc[df_known_builds.job==job_name, 'build'].tolist()
@@ -49,180 +1312,24 @@ def ingest_update_all_jenkins_job(
         ignore_index=True
     )
 
-    # Starts with empty dataframes
-    df_new_build_reports = pd.DataFrame(columns=['job', 'build', 'id', 'name', 'source', 'status', 'starttime', 'endtime', 'pass', 'fail', 'failed_test_id', 'failed_test_name', 'failed_keyword'])
-    df_new_build_reports_details = pd.DataFrame(columns=['job', 'build', 'suite_id', 'suite_name', 'test_id', 'test_name', 'keyword_name', 'status', 'starttime', 'endtime'])
-    builds_with_missing_info = df_known_builds.loc[(df_known_builds.job==job_name) & (df_known_builds.build_result.isna()), 'build'].tolist()
-
-    for build_number in builds_with_missing_info:
-        print(f'Retrieving build {build_number} from "{job_name}"...\t', end='')
-
-        # Shortcut to filter this build and job
-        this_build_and_job = (df_known_builds.job==job_name) & (df_known_builds.build==build_number)
-
-        # Retrieves the information about the own build
-        build_info = get_build_summary(jenkins_server, job_name, build_number)
-        if build_info['result'] is None:
-            build_info['result'] = 'FAILURE'
-        df_known_builds.loc[this_build_and_job, 'build_result'] = build_info['result']
-        print(f"Build: {build_info['result']}\t", end='')
-        df_known_builds.loc[this_build_and_job, 'timestamp'] = pd.to_datetime(build_info['timestamp'], unit='ms') # Unit in Jenkins for timestamps
-        # timestamp_translated = str(df_known_builds.loc[this_build_and_job, 'timestamp'])
-        #timestamp_translated = df_known_builds.loc[this_build_and_job, 'timestamp'].dt.strftime('%Y-%m-%d')
-        # print(f"{timestamp_translated}({build_info['timestamp']})\t", end='')
-        df_known_builds.loc[this_build_and_job, 'duration'] = build_info['duration']
-
-        # Retrieves the Robot report, if it exists
-        try:
-            robot_report_contents = get_robot_report(jenkins_server, job_name, build_number)
-            with open(robot_report, 'w', encoding='utf-8') as f:
-                print(robot_report_contents, file=f)
-
-            print('Report available: ', end='')
-
-            # Retrieves the rows that need to be added the corresponding database table, and appends them
-            df_build_report = get_consolidated_results_from_report(robot_report, with_rca=True)
-            df_build_report_details = get_detailed_results_from_report(robot_report)
-            # df_new_build_reports = pd.concat([df_new_build_reports, df_build_report], ignore_index=True)
-            #
-            ## Comment if this behaviour is undesired. Then, see code into the `with` clause that follows
-            df_new_build_reports = pd.concat(
-                [
-                    df.dropna(axis=1, how='all') for df in [df_new_build_reports, df_build_report]
-                ],
-                ignore_index=True
-            )
-            #####################################################################33
-
-            # df_new_build_reports_details = pd.concat([df_new_build_reports_details, df_build_report_details], ignore_index=True)
-            with warnings.catch_warnings():
-                warnings.filterwarnings(
-                    "ignore",
-                    category=FutureWarning,
-                    message="The behavior of DataFrame concatenation with empty or all-NA entries is deprecated*"
-                )
-
-                # Use only if this behaviour is desired also for the previous dataframe:
-                # ---------------------------------------------------------------------
-                # df_new_build_reports = pd.concat(
-                #     [df_new_build_reports, df_build_report],
-                #     ignore_index=True
-                # )
-
-                df_new_build_reports_details = pd.concat(
-                    [df_new_build_reports_details, df_build_report_details],
-                    ignore_index=True
-                )
-
-            # Adds the build number to the new rows
-            ## df_new_build_reports.build.fillna(build_number, inplace=True)
-            # df_new_build_reports.loc[:, 'build'] = df_new_build_reports.loc[:, 'build'].fillna(build_number)
-            ## Ensures the column exists, even empty
-            if 'build' not in df_new_build_reports.columns:
-                # df_new_build_reports['build'] = pd.NA
-                df_new_build_reports['build'] = np.nan
-            ## Fills values accordingly
-            df_new_build_reports.loc[:, 'build'] = (
-                df_new_build_reports.loc[:, 'build']
-                .astype('object')
-                .infer_objects(copy=False)
-                .fillna(build_number)
-            )
-
-            ## df_new_build_reports_details.build.fillna(build_number, inplace=True)
-            # df_new_build_reports_details.loc[:, 'build'] = df_new_build_reports_details.loc[:, 'build'].fillna(build_number)
-            ## Ensures the column exists, even empty
-            if 'build' not in df_new_build_reports_details.columns:
-                df_new_build_reports_details['build'] = pd.NA
-            ## Fills values accordingly
-            df_new_build_reports_details.loc[:, 'build'] = (
-                df_new_build_reports_details.loc[:, 'build']
-                .astype('object')
-                .infer_objects(copy=False)
-                .fillna(build_number)
-            )
-
-            # Records the number of tests passed vs. failed
-            df_known_builds.loc[this_build_and_job, 'pass_count'] = df_build_report['pass'].sum()
-            df_known_builds.loc[this_build_and_job, 'fail_count'] = df_build_report['fail'].sum()
+    # Guarantees that all the columns exist (even if empty), so that they can be filled in afterwards
+    for column in df_unknown_builds.columns.difference(df_known_builds.columns, sort=False):
+        df_known_builds[column] = pd.Series(dtype='object')
 
-            # If any test is different from 'PASS', the whole build is marked as 'FAIL'
-            if len(df_build_report.loc[df_build_report.status!='PASS']):
-                # Job name will surely match, so there is no need to check it
-                df_known_builds.loc[this_build_and_job, 'test_result'] = 'FAIL'
-                print('FAIL')
-            else:
-                # Job name will surely match, so there is no need to check it
-                df_known_builds.loc[this_build_and_job, 'test_result'] = 'PASS'
-                print('PASS')
-        except jenkins.NotFoundException as e:
-            # If the Robot report could not be retrieved, it marks it as unavailable
-            df_known_builds.loc[this_build_and_job, 'test_result'] = 'UNAVAILABLE'
-            print('Report unavailable')
+    # Builds whose information has to be retrieved from Jenkins
+    rows_with_missing_info = (df_known_builds.job==job_name) & (df_known_builds.build_result.isna())
+    if reprocess_cached_builds:
+        rows_with_missing_info |= (df_known_builds.job==job_name) & (df_known_builds.build.isin(report_cache.builds(job_name)))
+    builds_with_missing_info = df_known_builds.loc[rows_with_missing_info, 'build'].tolist()
 
-    # All new rows should come from the same job
-
-    ## df_new_build_reports.job.fillna(job_name, inplace=True)
-    # df_new_build_reports.loc[:, 'job'] = df_new_build_reports.loc[:, 'job'].fillna(job_name)
-    ## Ensures the column exists, even empty
-    if 'job' not in df_new_build_reports.columns:
-        df_new_build_reports['job'] = pd.NA
-    ## Fills values accordingly
-    df_new_build_reports.loc[:, 'job'] = (
-        df_new_build_reports.loc[:, 'job']
-        .astype('object')
-        .infer_objects(copy=False)
-        .fillna(job_name)
-    )
-
-    ## df_new_build_reports_details.job.fillna(job_name, inplace=True)
-    # df_new_build_reports_details.loc[:, 'job'] = df_new_build_reports_details.loc[:, 'job'].fillna(job_name)
-    ## Ensures the column exists, even empty
-    if 'job' not in df_new_build_reports_details.columns:
-        df_new_build_reports_details['job'] = pd.NA
-    ## Fills values accordingly
-    df_new_build_reports_details.loc[:, 'job'] = (
-        df_new_build_reports_details.loc[:, 'job']
-        .astype('object')
-        .infer_objects(copy=False)
-        .fillna(job_name)
-    )
-
-    # Fixes the data types
-    df_new_build_reports['build'] = df_new_build_reports.build.astype('int')
-    df_new_build_reports['status'] = df_new_build_reports.status.astype('category')
-    df_new_build_reports_details['build'] = df_new_build_reports_details.build.astype('int')
-    df_new_build_reports_details['status'] = df_new_build_reports_details.status.astype('category')
-
-    df_known_builds['build_result'] = df_known_builds.build_result.astype('category')
-    df_known_builds['test_result'] = df_known_builds.test_result.astype('category')
-    df_known_builds['pass_count'] = df_known_builds.pass_count.astype('float')
-    df_known_builds['fail_count'] = df_known_builds.fail_count.astype('float')
-
-
-    # --------------------------------------------------------------
-    # Saves the results to the database as a single transaction
-    # --------------------------------------------------------------
-
-    ## OLD CODE:
-    # with database_engine.begin() as conn:
-    #     df_known_builds.to_sql(name=table_known_builds, con=conn, if_exists='replace', index=False)
-    #     df_new_build_reports.to_sql(name=table_robot_reports, con=conn, if_exists='append', index=False)
-    #     df_new_build_reports_details.to_sql(name=table_robot_reports_extended, con=conn, if_exists='append', index=False)
-    ##
-
-    # Converts columns `category` to `str` for each DataFrame
-    ## df_known_builds
-    df_known_builds["build_result"] = df_known_builds["build_result"].astype(str)
-    df_known_builds["test_result"] = df_known_builds["test_result"].astype(str)
-    ## df_new_build_reports
-    df_new_build_reports["status"] = df_new_build_reports["status"].astype(str)
-    ## df_new_build_reports_details
-    df_new_build_reports_details["status"] = df_new_build_reports_details["status"].astype(str)
-
-    # If existing, remove `auto_id` column so that MySQL can generate it automatically
-    if 'auto_id' in df_known_builds.columns:
-        df_known_builds = df_known_builds.drop(columns=['auto_id'])
+    # Name of the file where each Robot report is saved, only if requested (concurrent downloads need one file per build)
+    def spool_file(build_number):
+        if not spool_reports:
+            return None
+        if fetch_workers <= 1:
+            return robot_report
+        root, extension = os.path.splitext(robot_report)
+        return f'{root}-{build_number}{extension}'
 
     # Dtypes for `builds_info`
     dtype_known_builds = {
@@ -267,50 +1374,305 @@ def ingest_update_all_jenkins_job(
         "endtime": DateTime(),
     }
 
-    with database_engine.begin() as conn:
-        # Delete and re-create `builds_info` table with the origina schema and `auto_increment`
-        conn.execute(text(f"DROP TABLE IF EXISTS {table_known_builds}"))
-        conn.execute(text(f"""
-            CREATE TABLE {table_known_builds} (
-                auto_id BIGINT PRIMARY KEY AUTO_INCREMENT,
-                job TEXT,
-                build BIGINT,
-                timestamp DATETIME,
-                duration BIGINT,
-                build_result TEXT,
-                test_result TEXT,
-                pass_count DOUBLE,
-                fail_count DOUBLE
-            ) ENGINE=InnoDB;
-        """))
+    # Saves the rows accumulated in the buffers as a single transaction (at the end, or at every checkpoint)
+    def save_fetched_builds(df_known_builds, fetched_builds_rows, build_reports_buffer, build_reports_details_buffer, index_of_rows):
+        dataframes_start = time.perf_counter()
 
-        # Insert data without `auto_id` columns so that MySQL assigns it
-        df_known_builds.to_sql(
-            name=table_known_builds,
-            con=conn,
-            if_exists='append',
-            index=False,
-            dtype=dtype_known_builds,
-            method='multi'
+        # Builds the dataframes with all the new rows, with the right data types
+        df_fetched_builds = pd.DataFrame(
+            fetched_builds_rows,
+            columns=['job', 'build', 'timestamp', 'duration', 'build_result', 'test_result', 'pass_count', 'fail_count'],
+            index=index_of_rows
         )
+        df_fetched_builds['build'] = df_fetched_builds.build.astype('int')
+        df_fetched_builds['timestamp'] = pd.to_datetime(df_fetched_builds.timestamp, unit='ms') # Unit in Jenkins for timestamps
+        df_fetched_builds['pass_count'] = df_fetched_builds.pass_count.astype('float')
+        df_fetched_builds['fail_count'] = df_fetched_builds.fail_count.astype('float')
 
-        # For `robot_reports`, with remains, we just insert with `append`
-        df_new_build_reports.to_sql(
-            name=table_robot_reports,
-            con=conn,
-            if_exists='append',
-            index=False,
-            dtype=dtype_robot_reports,
-            method='multi'
+        ## All new rows come from the same job
+        report_dtypes = {'status': 'category', 'starttime': 'datetime64[ns]', 'endtime': 'datetime64[ns]'}
+        df_new_build_reports = records_buffer_to_df(build_reports_buffer, job_name, report_dtypes)
+        df_new_build_reports_details = records_buffer_to_df(build_reports_details_buffer, job_name, report_dtypes)
+
+        # The rows of the retrieved builds replace the former ones (only needed if the whole table is rewritten)
+        if write_mode == 'rewrite':
+            df_known_builds = pd.concat([df_known_builds.loc[~rows_with_missing_info], df_fetched_builds]).sort_index()
+            df_known_builds['build_result'] = df_known_builds.build_result.astype('category')
+            df_known_builds['test_result'] = df_known_builds.test_result.astype('category')
+            df_known_builds['pass_count'] = df_known_builds.pass_count.astype('float')
+            df_known_builds['fail_count'] = df_known_builds.fail_count.astype('float')
+
+
+        # --------------------------------------------------------------
+        # Saves the results to the database as a single transaction
+        # --------------------------------------------------------------
+        refetched_builds = [build for build in df_fetched_builds.build if build in known_builds]
+
+        ## OLD CODE:
+        # with database_engine.begin() as conn:
+        #     df_known_builds.to_sql(name=table_known_builds, con=conn, if_exists='replace', index=False)
+        #     df_new_build_reports.to_sql(name=table_robot_reports, con=conn, if_exists='append', index=False)
+        #     df_new_build_reports_details.to_sql(name=table_robot_reports_extended, con=conn, if_exists='append', index=False)
+        ##
+
+        # Converts columns `category` to `str` for each DataFrame
+        ## df_known_builds
+        df_known_builds["build_result"] = df_known_builds["build_result"].astype(str)
+        df_known_builds["test_result"] = df_known_builds["test_result"].astype(str)
+        ## df_new_build_reports
+        df_new_build_reports["status"] = df_new_build_reports["status"].astype(str)
+        ## df_new_build_reports_details
+        df_new_build_reports_details["status"] = df_new_build_reports_details["status"].astype(str)
+
+        # If existing, remove `auto_id` column so that MySQL can generate it automatically
+        if 'auto_id' in df_known_builds.columns:
+            df_known_builds = df_known_builds.drop(columns=['auto_id'])
+        metrics.add_time('dataframes', time.perf_counter() - dataframes_start, job=job_name)
+
+        with metrics.stage('write', job=job_name), database_engine.begin() as conn:
+            if write_mode == 'incremental':
+                # Only the builds retrieved in this run are inserted (if new) or updated (if already known)...
+                create_known_builds_table(conn, table_known_builds)
+                upsert_known_builds(
+                    conn,
+                    df_fetched_builds,
+                    known_builds,
+                    table_known_builds=table_known_builds,
+                    dtype=dtype_known_builds
+                )
+
+                # ... and, if they were already known, their former reports are replaced by the new ones
+                delete_build_reports(
+                    conn,
+                    job_name,
+                    refetched_builds,
+                    [table_robot_reports, table_robot_reports_extended]
+                )
+            else:
+                # Delete and re-create `builds_info` table with the origina schema and `auto_increment`
+                conn.execute(text(f"DROP TABLE IF EXISTS {table_known_builds}"))
+                conn.execute(text(f"""
+                    CREATE TABLE {table_known_builds} (
+                        auto_id BIGINT PRIMARY KEY AUTO_INCREMENT,
+                        job TEXT,
+                        build BIGINT,
+                        timestamp DATETIME,
+                        duration BIGINT,
+                        build_result TEXT,
+                        test_result TEXT,
+                        pass_count DOUBLE,
+                        fail_count DOUBLE
+                    ) ENGINE=InnoDB;
+                """))
+
+                # Insert data without `auto_id` columns so that MySQL assigns it
+                df_known_builds.to_sql(
+                    name=table_known_builds,
+                    con=conn,
+                    if_exists='append',
+                    index=False,
+                    dtype=dtype_known_builds,
+                    method='multi'
+                )
+
+            # For `robot_reports`, with remains, we just insert with `append`
+            write_df_to_table(
+                conn,
+                df_new_build_reports,
+                table_robot_reports,
+                dtype=dtype_robot_reports,
+                bulk_load=bulk_load,
+                chunk_size=chunk_size
+            )
+
+            # For `robot_reports_extended`, we insert with `append` as well (into the normalized schema, if requested or if it is already in use)
+            if details_schema == 'normalized' or is_view(conn, table_robot_reports_extended):
+                create_normalized_details_schema(conn, table_robot_reports_extended, chunk_size=chunk_size)
+                write_normalized_details(
+                    conn,
+                    df_new_build_reports_details,
+                    table_robot_reports_extended,
+                    bulk_load=bulk_load,
+                    chunk_size=chunk_size
+                )
+            else:
+                write_df_to_table(
+                    conn,
+                    df_new_build_reports_details,
+                    table_robot_reports_extended,
+                    dtype=dtype_robot_reports_extended,
+                    bulk_load=bulk_load,
+                    chunk_size=chunk_size
+                )
+
+            # Daily summaries are recomputed only on the days of the saved builds, and status runs only from the last one known
+            if daily_summaries:
+                update_daily_summaries(
+                    conn,
+                    job_name,
+                    df_fetched_builds.timestamp.dropna(),
+                    table_known_builds=table_known_builds,
+                    table_robot_reports=table_robot_reports,
+                    table_builds_daily_summary=table_builds_daily_summary,
+                    table_suites_daily_summary=table_suites_daily_summary
+                )
+                update_status_runs(
+                    conn,
+                    job_name,
+                    df_fetched_builds.build,
+                    table_known_builds=table_known_builds,
+                    table_robot_reports=table_robot_reports,
+                    table_status_runs=table_status_runs
+                )
+
+            if failure_index:
+                update_failure_index(
+                    conn,
+                    job_name,
+                    df_fetched_builds.build,
+                    table_known_builds=table_known_builds,
+                    table_robot_reports=table_robot_reports,
+                    table_failure_signatures=table_failure_signatures,
+                    table_failure_occurrences=table_failure_occurrences
+                )
+
+        metrics.count('rows_written', len(df_fetched_builds) if write_mode == 'incremental' else len(df_known_builds), job=job_name, table=table_known_builds)
+        metrics.count('rows_written', len(df_new_build_reports), job=job_name, table=table_robot_reports)
+        metrics.count('rows_written', len(df_new_build_reports_details), job=job_name, table=table_robot_reports_extended)
+
+        # Once saved to the database, the same rows are added to the Parquet snapshot
+        if parquet_snapshot_folder is not None:
+            with metrics.stage('parquet_snapshot', job=job_name):
+                update_parquet_snapshot_of_job(
+                    parquet_snapshot_folder,
+                    job_name,
+                    df_fetched_builds,
+                    df_new_build_reports,
+                    df_new_build_reports_details,
+                    replaced_builds=refetched_builds,
+                    table_known_builds=table_known_builds,
+                    table_robot_reports=table_robot_reports,
+                    table_robot_reports_extended=table_robot_reports_extended
+                )
+
+    # New rows are accumulated in compact buffers, and the corresponding dataframes are built only once they are saved
+    fetched_builds_rows = []
+    first_row_of_batch = 0
+    build_reports_buffer = new_records_buffer(REPORT_COLUMNS)
+    build_reports_details_buffer = new_records_buffer(DETAILS_COLUMNS)
+
+    if parse_workers > 0:
+        # Pipeline of three bounded stages: downloads (in threads), parsing (in processes) and saving (here, in order)
+        download_folder = tempfile.TemporaryDirectory(prefix='robot_reports_')
+        downloaded_builds = map_in_order(
+            lambda build_number: download_build(
+                jenkins_server,
+                job_name,
+                build_number,
+                download_folder.name,
+                build_info=build_summaries.get(build_number),
+                spool_to=spool_file(build_number),
+                report_cache=report_cache
+            ),
+            builds_with_missing_info,
+            workers=fetch_workers
+        )
+        fetched_builds = map_in_order(partial(parse_downloaded_build, keyword_depth=keyword_depth), downloaded_builds, workers=parse_workers, processes=True)
+    else:
+        # Build summaries and Robot reports are downloaded (and parsed) concurrently if `fetch_workers` > 1, but they are processed in order
+        fetched_builds = map_in_order(
+            lambda build_number: fetch_and_compact_build(
+                jenkins_server,
+                job_name,
+                build_number,
+                build_info=build_summaries.get(build_number),
+                spool_to=spool_file(build_number),
+                report_cache=report_cache,
+                keyword_depth=keyword_depth
+            ),
+            builds_with_missing_info,
+            workers=fetch_workers
         )
 
-        # For `robot_reports_extended`, we insert with `append` as well
-        df_new_build_reports_details.to_sql(
-            name=table_robot_reports_extended,
-            con=conn,
-            if_exists='append',
-            index=False,
-            dtype=dtype_robot_reports_extended,
-            method='multi'
+    for row, (build_number, (build_info, compact_report)) in enumerate(zip(builds_with_missing_info, fetched_builds)):
+        print(f'Retrieving build {build_number} from "{job_name}"...\t', end='')
+
+        # Retrieves the information about the own build
+        if build_info['result'] is None:
+            build_info['result'] = 'FAILURE'
+        print(f"Build: {build_info['result']}\t", end='')
+
+        # Processes the Robot report, if it exists
+        if compact_report is None:
+            # If the Robot report could not be retrieved, it marks it as unavailable
+            test_result, pass_count, fail_count = 'UNAVAILABLE', np.nan, np.nan
+            print('Report unavailable')
+        else:
+            print('Report available: ', end='')
+
+            # Appends the rows that need to be added the corresponding database tables
+            append_to_records_buffer(build_reports_buffer, compact_report.report, build_number)
+            append_to_records_buffer(build_reports_details_buffer, compact_report.details, build_number)
+
+            # Records the number of tests passed vs. failed, and the overall result
+            test_result, pass_count, fail_count = compact_report.test_result, compact_report.pass_count, compact_report.fail_count
+            print(test_result)
+
+            # Stages run by the workers (possibly, in other processes) are accounted here
+            for stage, seconds in compact_report.timings.items():
+                metrics.add_time(stage, seconds, job=job_name)
+
+        metrics.count('builds_fetched', job=job_name)
+
+        fetched_builds_rows.append((job_name, build_number, build_info['timestamp'], build_info['duration'], build_info['result'], test_result, pass_count, fail_count))
+
+        # At every checkpoint, the builds retrieved so far are saved, so that memory does not grow and a restarted run resumes from here
+        rows_in_buffers = sum(build_reports_buffer['lengths']) + sum(build_reports_details_buffer['lengths'])
+        if (checkpoint_builds and len(fetched_builds_rows) >= checkpoint_builds) or (checkpoint_rows and rows_in_buffers >= checkpoint_rows):
+            print(f'Checkpoint: saving {len(fetched_builds_rows)} builds from "{job_name}"...')
+            save_fetched_builds(
+                df_known_builds,
+                fetched_builds_rows,
+                build_reports_buffer,
+                build_reports_details_buffer,
+                df_known_builds.index[rows_with_missing_info][first_row_of_batch:row + 1]
+            )
+            fetched_builds_rows = []
+            build_reports_buffer = new_records_buffer(build_reports_buffer['columns'])
+            build_reports_details_buffer = new_records_buffer(build_reports_details_buffer['columns'])
+            first_row_of_batch = row + 1
+
+    # Remaining builds (or all of them, if there were no checkpoints) are saved at the end
+    if fetched_builds_rows or not first_row_of_batch:
+        save_fetched_builds(
+            df_known_builds,
+            fetched_builds_rows,
+            build_reports_buffer,
+            build_reports_details_buffer,
+            df_known_builds.index[rows_with_missing_info][first_row_of_batch:]
         )
 
+    if parse_workers > 0:
+        download_folder.cleanup()
+
+    metrics.add_time('total', time.perf_counter() - start, job=job_name)
+
+
+def reprocess_jenkins_job_from_cache(job_name, database_engine, report_cache, **kwargs):
+    '''
+    Parses again the Robot reports of a job kept in the local cache and saves them into
+    the database, replacing the former rows of those builds. Jenkins is not contacted
+    at all, so it can be used to rebuild the database after a schema or parser change:
+
+    def reprocess_jenkins_job_from_cache(job_name, database_engine, report_cache, **kwargs)
+
+    - kwargs: any other parameter accepted by `ingest_update_all_jenkins_job` (e.g., table names).
+    '''
+    return ingest_update_all_jenkins_job(
+        None,
+        job_name,
+        database_engine,
+        report_cache=report_cache,
+        reprocess_cached_builds=True,
+        **kwargs
+    )
@@ -32,8 +32,13 @@ if [ -z ${SKIP_ALL_UPDATES} ]; then
     echo "Refreshing database..."
     python ./00-script-jenkins_and_robot_etl.py
 
-    # Run the Jupyter notebook and export as HTML report
-    jupyter nbconvert --to html --output "${REPORT_OUTPUTS_FOLDER}/${KEY_FILE_NAME}" --TemplateExporter.exclude_input=True --execute 01-analysis_of_test_results.ipynb
+    if [[ "${HEADLESS_REPORT,,}" == "yes" || "${HEADLESS_REPORT,,}" == "true" ]]; then
+        # Generate the HTML report without a Jupyter kernel (figures are rendered in parallel)
+        REPORT_FILE="${REPORT_OUTPUTS_FOLDER}/${KEY_FILE_NAME}" python ./01-script-analysis_of_test_results.py
+    else
+        # Run the Jupyter notebook and export as HTML report
+        jupyter nbconvert --to html --output "${REPORT_OUTPUTS_FOLDER}/${KEY_FILE_NAME}" --TemplateExporter.exclude_input=True --execute 01-analysis_of_test_results.ipynb
+    fi
 else
     echo "Skipping report update..."
 fi
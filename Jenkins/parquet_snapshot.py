@@ -0,0 +1,271 @@
+# Snapshot of the database as a Parquet dataset, optimized for analytics
+
+import os
+import uuid
+import pandas as pd
+from urllib.parse import quote
+
+
+# Columns (and their types) of each kind of table in the snapshot. All of them are
+# partitioned by `job` and by `month` (of the timestamp of the build), which are not
+# stored inside the files but in the name of their folders
+SNAPSHOT_COLUMNS = {
+    'builds': [
+        ('build', 'int64'),
+        ('timestamp', 'timestamp'),
+        ('duration', 'int64'),
+        ('build_result', 'category'),
+        ('test_result', 'category'),
+        ('pass_count', 'float64'),
+        ('fail_count', 'float64'),
+    ],
+    'reports': [
+        ('timestamp', 'timestamp'),
+        ('build', 'int64'),
+        ('id', 'category'),
+        ('name', 'category'),
+        ('source', 'category'),
+        ('status', 'category'),
+        ('starttime', 'timestamp'),
+        ('endtime', 'timestamp'),
+        ('pass', 'float64'),
+        ('fail', 'float64'),
+        ('failed_test_id', 'category'),
+        ('failed_test_name', 'category'),
+        ('failed_keyword', 'category'),
+    ],
+    'details': [
+        ('timestamp', 'timestamp'),
+        ('build', 'int64'),
+        ('suite_id', 'category'),
+        ('suite_name', 'category'),
+        ('test_id', 'category'),
+        ('test_name', 'category'),
+        ('keyword_name', 'category'),
+        ('status', 'category'),
+        ('starttime', 'timestamp'),
+        ('endtime', 'timestamp'),
+    ],
+}
+
+
+def _import_pyarrow():
+    # PyArrow is only needed if the snapshot is enabled
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('pyarrow is required to use the Parquet snapshot (e.g., `pip install pyarrow`)') from e
+    return pyarrow
+
+
+def _arrow_schema(pa, kind):
+    arrow_types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'timestamp': pa.timestamp('ns'),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([(column, arrow_types[column_type]) for column, column_type in SNAPSHOT_COLUMNS[kind]])
+
+
+def _partitioning(pa):
+    # Job names contain slashes, so partition values are URL-encoded
+    return pa.dataset.partitioning(
+        pa.schema([('job', pa.string()), ('month', pa.string())]),
+        flavor='hive'
+    )
+
+
+def _job_folder(snapshot_folder, table, job_name):
+    return os.path.join(snapshot_folder, table, f"job={quote(job_name, safe='')}")
+
+
+def remove_builds_from_parquet_snapshot(snapshot_folder, table, job_name, build_numbers):
+    '''
+    Removes from a table of the snapshot the rows of a set of builds of a job (e.g.,
+    before saving a fresh copy of them). Only the files that contain those builds are
+    rewritten:
+
+    def remove_builds_from_parquet_snapshot(snapshot_folder, table, job_name, build_numbers)
+    '''
+    pa = _import_pyarrow()
+    job_folder = _job_folder(snapshot_folder, table, job_name)
+    build_numbers = pa.array([int(build_number) for build_number in build_numbers], type=pa.int64())
+    if not len(build_numbers) or not os.path.isdir(job_folder):
+        return
+
+    for folder, _, file_names in os.walk(job_folder):
+        for file_name in file_names:
+            if not file_name.endswith('.parquet'):
+                continue
+            path = os.path.join(folder, file_name)
+
+            # Only the column of build numbers is read to decide whether the file is affected
+            builds_in_file = pa.parquet.read_table(path, columns=['build']).column('build')
+            if not pa.compute.any(pa.compute.is_in(builds_in_file, value_set=build_numbers)).as_py():
+                continue
+
+            arrow_table = pa.parquet.read_table(path)
+            arrow_table = arrow_table.filter(pa.compute.invert(pa.compute.is_in(arrow_table.column('build'), value_set=build_numbers)))
+            if arrow_table.num_rows:
+                pa.parquet.write_table(arrow_table, path + '.tmp')
+                os.replace(path + '.tmp', path)
+            else:
+                os.remove(path)
+
+
+def append_to_parquet_snapshot(snapshot_folder, table, df, kind):
+    '''
+    Appends the rows of a dataframe to a table of the snapshot, as new files in the
+    partitions of their job and month (files are never modified, so appends are cheap):
+
+    def append_to_parquet_snapshot(snapshot_folder, table, df, kind)
+
+    - table: name of the table (i.e., of its folder in the snapshot).
+    - df: dataframe with the columns of `kind` in `SNAPSHOT_COLUMNS`, plus `job`.
+    - kind: 'builds', 'reports' or 'details'.
+    '''
+    pa = _import_pyarrow()
+    schema = _arrow_schema(pa, kind)
+    if not len(df):
+        return
+
+    # Text columns are converted to categories, so that they are stored as dictionaries
+    df = df.loc[:, ['job'] + schema.names].copy()
+    for column, column_type in SNAPSHOT_COLUMNS[kind]:
+        if column_type == 'category':
+            df[column] = df[column].astype('object').where(df[column].notna(), None).astype('category')
+        elif column_type == 'timestamp':
+            df[column] = pd.to_datetime(df[column])
+
+    months = df.timestamp.dt.strftime('%Y-%m')
+    for (job_name, month), df_partition in df.groupby([df.job.astype(str), months], sort=False):
+        folder = os.path.join(_job_folder(snapshot_folder, table, job_name), f'month={month}')
+        os.makedirs(folder, exist_ok=True)
+        arrow_table = pa.Table.from_pandas(df_partition.drop(columns=['job']), schema=schema, preserve_index=False)
+        pa.parquet.write_table(arrow_table, os.path.join(folder, f'part-{uuid.uuid4().hex}.parquet'))
+
+
+def update_parquet_snapshot_of_job(
+        snapshot_folder,
+        job_name,
+        df_builds,
+        df_reports,
+        df_reports_details,
+        replaced_builds=None,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        table_robot_reports_extended='robot_reports_extended'
+    ):
+    '''
+    Saves into the snapshot the builds of a job retrieved in a run of the ETL, along with
+    the rows of their Robot reports. Reports get the timestamp of their build, so that
+    they can be filtered by date without joins:
+
+    def update_parquet_snapshot_of_job(snapshot_folder, job_name, df_builds, df_reports, df_reports_details, replaced_builds=None, ...)
+
+    - replaced_builds: builds already in the snapshot, whose former rows are removed first.
+    '''
+    build_timestamps = df_builds.loc[:, ['build', 'timestamp']]
+    tables = [
+        (table_known_builds, df_builds, 'builds'),
+        (table_robot_reports, df_reports.drop(columns=['timestamp'], errors='ignore').merge(build_timestamps, on='build'), 'reports'),
+        (table_robot_reports_extended, df_reports_details.drop(columns=['timestamp'], errors='ignore').merge(build_timestamps, on='build'), 'details'),
+    ]
+
+    for table, df, kind in tables:
+        remove_builds_from_parquet_snapshot(snapshot_folder, table, job_name, replaced_builds or [])
+        append_to_parquet_snapshot(snapshot_folder, table, df, kind)
+
+
+def export_database_to_parquet_snapshot(
+        database_engine,
+        snapshot_folder,
+        table_known_builds='builds_info',
+        table_robot_reports='robot_reports',
+        table_robot_reports_extended='robot_reports_extended',
+        chunk_size=100000
+    ):
+    '''
+    Bootstraps the snapshot with the whole content of the database (e.g., the first
+    time it is enabled), reading it in chunks:
+
+    def export_database_to_parquet_snapshot(database_engine, snapshot_folder, ...)
+    '''
+    queries = [
+        (table_known_builds, 'builds', f'SELECT * FROM {table_known_builds}'),
+        (table_robot_reports, 'reports', f'''
+            SELECT main.timestamp, details.*
+            FROM {table_robot_reports} AS details
+            INNER JOIN {table_known_builds} AS main
+            ON details.job=main.job AND details.build=main.build
+        '''),
+        (table_robot_reports_extended, 'details', f'''
+            SELECT main.timestamp, details.*
+            FROM {table_robot_reports_extended} AS details
+            INNER JOIN {table_known_builds} AS main
+            ON details.job=main.job AND details.build=main.build
+        '''),
+    ]
+
+    with database_engine.connect() as conn:
+        for table, kind, query in queries:
+            for df_chunk in pd.read_sql(query, con=conn, chunksize=chunk_size):
+                df_chunk['build'] = df_chunk.build.astype('int64')
+                append_to_parquet_snapshot(snapshot_folder, table, df_chunk, kind)
+
+
+def load_parquet_snapshot(snapshot_folder, table, columns=None, jobs=None, first_date=None, last_date=None):
+    '''
+    Loads a table of the snapshot as a Pandas dataframe. Only the requested columns are
+    read, and the filters are pushed down to the dataset, so that only the partitions
+    (and row groups) that match them are read:
+
+    def load_parquet_snapshot(snapshot_folder, table, columns=None, jobs=None, first_date=None, last_date=None)
+
+    - columns: list of columns to read. By default, all of them.
+    - jobs: list of jobs to read. By default, all of them.
+    - first_date: first day of the builds to read (e.g., '2024-12-15'). By default, unconstrained.
+    - last_date: last day of the builds to read (included). By default, unconstrained.
+    '''
+    pa = _import_pyarrow()
+    dataset = pa.dataset.dataset(os.path.join(snapshot_folder, table), format='parquet', partitioning=_partitioning(pa))
+
+    # Months are filtered first, since they allow skipping whole folders
+    predicates = []
+    if jobs is not None:
+        predicates.append(pa.dataset.field('job').isin(list(jobs)))
+    if first_date is not None:
+        first_timestamp = pd.Timestamp(first_date)
+        predicates.append(pa.dataset.field('month') >= first_timestamp.strftime('%Y-%m'))
+        predicates.append(pa.dataset.field('timestamp') >= pa.scalar(first_timestamp, type=pa.timestamp('ns')))
+    if last_date is not None:
+        # Needs to include latest hour of the last day
+        last_timestamp = pd.Timestamp(last_date) + pd.Timedelta(days=1)
+        predicates.append(pa.dataset.field('month') <= pd.Timestamp(last_date).strftime('%Y-%m'))
+        predicates.append(pa.dataset.field('timestamp') < pa.scalar(last_timestamp, type=pa.timestamp('ns')))
+
+    predicate = None
+    for p in predicates:
+        predicate = p if predicate is None else predicate & p
+
+    # By default, columns are in the same order as in the database (i.e., `job` first, but after the timestamp of the build in reports)
+    if columns is not None:
+        columns = list(columns)
+    else:
+        columns = [c for c in dataset.schema.names if c not in ['job', 'month']]
+        columns.insert(1 if columns[0] == 'timestamp' else 0, 'job')
+    df = dataset.to_table(columns=columns, filter=predicate).to_pandas()
+
+    if 'job' in df.columns:
+        df['job'] = df.job.astype('category')
+
+    # Rows are sorted as they are in the database
+    sort_columns = [c for c in ['job', 'build', 'starttime'] if c in df.columns]
+    if sort_columns:
+        df = df.sort_values(sort_columns, kind='stable', ignore_index=True)
+
+    return df
@@ -0,0 +1,155 @@
+# Local cache of raw Robot reports, compressed and bounded in size
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:     # Falls back to gzip if zstd is not available
+    zstandard = None
+
+
+class RobotReportCache:
+    '''
+    On-disk cache of the raw Robot reports (`output.xml`) of the builds of Jenkins jobs,
+    so that they can be parsed again without downloading them. Reports are stored
+    compressed (with zstd if available, with gzip otherwise) in files named after a hash
+    of their (job, build) key, and the least recently used ones are evicted whenever the
+    total size exceeds `max_bytes`:
+
+    cache = RobotReportCache(folder, max_bytes=None)
+
+    The index of the cache (`index.json`) also keeps the summary of each build, so that
+    the database can be rebuilt from the cache alone.
+    '''
+
+    index_file_name = 'index.json'
+
+    def __init__(self, folder, max_bytes=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+        index_path = os.path.join(folder, self.index_file_name)
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as f:
+                self._index = json.load(f)
+        else:
+            self._index = {}
+
+    @staticmethod
+    def _key(job_name, build_number):
+        return hashlib.sha256(f'{job_name}#{int(build_number)}'.encode('utf-8')).hexdigest()
+
+    def _path(self, file_name):
+        return os.path.join(self.folder, file_name)
+
+    def _find(self, job_name, build_number):
+        key = self._key(job_name, build_number)
+        for extension in ['.xml.zst', '.xml.gz']:
+            if key + extension in self._index:
+                return key + extension
+        return None
+
+    def _save_index(self):
+        index_path = self._path(self.index_file_name)
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            # NumPy scalars (e.g., from Pandas dataframes) are saved as native values
+            json.dump(self._index, f, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+        os.replace(index_path + '.tmp', index_path)
+
+    def contains(self, job_name, build_number):
+        '''
+        Whether the report of a build is in the cache.
+        '''
+        with self._lock:
+            return self._find(job_name, build_number) is not None
+
+    def builds(self, job_name):
+        '''
+        Sorted list of the builds of a job whose reports are in the cache.
+        '''
+        with self._lock:
+            return sorted(entry['build'] for entry in self._index.values() if entry['job'] == job_name)
+
+    def build_info(self, job_name, build_number):
+        '''
+        Summary of a build, as it was when its report was stored in the cache.
+        '''
+        with self._lock:
+            return self._index[self._find(job_name, build_number)].get('build_info')
+
+    def open(self, job_name, build_number):
+        '''
+        Opens the report of a build as a (decompressed) binary file object. The report is
+        marked as recently used.
+        '''
+        with self._lock:
+            file_name = self._find(job_name, build_number)
+            if file_name is None:
+                raise KeyError(f'Report of build {build_number} of "{job_name}" is not in the cache')
+            path = self._path(file_name)
+            os.utime(path)
+
+        if file_name.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError(f'zstandard is needed to read "{path}"')
+            return zstandard.open(path, 'rb')
+        return gzip.open(path, 'rb')
+
+    @contextmanager
+    def writer(self, job_name, build_number, build_info=None):
+        '''
+        Context manager that yields a binary file object where the report of a build
+        is written. The report is only added to the cache if the `with` block succeeds.
+        '''
+        file_name = self._key(job_name, build_number) + ('.xml.zst' if zstandard else '.xml.gz')
+        path = self._path(file_name)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+
+        f = zstandard.open(temp_path, 'wb') if zstandard else gzip.open(temp_path, 'wb')
+        try:
+            yield f
+            f.close()
+        except BaseException:
+            f.close()
+            os.remove(temp_path)
+            raise
+
+        os.replace(temp_path, path)
+        with self._lock:
+            # A former copy with a different compression is replaced as well
+            former_file_name = self._find(job_name, build_number)
+            if former_file_name not in [None, file_name]:
+                del self._index[former_file_name]
+                os.remove(self._path(former_file_name))
+
+            self._index[file_name] = {
+                'job': job_name,
+                'build': int(build_number),
+                'size': os.path.getsize(path),
+                'build_info': build_info
+            }
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        # Removes the least recently used reports until the cache fits into its budget
+        if self.max_bytes is None:
+            return
+
+        total_size = sum(entry['size'] for entry in self._index.values())
+        if total_size <= self.max_bytes:
+            return
+
+        by_last_use = sorted(self._index, key=lambda file_name: os.path.getmtime(self._path(file_name)))
+        for file_name in by_last_use:
+            if total_size <= self.max_bytes:
+                break
+            total_size -= self._index.pop(file_name)['size']
+            os.remove(self._path(file_name))
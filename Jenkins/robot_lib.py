@@ -1,28 +1,190 @@
 # High-level library to parse Robot reports
 
+import hashlib
 import pandas as pd
 import xml.etree.ElementTree as et
+from collections import namedtuple
 
 
-def get_stats_from_report(robot_report):
+# Dataframes that can be extracted from a Robot report in a single pass
+RobotReportFrames = namedtuple('RobotReportFrames', ['results', 'stats', 'details', 'rca'])
+
+# Paths (from the root of the XML tree, excluded) of the elements of interest
+_SUITE_PATH = ['suite', 'suite']
+_SUITE_STATUS_PATH = ['suite', 'suite', 'status']
+_TEST_PATH = ['suite', 'suite', 'test']
+_KEYWORD_PATH = ['suite', 'suite', 'test', 'kw']
+_KEYWORD_STATUS_PATH = ['suite', 'suite', 'test', 'kw', 'status']
+_STAT_PATH = ['statistics', 'suite', 'stat']
+
+# Elements of the tree of keywords (`setup` and `teardown` are used by Robot Framework 7+, instead of `kw` with a type)
+_KEYWORD_TAGS = ('kw', 'setup', 'teardown')
+
+# Control structures of Robot Framework 4+ (e.g., FOR loops and their iterations, or IF/ELSE branches), which are
+# levels of the tree of keywords too. The roots of IF/ELSE and TRY/EXCEPT are not: as Robot does, their branches
+# are numbered as if they were siblings of the keywords around them
+CONTROL_STRUCTURE_TAGS = ('for', 'iter', 'while', 'group', 'branch', 'variable', 'return', 'continue', 'break', 'error')
+_TREE_TAGS = _KEYWORD_TAGS + CONTROL_STRUCTURE_TAGS
+
+# Columns of the detailed results per keyword, plus those added when the whole tree of keywords is walked
+_DETAILS_COLUMNS = ['suite_id', 'suite_name', 'test_id', 'test_name', 'keyword_name', 'status', 'starttime', 'endtime']
+_KEYWORD_TREE_COLUMNS = ['keyword_id', 'parent_id', 'depth', 'keyword_path', 'keyword_type']
+
+
+def parse_robot_report(robot_report, keyword_depth=None):
     '''
-    Extracts numerical statistics from a Robot report as a Pandas dataframe:
+    Extracts from a Robot report, in a single pass, the results per test suite, the
+    numerical statistics, the detailed results per keyword and the root cause of the
+    failures, and returns them as a `RobotReportFrames` tuple of Pandas dataframes:
 
-    def get_stats_from_report(robot_report)
+    def parse_robot_report(robot_report, keyword_depth=None)
+
+    - robot_report: file name or file object with the XML of the Robot report.
+    - keyword_depth: if `None` (default), the detailed results include only the top-level keywords of each test.
+    Otherwise, they include the whole tree of keywords and control structures (see `iter_keyword_tree`) up to this
+    depth (0 for no limit), and the root cause of the failures is the deepest failing keyword.
+
+    The XML tree is parsed incrementally and every element is discarded as soon as it
+    has been processed, so memory usage does not depend on the size of the report.
     '''
-    # Finds the root of the XML tree:
-    xtree = et.parse(robot_report)
-    xroot = xtree.getroot()
-    timestamp = xroot.attrib['generated']
+    rows = {'suite': [], 'suite_status': [], 'stat': [], 'keyword': []}
+    for kind, row in _iter_report_rows(robot_report, keyword_depth):
+        rows[kind].append(row)
+
+    df_test_suites = _build_results_frame(rows['suite'], rows['suite_status'])
+    df_test_stats = _build_stats_frame(rows['stat'])
+    df_tests_and_keywords = _build_details_frame(rows['keyword'], with_keyword_tree=keyword_depth is not None)
+    df_root_cause_errors = get_root_causes_from_details(df_tests_and_keywords)
 
-    # Obtains the section of numerical statistics, which includes the number of passed/failed tests per testsuite:
-    statistics = xroot.find('statistics')
-    stat_suites = statistics.find('suite')
-    fields = ['id', 'name', 'pass', 'fail']
-    rows = []
-    for stat in stat_suites:
-        rows.append( {f: stat.attrib[f] for f in fields} )
-    df_test_stats = pd.DataFrame(rows)
+    return RobotReportFrames(df_test_suites, df_test_stats, df_tests_and_keywords, df_root_cause_errors)
+
+
+def iter_keyword_tree(robot_report, max_depth=0):
+    '''
+    Walks the tree of keywords of the tests of a Robot report (including setups and
+    teardowns, also those of the test suites) and yields a row (dictionary) per keyword,
+    as soon as it is complete, so memory usage does not depend on the size of the report:
+
+    def iter_keyword_tree(robot_report, max_depth=0)
+
+    - max_depth: keywords nested deeper than this are skipped (0 for no limit). Top-level keywords have depth 1, and control structures count as levels.
+
+    Control structures (e.g., FOR loops, their iterations and IF/ELSE branches) are levels
+    of the tree as well, with a row of their own whose `keyword_type` is their tag (e.g., 'for',
+    'iter', 'branch') and whose `keyword_name` is their type or tag (e.g., 'FOR', 'ITER', 'ELSE IF').
+
+    Besides the columns of the detailed results, each row has a `keyword_id` (the id of
+    its parent plus `-k<n>`, like Robot does), the `parent_id` (the parent keyword or control
+    structure, or the test or test suite), the `depth`, the `keyword_path` (names of the
+    keywords from the top level, separated by ' > ') and the `keyword_type` (e.g., 'kw',
+    'setup', 'teardown'). Rows of children are yielded before the row of their parent.
+    '''
+    for kind, row in _iter_report_rows(robot_report, keyword_depth=max_depth):
+        if kind == 'keyword':
+            yield row
+
+
+def _iter_report_rows(robot_report, keyword_depth=None):
+    '''
+    Parses a Robot report incrementally and yields tuples `(kind, row)` with the rows of
+    interest: 'suite', 'suite_status', 'stat' and 'keyword' (top-level keywords only if
+    `keyword_depth` is `None`, otherwise the tree of keywords up to that depth).
+    '''
+    path = []       # Tags from the root (excluded) to the current element
+    elements = []   # Elements from the root to the current element
+    keywords = []   # Keywords from the top level to the current element (`None` if deeper than `keyword_depth`)
+    stat_fields = ['id', 'name', 'pass', 'fail']
+    with_keyword_tree = keyword_depth is not None
+
+    for event, elem in et.iterparse(robot_report, events=('start', 'end')):
+        if event == 'start':
+            if elements:
+                path.append(elem.tag)
+            elements.append(elem)
+
+            # Attributes are already available when the element starts (they are copied, since elements are cleared afterwards)
+            if path == _SUITE_PATH:
+                suite = dict(elem.attrib)
+                suite_keyword_count = 0
+                yield 'suite', suite
+            elif path == _TEST_PATH:
+                test = dict(elem.attrib)
+                test_keyword_count = 0
+            elif with_keyword_tree and elem.tag in _TREE_TAGS and len(path) > 2 and path[:2] == _SUITE_PATH and path[2] in ('test',) + _KEYWORD_TAGS:
+                parent = keywords[-1] if keywords else None
+                depth = len(keywords) + 1
+                if (keyword_depth and depth > keyword_depth) or (keywords and parent is None):
+                    keywords.append(None)
+                    continue
+
+                # Top-level keywords belong to a test, or to the test suite (its setup or teardown)
+                if parent is not None:
+                    parent['children'] += 1
+                    keyword_id = f"{parent['row']['keyword_id']}-k{parent['children']}"
+                    context = {f: parent['row'][f] for f in ['suite_id', 'suite_name', 'test_id', 'test_name']}
+                    parent_id, parent_path = parent['row']['keyword_id'], parent['row']['keyword_path'] + ' > '
+                elif path[2] == 'test':
+                    test_keyword_count += 1
+                    keyword_id = f"{test['id']}-k{test_keyword_count}"
+                    context = {'suite_id': suite['id'], 'suite_name': suite['name'], 'test_id': test['id'], 'test_name': test['name']}
+                    parent_id, parent_path = test['id'], ''
+                else:
+                    suite_keyword_count += 1
+                    keyword_id = f"{suite['id']}-k{suite_keyword_count}"
+                    context = {'suite_id': suite['id'], 'suite_name': suite['name'], 'test_id': None, 'test_name': None}
+                    parent_id, parent_path = suite['id'], ''
+
+                if elem.tag in _KEYWORD_TAGS:
+                    keyword_name, keyword_type = elem.attrib.get('name', ''), elem.attrib.get('type', elem.tag).lower()
+                else:
+                    keyword_name, keyword_type = elem.attrib.get('type', elem.attrib.get('name', elem.tag.upper())), elem.tag
+                keywords.append({
+                    'elem': elem,
+                    'children': 0,
+                    'row': {
+                        **context,
+                        'keyword_name': keyword_name,
+                        'keyword_id': keyword_id,
+                        'parent_id': parent_id,
+                        'depth': depth,
+                        'keyword_path': parent_path + keyword_name,
+                        'keyword_type': keyword_type,
+                    },
+                })
+            continue
+
+        # The element is complete, so it can be processed
+        if with_keyword_tree:
+            if keywords and elem is (keywords[-1] or {}).get('elem'):
+                keyword = keywords.pop()
+                row = keyword['row']
+                yield 'keyword', {**{f: row[f] for f in _DETAILS_COLUMNS[:5]}, **keyword.get('status', {}), **{f: row[f] for f in _KEYWORD_TREE_COLUMNS}}
+            elif keywords and keywords[-1] is None and elem.tag in _TREE_TAGS and len(path) > 2 and path[:2] == _SUITE_PATH:
+                keywords.pop()
+            elif elem.tag == 'status' and keywords and keywords[-1] is not None and elements[-2] is keywords[-1]['elem']:
+                keywords[-1]['status'] = dict(elem.attrib)
+        elif path == _KEYWORD_STATUS_PATH:
+            keyword_status = dict(elem.attrib)
+        elif path == _KEYWORD_PATH:
+            yield 'keyword', {'suite_id': suite['id'], 'suite_name': suite['name'], 'test_id': test['id'], 'test_name': test['name'], 'keyword_name': elem.attrib['name'], **keyword_status}
+        if path == _SUITE_STATUS_PATH:
+            yield 'suite_status', dict(elem.attrib)
+        elif path == _STAT_PATH:
+            yield 'stat', {f: elem.attrib[f] for f in stat_fields}
+
+        # ... and then discarded, detaching it from its parent
+        elements.pop()
+        if elements:
+            path.pop()
+            elem.clear()
+            elements[-1].remove(elem)
+
+
+def _build_stats_frame(stat_rows):
+    '''
+    Builds the dataframe of numerical statistics from the rows extracted from a Robot report.
+    '''
+    df_test_stats = pd.DataFrame(stat_rows)
 
     # Fixes the types of some columns
     df_test_stats['pass'] = df_test_stats['pass'].astype('int64')
@@ -39,29 +201,10 @@ def get_stats_from_report(robot_report):
     return df_test_stats
 
 
-def get_results_from_report(robot_report):
+def _build_results_frame(suite_rows, status_rows):
     '''
-    Extracts from a Robot report the results per test suite as a Pandas dataframe:
-
-    def get_results_from_report(robot_report)
+    Builds the dataframe of results per test suite from the rows extracted from a Robot report.
     '''
-    # Finds the root of the XML tree:
-    xtree = et.parse(robot_report)
-    xroot = xtree.getroot()
-    timestamp = xroot.attrib['generated']
-
-    # 1. Dataframe of results of the test suites of the tests of the day
-    all_suites = xroot.find('suite')
-
-    suite_rows = []
-    status_rows = []
-    for suite in all_suites.findall('suite'):
-        # suite
-        suite_rows.append(suite.attrib)
-
-        ## suite --> status
-        status_rows.append(suite.find('status').attrib)
-
     df_test_suites = pd.concat([pd.DataFrame(suite_rows), pd.DataFrame(status_rows)], axis=1)
     df_test_suites['status'] = df_test_suites.status.astype('category')
     df_test_suites['starttime'] = pd.to_datetime(df_test_suites.starttime)
@@ -70,70 +213,131 @@ def get_results_from_report(robot_report):
     return df_test_suites
 
 
-def get_detailed_results_from_report(robot_report):
+def _build_details_frame(keyword_rows, with_keyword_tree=False):
     '''
-    Extracts from a Robot report the detailed results per test suite, up to the
-    level of keyword, and returns them as a Pandas dataframe:
-
-    get_detailed_results_from_report(robot_report)
+    Builds the dataframe of detailed results per keyword from the rows extracted from a Robot report.
     '''
-    # Finds the root of the XML tree:
-    xtree = et.parse(robot_report)
-    xroot = xtree.getroot()
-    timestamp = xroot.attrib['generated']
-
-    # Dataframe with details of each keyword run in the test
-    all_suites = xroot.find('suite')
-
-    rows = []
-    for suite in all_suites.findall('suite'):
-        # suite
-        suite_id = suite.attrib['id']
-        suite_name = suite.attrib['name']
-
-        ## tests in the suite
-        for test in suite.findall('test'):
-            test_id = test.attrib['id']
-            test_name = test.attrib['name']
-
-            for kw in test.findall('kw'):
-                keyword_name = kw.attrib['name']
-                resultado = kw.find('status').attrib
-
-                line = {'suite_id': suite_id, 'suite_name': suite_name, 'test_id': test_id, 'test_name': test_name, 'keyword_name': keyword_name, **resultado}
-                rows.append(line)
-
-    df_tests_and_keywords = pd.DataFrame(rows)
+    df_tests_and_keywords = pd.DataFrame(keyword_rows)
 
     # Guarantees that the dataframe always has the right shape
-    empty = pd.DataFrame(columns=['suite_id', 'suite_name', 'test_id', 'test_name', 'keyword_name', 'status', 'starttime', 'endtime'])
+    empty = pd.DataFrame(columns=_DETAILS_COLUMNS + (_KEYWORD_TREE_COLUMNS if with_keyword_tree else []))
     df_tests_and_keywords = pd.concat([empty, df_tests_and_keywords], ignore_index=True)
 
     # Fixes the dtype of some columns
     df_tests_and_keywords['status'] = df_tests_and_keywords.status.astype('category')
     df_tests_and_keywords['starttime'] = pd.to_datetime(df_tests_and_keywords.starttime)
     df_tests_and_keywords['endtime'] = pd.to_datetime(df_tests_and_keywords.endtime)
+    if with_keyword_tree:
+        df_tests_and_keywords['depth'] = df_tests_and_keywords.depth.astype('int64')
 
     return df_tests_and_keywords
 
 
-def get_consolidated_results_from_report(robot_report, with_rca=False):
+def get_root_causes_from_details(df_tests_and_keywords):
+    '''
+    Identifies the first failed test and keyword of each test suite from the detailed
+    results of a Robot report (as returned by `get_detailed_results_from_report`). If
+    they include the tree of keywords, the keyword is the deepest one that failed within
+    the first failed top-level keyword:
+
+    def get_root_causes_from_details(df_tests_and_keywords)
+    '''
+    if 'depth' in df_tests_and_keywords.columns:
+        df_root_cause_errors = _get_deepest_failures(df_tests_and_keywords)
+    else:
+        df_root_cause_errors = df_tests_and_keywords.loc[df_tests_and_keywords.status=='FAIL'].groupby('suite_id').first()
+    df_root_cause_errors_simple = df_root_cause_errors.reset_index().loc[:, ['suite_id', 'test_id', 'test_name', 'keyword_name']]
+    df_root_cause_errors_simple = df_root_cause_errors_simple.rename(columns={'test_id': 'failed_test_id', 'test_name': 'failed_test_name', 'keyword_name': 'failed_keyword'})
+
+    return df_root_cause_errors_simple
+
+
+def _get_deepest_failures(df_tests_and_keywords):
+    '''
+    Finds, for each test suite, the deepest keyword of the chain of failures (i.e., failed
+    keywords whose ancestors failed too) that starts at its first failed top-level keyword.
+    '''
+    failed = df_tests_and_keywords.status == 'FAIL'
+
+    # Failures inside keywords that passed (e.g., retries) are not part of a chain
+    level = failed & (df_tests_and_keywords.depth == 1)
+    in_chain = level.copy()
+    for depth in range(2, df_tests_and_keywords.depth.max() + 1 if len(df_tests_and_keywords) else 0):
+        level = failed & (df_tests_and_keywords.depth == depth) & df_tests_and_keywords.parent_id.isin(df_tests_and_keywords.keyword_id.loc[level])
+        in_chain |= level
+
+    # Keywords are identified by the id of their top-level ancestor plus '-k<n>' per level
+    df_chains = df_tests_and_keywords.loc[in_chain].assign(root_id = lambda x: x.keyword_id.str.extract(r'^(.*?-k\d+)', expand=False))
+    first_roots = df_chains.loc[df_chains.depth == 1].groupby('suite_id').root_id.first()
+    df_chains = df_chains.loc[df_chains.root_id.isin(first_roots)]
+
+    # The first of the deepest ones, if there are several branches
+    return df_chains.loc[df_chains.groupby('suite_id').depth.idxmax()].set_index('suite_id')
+
+
+def get_stats_from_report(robot_report):
+    '''
+    Extracts numerical statistics from a Robot report as a Pandas dataframe:
+
+    def get_stats_from_report(robot_report)
+    '''
+    return parse_robot_report(robot_report).stats
+
+
+def get_results_from_report(robot_report):
+    '''
+    Extracts from a Robot report the results per test suite as a Pandas dataframe:
+
+    def get_results_from_report(robot_report)
+    '''
+    return parse_robot_report(robot_report).results
+
+
+def get_detailed_results_from_report(robot_report, keyword_depth=None):
+    '''
+    Extracts from a Robot report the detailed results per test suite, up to the
+    level of keyword, and returns them as a Pandas dataframe:
+
+    get_detailed_results_from_report(robot_report, keyword_depth=None)
+
+    - keyword_depth: if set, nested keywords are included up to this depth (see `parse_robot_report`).
+    '''
+    return parse_robot_report(robot_report, keyword_depth=keyword_depth).details
+
+
+def get_consolidated_results_from_report(robot_report, with_rca=False, keyword_depth=None):
     '''
     Extracts from a Robot report the results and stats per test suite as a Pandas dataframe:
 
-    def get_consolidated_results_from_report(robot_report)
+    def get_consolidated_results_from_report(robot_report, with_rca=False, keyword_depth=None)
+
+    - keyword_depth: if set, the root cause of the failures is the deepest failing keyword, up to this depth (see `parse_robot_report`).
+    '''
+    return consolidate_report_frames(parse_robot_report(robot_report, keyword_depth=keyword_depth), with_rca=with_rca)
+
+
+def consolidate_report_frames(report_frames, with_rca=False):
     '''
-    df_test_suites = get_results_from_report(robot_report)
-    df_test_stats = get_stats_from_report(robot_report)
+    Merges the results and stats per test suite (and, optionally, the root cause of
+    the failures) already extracted with `parse_robot_report` as a Pandas dataframe:
 
-    df_consolidated_test_results = pd.merge(df_test_suites, df_test_stats.loc[:, ['id', 'pass', 'fail']], how='left', on='id')
+    def consolidate_report_frames(report_frames, with_rca=False)
+    '''
+    df_consolidated_test_results = pd.merge(report_frames.results, report_frames.stats.loc[:, ['id', 'pass', 'fail']], how='left', on='id')
 
     if with_rca:
-        df_tests_and_keywords = get_detailed_results_from_report(robot_report)
-        df_root_cause_errors = df_tests_and_keywords.loc[df_tests_and_keywords.status=='FAIL'].groupby('suite_id').first()
-        #df_root_cause_errors_simple = df_root_cause_errors.reset_index().loc[:, ['suite_id', 'test_id', 'test_name', 'keyword_name']].rename(columns={'test_id': 'failed_test_id', 'test_name': 'failed_test_name', 'keyword_name': 'failed_keyword'})
-        df_root_cause_errors_simple = df_root_cause_errors.reset_index().loc[:, ['suite_id', 'test_id', 'test_name', 'keyword_name']]
-        df_root_cause_errors_simple = df_root_cause_errors_simple.rename(columns={'test_id': 'failed_test_id', 'test_name': 'failed_test_name', 'keyword_name': 'failed_keyword'})
-        df_consolidated_test_results = pd.merge(df_consolidated_test_results, df_root_cause_errors_simple, how='left', left_on='id', right_on='suite_id').drop(columns='suite_id')
+        df_consolidated_test_results = pd.merge(df_consolidated_test_results, report_frames.rca, how='left', left_on='id', right_on='suite_id').drop(columns='suite_id')
 
     return df_consolidated_test_results
+
+
+def get_failure_signature(suite, test, keyword):
+    '''
+    Signature of a failure: hash (16 hexadecimal digits) of the test suite, the failed
+    test and the failed keyword, so that the same failure can be tracked across builds
+    and jobs. Missing values (e.g., no failed test) are hashed as empty strings:
+
+    def get_failure_signature(suite, test, keyword)
+    '''
+    fields = ['' if pd.isna(field) else str(field) for field in (suite, test, keyword)]
+    return hashlib.sha1('\x1f'.join(fields).encode('utf-8')).hexdigest()[:16]
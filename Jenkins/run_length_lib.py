@@ -0,0 +1,175 @@
+# Run-length encoding of sequences of statuses (e.g., results of builds or test suites), vectorized with NumPy
+
+import numpy as np
+import pandas as pd
+
+
+def _codes(values, sort=True):
+    # Integer codes of the values (missing values get -1), along with the unique values
+    codes, uniques = pd.factorize(pd.Series(values, dtype='object'), sort=sort)
+    return codes, np.asarray(uniques, dtype='object')
+
+
+def _fill_within_groups(values, group_starts):
+    # Forward-fills the missing values (i.e., -1) within each group of contiguous rows
+    positions = np.arange(len(values))
+    last_valid = np.maximum.accumulate(np.where(values >= 0, positions, -1))
+    group_start = np.maximum.accumulate(np.where(group_starts, positions, 0))
+    return np.where(last_valid >= group_start, values[last_valid], -1)
+
+
+def _encode(jobs, statuses, keys=None, mapping=None):
+    '''
+    Core of the run-length encoding. Rows are sorted (stably) by job and key, and the
+    inconclusive statuses are filled in. Returns the sorting order, the flags of the
+    rows that start a group and a run, the status codes and their values.
+    '''
+    n = len(statuses)
+    job_codes, _ = _codes(jobs)
+    key_codes = _codes(keys)[0] if keys is not None else np.zeros(n, dtype='int64')
+
+    # Statuses not in the mapping (or missing) are inconclusive, and are merged into their neighbour runs
+    if mapping is not None:
+        statuses = pd.Series(statuses, dtype='object').map(mapping)
+    status_codes, status_values = _codes(statuses)
+
+    # Rows of each group (job and key) are kept in their original order
+    order = np.lexsort((np.arange(n), key_codes, job_codes))
+    job_codes, key_codes, status_codes = job_codes[order], key_codes[order], status_codes[order]
+    group_starts = np.ones(n, dtype='bool')
+    group_starts[1:] = (job_codes[1:] != job_codes[:-1]) | (key_codes[1:] != key_codes[:-1])
+
+    # Inconclusive statuses take the former status of the group (or the next one, at the beginning of the group)
+    filled = _fill_within_groups(status_codes, group_starts)
+    group_ends = np.append(group_starts[1:], True)
+    filled = _fill_within_groups(filled[::-1], group_ends[::-1])[::-1]
+
+    run_starts = group_starts.copy()
+    run_starts[1:] |= filled[1:] != filled[:-1]
+
+    return order, group_starts, run_starts, filled, status_values
+
+
+def run_length_encode(jobs, statuses, timestamps=None, keys=None, mapping=None, positions=None, any_of=None):
+    '''
+    Finds the runs (i.e., sequences of consecutive rows with the same status) of each job
+    (and key, if any) in a single vectorized pass. Returns a Pandas dataframe with a row
+    per run, sorted by job, key and start:
+
+    def run_length_encode(jobs, statuses, timestamps=None, keys=None, mapping=None, positions=None, any_of=None)
+
+    - jobs, statuses: arrays with the job and the status of each row (e.g., of each build).
+    Rows of the same job (and key) must be in chronological order, but they may be interleaved with other rows.
+    - timestamps: if set, array with the timestamp of each row.
+    - keys: if set, array with a second level of grouping (e.g., the test suite).
+    - mapping: if set, dictionary that translates statuses into the states of the runs (e.g., 'UNSTABLE'
+    into 'SUCCESS'). Statuses not in the mapping are inconclusive, so they are merged into the former run of
+    the group (or into the next one, if at the beginning of the group).
+    - positions: if set, array with the position of each row (e.g., the build number), used as start and end
+    of the runs. By default, the index of the row in the arrays.
+    - any_of: if set, dictionary of boolean arrays. For each of them, a column (with the same name) tells whether
+    it is set in any row of the run.
+
+    The dataframe has the columns `job`, `key` (only if `keys` is set), `status` (`None` if all the statuses
+    of the group are inconclusive), `start`, `end`, `length`, and, if `timestamps` is set, `start_timestamp`
+    and `end_timestamp`, followed by those of `any_of`.
+    '''
+    n = len(statuses)
+    positions = np.arange(n) if positions is None else np.asarray(positions)
+    order, _, run_starts, filled, status_values = _encode(jobs, statuses, keys=keys, mapping=mapping)
+
+    starts = np.flatnonzero(run_starts)
+    ends = np.append(starts[1:], n)[:len(starts)] - 1
+    first_rows, last_rows = order[starts], order[ends]
+
+    runs = {'job': np.asarray(jobs, dtype='object')[first_rows]}
+    if keys is not None:
+        runs['key'] = np.asarray(keys, dtype='object')[first_rows]
+    run_statuses = filled[starts]
+    runs['status'] = np.where(run_statuses >= 0, status_values[np.maximum(run_statuses, 0)] if len(status_values) else None, None)
+    runs['start'] = positions[first_rows]
+    runs['end'] = positions[last_rows]
+    runs['length'] = ends - starts + 1
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps)
+        runs['start_timestamp'] = timestamps[first_rows]
+        runs['end_timestamp'] = timestamps[last_rows]
+    for name, flags in (any_of or {}).items():
+        flags = np.asarray(flags, dtype='bool')[order]
+        runs[name] = np.logical_or.reduceat(flags, starts) if len(starts) else flags
+
+    return pd.DataFrame(runs)
+
+
+def label_runs(jobs, statuses, keys=None, mapping=None):
+    '''
+    Labels each row with the number of its run within its job (and key, if any), starting
+    at 1, with the same rules as `run_length_encode`:
+
+    def label_runs(jobs, statuses, keys=None, mapping=None)
+
+    There is an exception: if all the statuses of a group are inconclusive, each of its rows
+    is labelled as a run of its own (1, 2, 3...), as the labelling of sequences always did,
+    instead of as a single run.
+    '''
+    order, group_starts, run_starts, filled, _ = _encode(jobs, statuses, keys=keys, mapping=mapping)
+    run_starts = run_starts | (filled < 0)
+
+    run_numbers = np.cumsum(run_starts)
+    first_run_of_group = np.maximum.accumulate(np.where(group_starts, run_numbers, 0))
+    labels = np.empty(len(statuses), dtype='int64')
+    labels[order] = run_numbers - first_run_of_group + 1
+    return labels
+
+
+def extend_runs(runs, jobs, statuses, timestamps=None, keys=None, mapping=None, positions=None):
+    '''
+    Extends the runs found by `run_length_encode` with new rows, appended after the former
+    ones of each job (and key). The result is the same as encoding all the rows again, but
+    only the new rows (plus the last run of each group) are processed:
+
+    def extend_runs(runs, jobs, statuses, timestamps=None, keys=None, mapping=None, positions=None)
+
+    - positions: positions of the new rows. By default, they follow the largest end of the former runs.
+    '''
+    group_columns = ['job', 'key'] if keys is not None else ['job']
+    n = len(statuses)
+    if positions is None:
+        first_position = runs.end.max() + 1 if len(runs) else 0
+        positions = np.arange(first_position, first_position + n)
+    if not n:
+        return runs.copy()
+
+    # The last run of each group with new rows is prepended to them (as a single row), so that it can be extended
+    df_new = pd.DataFrame({'job': np.asarray(jobs, dtype='object')})
+    if keys is not None:
+        df_new['key'] = np.asarray(keys, dtype='object')
+    last_runs = runs.groupby(group_columns, sort=False, dropna=False).tail(1)
+    last_runs = last_runs.loc[pd.MultiIndex.from_frame(last_runs.loc[:, group_columns]).isin(pd.MultiIndex.from_frame(df_new))]
+
+    # The states of the runs must be valid statuses as well
+    if mapping is not None:
+        mapping = {**mapping, **{state: state for state in set(mapping.values())}}
+
+    seed_jobs = np.concatenate([last_runs.job.to_numpy(dtype='object'), df_new.job.to_numpy()])
+    seed_keys = np.concatenate([last_runs.key.to_numpy(dtype='object'), df_new.key.to_numpy()]) if keys is not None else None
+    seed_statuses = np.concatenate([last_runs.status.to_numpy(dtype='object'), np.asarray(statuses, dtype='object')])
+    seed_positions = np.concatenate([last_runs.end.to_numpy(), np.asarray(positions)])
+    seed_timestamps = None
+    if timestamps is not None:
+        seed_timestamps = np.concatenate([last_runs.end_timestamp.to_numpy(), np.asarray(timestamps, dtype=last_runs.end_timestamp.dtype if len(last_runs) else None)])
+
+    new_runs = run_length_encode(seed_jobs, seed_statuses, timestamps=seed_timestamps, keys=seed_keys, mapping=mapping, positions=seed_positions)
+
+    # The first new run of each of those groups is the continuation of its former last run
+    first_new_runs = new_runs.groupby(group_columns, sort=False, dropna=False).head(1)
+    continued = first_new_runs.reset_index().merge(last_runs, on=group_columns, suffixes=('', '_former')).set_index('index')
+    new_runs.loc[continued.index, 'start'] = continued.start_former
+    new_runs.loc[continued.index, 'length'] = continued.length + continued.length_former - 1
+    if timestamps is not None:
+        new_runs.loc[continued.index, 'start_timestamp'] = continued.start_timestamp_former
+
+    return (
+        pd.concat([runs.drop(index=last_runs.index), new_runs], ignore_index=True)
+        .sort_values(group_columns + ['start'], kind='stable', ignore_index=True)
+    )